@@ -0,0 +1,99 @@
+"""
+Webhookイベントの受け付け制御（過負荷時の間引き）
+
+バックエンドが遅くなるとイベント処理がワーカーのスレッドを占有し、
+/health まで応答できなくなる。同時に処理するイベント数に上限を設け、
+上限を超えたイベントはデータベースに触れずに「混み合っています」とだけ返信する。
+
+上限は処理時間に合わせて調整する（AIMD）
+- 処理時間が ADMISSION_LATENCY_TARGET を超えた・バックエンド障害 → 上限を下げる（×0.8）
+- 目標内で上限いっぱいまで使われている → 上限を少しずつ上げる（+1/上限）
+上限の最大値はワーカーの同時処理数（スレッド数・gevent の接続数）- 1 とし、/health 用に常に1つ空けておく
+"""
+import time
+import threading
+
+import metrics
+from config import Config
+
+metrics.describe('admission_admitted_total', "処理を受け付けたイベント数")
+metrics.describe('admission_shed_total', "混雑のため処理せずに返信したイベント数")
+metrics.describe('admission_limit', "同時に処理するイベント数の現在の上限")
+metrics.describe('admission_inflight', "処理中のイベント数")
+
+# 上限を下げるときの倍率
+_DECREASE_FACTOR = 0.8
+
+
+class AdaptiveLimiter:
+    """処理時間に応じて同時処理数の上限を調整するリミッター"""
+
+    def __init__(self, max_limit: int = None, min_limit: int = 1, latency_target: float = None):
+        """
+        初期化
+
+        Args:
+            max_limit: 同時処理数の上限の最大値
+            min_limit: 同時処理数の上限の最小値
+            latency_target: 1イベントの処理時間の目標（秒）
+        """
+        self.max_limit = max(min_limit, max_limit or Config.ADMISSION_MAX_INFLIGHT)
+        self.min_limit = min_limit
+        self.latency_target = latency_target or Config.ADMISSION_LATENCY_TARGET
+        self._limit = float(self.max_limit)
+        self._inflight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        """現在の上限"""
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        """処理中のイベント数"""
+        return self._inflight
+
+    def try_acquire(self) -> bool:
+        """
+        イベントの処理を受け付けるか判定（受け付けた場合は release を必ず呼ぶ）
+
+        Returns:
+            受け付けた場合True
+        """
+        with self._lock:
+            if self._inflight >= int(self._limit):
+                metrics.inc('admission_shed_total')
+                return False
+            self._inflight += 1
+            self._publish()
+        metrics.inc('admission_admitted_total')
+        return True
+
+    def release(self, latency: float, overloaded: bool = False):
+        """
+        イベントの処理完了を記録して上限を調整
+
+        Args:
+            latency: 処理時間（秒）
+            overloaded: バックエンド障害などで処理できなかった場合True
+        """
+        with self._lock:
+            was_saturated = self._inflight >= int(self._limit)
+            self._inflight -= 1
+
+            now = time.monotonic()
+            if overloaded or latency > self.latency_target:
+                # 同じ遅延の波で何度も下げないよう、目標時間に1回までにする
+                if now - self._last_decrease >= self.latency_target:
+                    self._limit = max(self.min_limit, self._limit * _DECREASE_FACTOR)
+                    self._last_decrease = now
+            elif was_saturated:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('admission_limit', int(self._limit))
+        metrics.set_gauge('admission_inflight', self._inflight)
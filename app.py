@@ -3,18 +3,25 @@
 LINE Messaging API Webhook サーバー
 
 v2: Supabase対応版
-- DATA_SOURCE環境変数で切り替え可能
+- DATA_SOURCE環境変数で切り替え可能（repository.create_repository）
 - 'supabase': Supabase使用（デフォルト）
 - 'sheets': Google Sheets使用（v1互換）
+- 'memory': プロセス内のデータ + WAL（小規模な自前運用・ベンチマーク用）
 """
+import os
+import hmac
+import time
+import uuid
 import logging
-from flask import Flask, request, abort
+import threading
+from flask import Flask, Response, request, abort, jsonify, stream_with_context
 from linebot.v3 import WebhookHandler
 from linebot.v3.messaging import (
     Configuration,
     ApiClient,
     MessagingApi,
     ReplyMessageRequest,
+    PushMessageRequest,
     TextMessage
 )
 from linebot.v3.webhooks import (
@@ -23,76 +30,261 @@ from linebot.v3.webhooks import (
 )
 from linebot.v3.exceptions import InvalidSignatureError
 
+import metrics
+import deadline
+import logging_setup
 from config import Config
+from admission import AdaptiveLimiter
+from deadline import Deadline
+from resilience import BackendUnavailableError
+from notification_service import get_line_policy
+from profiler import profiler
+from repository import create_repository
+import records_export
+from share_view import ShareViewCache
+# 世代カウンターの共有メモリを gunicorn のマスターで（fork 前に）確保する
+import response_cache  # noqa: F401
 
 # ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+logging_setup.setup_logging()
 logger = logging.getLogger(__name__)
 
 # Flaskアプリケーション
 app = Flask(__name__)
 
 # LINE Bot設定
-configuration = Configuration(access_token=Config.LINE_CHANNEL_ACCESS_TOKEN)
+# LINE_API_ENDPOINT を指定すると、ローカルの代替サーバー（line_api_stub.py）に送信できる
+configuration = Configuration(
+    host=Config.LINE_API_ENDPOINT,
+    access_token=Config.LINE_CHANNEL_ACCESS_TOKEN
+)
 handler = WebhookHandler(Config.LINE_CHANNEL_SECRET)
+line_policy = get_line_policy()
+
+metrics.describe('late_replies_total', "返信トークンの期限切れでプッシュに切り替えた返信数")
+
+# 同時に処理するイベント数の上限（ワーカープロセスごと）
+admission = AdaptiveLimiter()
+
+BUSY_REPLY = "ただいま混み合っています。少し待ってからもう一度送ってください。"
+ERROR_REPLY = "エラーが発生しました。しばらくしてからもう一度お試しください。"
+
+# 処理中のWebhookで受け取ったテキストメッセージ（callback の最後に送信者ごとにまとめて処理する）
+_received = threading.local()
 
 # サービス初期化
 data_service = None
 message_handler = None
-use_supabase = Config.DATA_SOURCE == 'supabase'
+# 共有URLの表示データ（共有コードごと）
+share_views = ShareViewCache()
+notification_service = None
 
 
 def initialize_services():
     """サービスを初期化"""
-    global data_service, message_handler, use_supabase
+    global data_service, message_handler, notification_service
 
     try:
-        if use_supabase:
-            # Supabase版
-            from supabase_service import SupabaseService
-            from message_handler_v2 import MessageHandlerV2
-
-            data_service = SupabaseService()
-            message_handler = MessageHandlerV2(data_service)
-            logger.info("Supabaseサービスの初期化が完了しました")
-        else:
-            # Google Sheets版（v1互換）
-            from sheets_service import SheetsService
-            from message_handler import MessageHandler
-
-            data_service = SheetsService()
-            message_handler = MessageHandler(data_service)
-            logger.info("Google Sheetsサービスの初期化が完了しました")
+        from message_handler_v2 import MessageHandlerV2
+        from notification_service import NotificationService, MulticastSender
+
+        data_service = create_repository()
+        notification_service = NotificationService(
+            MulticastSender(configuration),
+            data_service.get_line_user_ids
+        )
+        message_handler = MessageHandlerV2(data_service, notification_service)
+        logger.info("サービスの初期化が完了しました: %s", Config.DATA_SOURCE)
 
     except Exception as e:
-        logger.error(f"サービス初期化エラー: {e}")
+        logger.error("サービス初期化エラー: %s", e)
         raise
 
 
+def reset_connections():
+    """
+    バックエンド接続を作り直す
+
+    gunicorn の preload_app で fork する場合、マスターで作成した
+    HTTP接続プールを子プロセス間で共有しないようにワーカー起動直後に呼ぶ
+    """
+    if data_service is None:
+        return
+
+    try:
+        data_service._connect()
+        logger.info("バックエンド接続を再作成しました: pid=%s", os.getpid())
+    except Exception as e:
+        logger.error("バックエンド接続の再作成エラー: %s", e)
+
+
+def shutdown_background_tasks():
+    """送信待ちの通知を送り切ってからバックグラウンド処理を止める（ワーカー終了時）"""
+    if notification_service is not None:
+        notification_service.shutdown()
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """ヘルスチェックエンドポイント"""
     return 'OK', 200
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """メトリクス（Prometheus テキスト形式）"""
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+def _require_token(token: str):
+    """Bearer トークンを確認（トークン未設定のエンドポイントは存在しない扱い）"""
+    if not token:
+        abort(404)
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        abort(401)
+
+
+@app.route('/debug/profile', methods=['GET', 'POST', 'DELETE'])
+def profile_endpoint():
+    """
+    プロファイラーの操作（PROFILER_TOKEN による Bearer 認証）
+
+    - GET: 集計結果を folded 形式で返す（?format=json で集計状況）
+    - POST: ?rate=0.1&interval_ms=5 で設定を変更（rate=0 で無効）
+    - DELETE: 集計結果を消去
+
+    集計はワーカープロセスごと（X-Profile-Pid ヘッダーで応答したプロセスがわかる）
+    """
+    _require_token(Config.PROFILER_TOKEN)
+
+    headers = {'X-Profile-Pid': str(os.getpid())}
+    if not profiler.supported:
+        # スレッド単位の採取ではハブのスタックしか取れず、意味のない結果になる
+        return jsonify({
+            'error': "gevent ワーカー（GUNICORN_WORKER_MODE=async）ではプロファイラーを使用できません。"
+                     "threaded / sync で起動してください",
+        }), 501, headers
+    if request.method == 'POST':
+        rate = request.args.get('rate', type=float)
+        interval_ms = request.args.get('interval_ms', type=float)
+        profiler.configure(rate, interval_ms / 1000 if interval_ms else None)
+        return jsonify(profiler.stats()), 200, headers
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify(profiler.stats()), 200, headers
+    if request.args.get('format') == 'json':
+        return jsonify(profiler.stats()), 200, headers
+    headers['Content-Type'] = 'text/plain; charset=utf-8'
+    return profiler.folded(), 200, headers
+
+
+@app.route('/export/records', methods=['GET'])
+def export_records():
+    """
+    家庭の記録の全件エクスポート（EXPORT_TOKEN による Bearer 認証）
+
+    ?family_id=<ID>&format=csv|jsonl で、1ページ読むごとに書き出すストリーミング応答を返す
+    """
+    _require_token(Config.EXPORT_TOKEN)
+
+    family_id = request.args.get('family_id', '')
+    fmt = request.args.get('format', 'csv')
+    try:
+        uuid.UUID(family_id)
+    except ValueError:
+        abort(400)
+    if fmt not in records_export.FORMATS:
+        abort(400)
+    if message_handler is None:
+        try:
+            initialize_services()
+        except Exception:
+            abort(503)
+
+    serialize, content_type, extension = records_export.FORMATS[fmt]
+    records = records_export.iter_family_records(data_service, family_id)
+
+    # 最初のページを応答開始前に読み、取得エラーはステータスコードで返す
+    try:
+        first = next(records, None)
+    except (records_export.ExportError, BackendUnavailableError) as e:
+        logger.warning("記録エクスポート失敗: %s", e)
+        abort(503)
+
+    def generate():
+        def rows():
+            if first is not None:
+                yield first
+            yield from records
+
+        try:
+            yield from serialize(rows())
+        except Exception as e:
+            # 応答開始後はステータスを変えられないため、接続を切って途中で終わったことを伝える
+            logger.error("記録エクスポート中断: family=%s %s", family_id, e)
+            raise
+
+    return Response(stream_with_context(generate()), content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename="records-{family_id}.{extension}"',
+        'Cache-Control': 'no-store',
+    })
+
+
+@app.route('/view/<share_code>', methods=['GET'])
+def share_view_endpoint(share_code: str):
+    """
+    共有URL（/view/[shareCode]）の表示データ（子どものポイント・目標・最近の記録）
+
+    ETag を返し、If-None-Match が一致すれば 304 で本文を省く
+    """
+    if message_handler is None:
+        try:
+            initialize_services()
+        except Exception:
+            abort(503)
+
+    try:
+        view = share_views.get(data_service, share_code)
+    except (LookupError, BackendUnavailableError) as e:
+        logger.warning("共有ビュー取得失敗: %s", e)
+        abort(503)
+    if view is None:
+        abort(404)
+
+    headers = {
+        # 毎回再検証させる（記録が反映されるまでブラウザに古い表示を残さない）
+        'Cache-Control': 'no-cache',
+        'Access-Control-Allow-Origin': Config.SHARE_VIEW_ALLOWED_ORIGIN,
+        'Access-Control-Expose-Headers': 'ETag',
+    }
+    if request.if_none_match.contains(view.etag):
+        metrics.inc('share_view_not_modified_total')
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(view.body, content_type='application/json; charset=utf-8', headers=headers)
+    response.set_etag(view.etag)
+    return response
+
+
 @app.route('/callback', methods=['POST'])
 def callback():
     """LINE Webhook コールバック"""
     signature = request.headers.get('X-Line-Signature', '')
     body = request.get_data(as_text=True)
 
-    logger.info(f"Webhook受信: {body[:100]}...")
+    logger.info("Webhook受信: %s bytes", len(body), extra={'event': 'webhook_received'})
+    logger.debug("Webhook本文: %.100s", body)
 
+    _received.text_events = []
     try:
         handler.handle(body, signature)
+        _handle_received_text_events(_received.text_events)
     except InvalidSignatureError:
         logger.error("署名検証エラー")
         abort(400)
     except Exception as e:
-        logger.error(f"Webhook処理エラー: {e}")
+        logger.error("Webhook処理エラー: %s", e)
         abort(500)
 
     return 'OK'
@@ -100,62 +292,170 @@ def callback():
 
 @handler.add(MessageEvent, message=TextMessageContent)
 def handle_text_message(event):
-    """テキストメッセージを処理"""
+    """テキストメッセージを受け取る（処理は Webhook のイベントをすべて受け取った後）"""
+    _received.text_events.append(event)
+
+
+def _handle_received_text_events(events: list):
+    """
+    Webhook で受け取ったテキストメッセージを送信者ごとにまとめて処理
+
+    同じ送信者のメッセージは受信順に1回の handle_messages で処理し、続けて送られた行動記録を
+    1回で書き込む（イベントごとに処理すると1件ずつ書き込むことになるため）
+    """
+    by_user = {}
+    for event in events:
+        by_user.setdefault(event.source.user_id, []).append(event)
+    for user_events in by_user.values():
+        handle_text_events(user_events)
+
+
+def handle_text_events(events: list):
+    """同じ送信者のテキストメッセージを処理（期限は最も古いイベントに合わせる）"""
+    oldest = min(event.timestamp for event in events)
+    token = deadline.start(Deadline.from_event_timestamp(oldest))
+    try:
+        # 上限を超えたイベントはデータベースに触れずに返信だけする
+        if not admission.try_acquire():
+            logger.warning("混雑のためイベントを間引き: 処理中 %s / 上限 %s", admission.inflight, admission.limit)
+            # 混雑時に LINE API へのリトライで処理を増やさないよう、1回だけ送る
+            for event in events:
+                _send_reply(event.reply_token, BUSY_REPLY, event.source.user_id, retry=False)
+            return
+
+        started = time.monotonic()
+        overloaded = False
+        try:
+            with profiler.profile_request():
+                overloaded = not _handle_text_events(events)
+        finally:
+            admission.release(time.monotonic() - started, overloaded)
+    finally:
+        deadline.reset(token)
+
+
+def _handle_text_events(events: list) -> bool:
+    """
+    同じ送信者のテキストメッセージを処理
+
+    Returns:
+        バックエンドが応答できた場合True（受け付け制御の上限調整に使う）
+    """
     global message_handler
 
-    user_message = event.message.text
-    user_id = event.source.user_id  # LINEユーザーID
-    logger.info(f"メッセージ受信: {user_message} from {user_id}")
+    user_id = events[0].source.user_id  # LINEユーザーID
+    for event in events:
+        logger.info("メッセージ受信: %s from %s", event.message.text, user_id,
+                    extra={'event': 'message_received', 'user_id': user_id})
+
+    def reply_all(text: str):
+        for event in events:
+            _send_reply(event.reply_token, text, user_id)
 
     # サービスが初期化されていない場合
     if message_handler is None:
         try:
             initialize_services()
         except Exception as e:
-            logger.error(f"サービス初期化失敗: {e}")
-            reply_text = "システムエラーが発生しました。しばらくしてからもう一度お試しください。"
-            _send_reply(event.reply_token, reply_text)
-            return
+            logger.error("サービス初期化失敗: %s", e)
+            reply_all("システムエラーが発生しました。しばらくしてからもう一度お試しください。")
+            return False
+
+    # バックエンドが遮断中なら問い合わせずにすぐ返信する
+    if data_service.policy.breaker.is_open:
+        logger.warning("%s 遮断中のため即時エラー応答", Config.DATA_SOURCE)
+        reply_all(ERROR_REPLY)
+        # バックエンドには問い合わせていないので上限の調整には使わない
+        return True
 
     # メッセージを処理
     try:
-        if use_supabase:
-            # Supabase版はLINEユーザーIDを渡す
-            reply_text = message_handler.handle_message(user_message, user_id)
-        else:
-            # Google Sheets版（v1互換）
-            reply_text = message_handler.handle_message(user_message)
+        replies = message_handler.handle_messages([event.message.text for event in events], user_id)
+    except BackendUnavailableError as e:
+        logger.warning("バックエンド利用不可: %s", e)
+        reply_all(ERROR_REPLY)
+        return False
     except Exception as e:
-        logger.error(f"メッセージ処理エラー: {e}")
+        logger.error("メッセージ処理エラー: %s", e)
         import traceback
         logger.error(traceback.format_exc())
-        reply_text = "エラーが発生しました。しばらくしてからもう一度お試しください。"
+        reply_all(ERROR_REPLY)
+        return True
+
+    for event, reply_text in zip(events, replies):
+        _send_reply(event.reply_token, reply_text, user_id)
+    return True
+
 
-    _send_reply(event.reply_token, reply_text)
+def _send_reply(reply_token: str, text: str, user_id: str = None, retry: bool = True):
+    """
+    返信メッセージを送信
 
+    返信トークンの期限を過ぎている場合は、LINEユーザーIDあてのプッシュで送る
+
+    Args:
+        reply_token: 返信トークン
+        text: 返信文
+        user_id: LINEユーザーID（プッシュ送信用）
+        retry: False なら失敗してもリトライしない（混雑時の返信用）
+    """
+    event_deadline = deadline.current()
+    if event_deadline is not None and event_deadline.expired and user_id:
+        metrics.inc('late_replies_total')
+        logger.warning("返信トークン期限切れのためプッシュ送信: 超過 %.1f秒", -event_deadline.remaining())
+        _send_push(user_id, text, retry)
+        return
 
-def _send_reply(reply_token: str, text: str):
-    """返信メッセージを送信"""
     try:
         with ApiClient(configuration) as api_client:
             messaging_api = MessagingApi(api_client)
-            messaging_api.reply_message(
+            # 返信トークンは1回しか使えないため、再送しても二重に届くことはない
+            line_policy.call(
+                messaging_api.reply_message,
                 ReplyMessageRequest(
                     reply_token=reply_token,
                     messages=[TextMessage(text=text)]
-                )
+                ),
+                idempotent=retry,
+                _request_timeout=Config.BACKEND_TIMEOUT
+            )
+        logger.info("返信送信: %.50s", text, extra={'event': 'reply_sent'})
+    except Exception as e:
+        logger.error("返信送信エラー: %s", e)
+
+
+def _send_push(user_id: str, text: str, retry: bool = True):
+    """プッシュメッセージを送信（retry=False なら失敗してもリトライしない）"""
+    try:
+        with ApiClient(configuration) as api_client:
+            messaging_api = MessagingApi(api_client)
+            # リトライキーを付けるとLINE側で重複送信が防がれるため再送しても安全
+            line_policy.call(
+                messaging_api.push_message,
+                PushMessageRequest(
+                    to=user_id,
+                    messages=[TextMessage(text=text)]
+                ),
+                x_line_retry_key=str(uuid.uuid4()),
+                idempotent=retry,
+                _request_timeout=Config.BACKEND_TIMEOUT
             )
-        logger.info(f"返信送信: {text[:50]}...")
+        logger.info("プッシュ送信: %.50s", text, extra={'event': 'push_sent'})
     except Exception as e:
-        logger.error(f"返信送信エラー: {e}")
+        logger.error("プッシュ送信エラー: %s", e)
 
 
 # アプリケーション起動時にサービスを初期化
 try:
     initialize_services()
 except Exception as e:
-    logger.warning(f"起動時のサービス初期化スキップ: {e}")
+    logger.warning("起動時のサービス初期化スキップ: %s", e)
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # ローカル開発用（本番は gunicorn -c gunicorn.conf.py app:app）
+    app.run(
+        host='0.0.0.0',
+        port=int(os.environ.get('PORT', '5000')),
+        debug=os.environ.get('FLASK_DEBUG', '1') == '1'
+    )
@@ -0,0 +1,116 @@
+"""
+「みんなのポイント」の取得方法によるレイテンシ比較ベンチマーク
+
+家庭の子ども全員の今日のポイントを
+- 子どもごとに問い合わせる場合（get_children + 子どもの数だけ get_today_summary）
+- 集計関数で1回で取得する場合（get_family_points）
+で比較する。SupabaseService の実際のコード（リトライ・ブレーカー・モデル変換込み）を、
+1往復ごとに --rtt ミリ秒待つ偽のクライアントで動かす（データベースは使わない）
+
+使い方:
+    python benchmarks/bench_family_points.py --children 1 2 4 8 16 --rtt 20
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from supabase_service import SupabaseService, _is_backend_failure  # noqa: E402
+from resilience import get_policy  # noqa: E402
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    """PostgREST のリクエストビルダーの代わり（execute で1往復分待つ）"""
+
+    def __init__(self, client, data):
+        self.client = client
+        self.data = data
+
+    def __getattr__(self, name):
+        # eq / order / single 等の絞り込みは何もしない
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client.round_trips += 1
+        time.sleep(self.client.rtt)
+        return _Result(self.data)
+
+
+class FakeClient:
+    """子どもN人の家庭1つ分のデータを返すクライアント"""
+
+    def __init__(self, children: int, rtt: float):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.children = [{
+            'id': str(uuid.uuid4()), 'name': f'こども{i}', 'nickname': None,
+            'total_points': 100 + i, 'cycle_points': 10 * i,
+        } for i in range(children)]
+        self.records = [{'points': 5, 'actions': {'name': '宿題'}} for _ in range(3)]
+
+    def table(self, name):
+        return _Query(self, self.children if name == 'children' else self.records)
+
+    def rpc(self, name, params):
+        rows = [{
+            'child_id': child['id'], 'name': child['name'], 'nickname': None,
+            'today_points': 15, 'cycle_points': child['cycle_points'], 'total_points': child['total_points'],
+        } for child in self.children]
+        return _Query(self, rows)
+
+
+def per_child(supabase: SupabaseService, family_id: str):
+    """既存のメソッドの組み合わせ（N+1 回の往復）"""
+    return [
+        (child, supabase.get_today_summary(child.id, 'Asia/Tokyo'))
+        for child in supabase.get_children(family_id)
+    ]
+
+
+def aggregated(supabase: SupabaseService, family_id: str):
+    """集計関数（1回の往復）"""
+    return supabase.get_family_points(family_id, 'Asia/Tokyo')
+
+
+def measure(func, children: int, rtt: float, repeat: int) -> tuple:
+    """(p50 ミリ秒, 1回あたりの往復回数)"""
+    supabase = SupabaseService.__new__(SupabaseService)
+    supabase.client = FakeClient(children, rtt)
+    supabase.policy = get_policy('bench', _is_backend_failure)
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(supabase, 'family')
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, supabase.client.round_trips / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="「みんなのポイント」の取得方法の比較")
+    parser.add_argument('--children', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--rtt', type=float, default=20, help="1往復の待ち時間（ミリ秒）")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rtt = args.rtt / 1000
+    print(f"rtt={args.rtt}ms repeat={args.repeat}")
+    print(f"{'children':>8} {'per-child (ms)':>15} {'trips':>6} {'aggregated (ms)':>16} {'trips':>6}")
+    for children in args.children:
+        per_child_ms, per_child_trips = measure(per_child, children, rtt, args.repeat)
+        aggregated_ms, aggregated_trips = measure(aggregated, children, rtt, args.repeat)
+        print(f"{children:>8} {per_child_ms:>15.1f} {per_child_trips:>6.0f} "
+              f"{aggregated_ms:>16.1f} {aggregated_trips:>6.0f}")
+
+
+if __name__ == '__main__':
+    main()
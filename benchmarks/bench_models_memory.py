@@ -0,0 +1,120 @@
+"""
+家庭データをキャッシュした場合のメモリ使用量ベンチマーク
+
+N 家庭分の 家庭・子ども・行動マスタ・目標 を
+- select('*') の dict のまま保持した場合
+- models.py のモデル（使う列のみ）で保持した場合
+で tracemalloc により比較する。行の内容は web/src/types/database.ts の列構成に合わせて生成する
+
+使い方:
+    python benchmarks/bench_models_memory.py --families 1000 5000
+"""
+import os
+import sys
+import uuid
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Family, Child, Action, Goal  # noqa: E402
+
+ACTION_NAMES = ['宿題', 'お手伝い', '歯みがき', '片付け', '早起き', '読書', 'ピアノ', '習い事']
+
+
+def _timestamp() -> str:
+    return '2026-10-18T09:00:00.000000+00:00'
+
+
+def build_rows(families: int, children: int, actions: int, goals: int) -> list:
+    """PostgREST が select('*') で返すのと同じ形の dict を作成"""
+    data = []
+    for _ in range(families):
+        family_id = str(uuid.uuid4())
+        family = {
+            'id': family_id, 'share_code': uuid.uuid4().hex[:12], 'timezone': 'Asia/Tokyo',
+            'created_at': _timestamp(), 'updated_at': _timestamp(),
+        }
+        child_rows = [{
+            'id': str(uuid.uuid4()), 'family_id': family_id, 'name': f'こども{i}', 'nickname': None,
+            'total_points': 120, 'cycle_points': 20, 'level': 1,
+            'created_at': _timestamp(), 'updated_at': _timestamp(),
+        } for i in range(children)]
+        action_rows = [{
+            'id': str(uuid.uuid4()), 'family_id': family_id, 'name': ACTION_NAMES[i % len(ACTION_NAMES)],
+            'points': 10, 'display_order': i, 'is_active': True,
+            'created_at': _timestamp(), 'updated_at': _timestamp(),
+        } for i in range(actions)]
+        goal_rows = [{
+            'id': str(uuid.uuid4()), 'family_id': family_id, 'title': f'目標{i}', 'description': None,
+            'target_points': 300, 'display_order': i, 'is_achieved': False,
+            'created_at': _timestamp(), 'updated_at': _timestamp(),
+        } for i in range(goals)]
+        data.append((family, child_rows, action_rows, goal_rows))
+    return data
+
+
+def _copy_row(row: dict) -> dict:
+    """JSON から読み込んだ直後と同じく、文字列も別オブジェクトにする"""
+    return {key: (''.join(value) if isinstance(value, str) else value) for key, value in row.items()}
+
+
+def measure(build) -> int:
+    """build() が作るキャッシュの確保バイト数"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cache = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cache
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="家庭データのキャッシュのメモリ使用量")
+    parser.add_argument('--families', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--children', type=int, default=2)
+    parser.add_argument('--actions', type=int, default=8)
+    parser.add_argument('--goals', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"1家庭あたり: 子ども{args.children} 行動{args.actions} 目標{args.goals}")
+    print(f"{'families':>8} {'dict (MB)':>10} {'model (MB)':>11} {'削減率':>7}")
+
+    for families in args.families:
+        rows = build_rows(families, args.children, args.actions, args.goals)
+
+        def build_dicts():
+            return {
+                family['id']: (
+                    _copy_row(family),
+                    [_copy_row(r) for r in child_rows],
+                    [_copy_row(r) for r in action_rows],
+                    [_copy_row(r) for r in goal_rows],
+                )
+                for family, child_rows, action_rows, goal_rows in rows
+            }
+
+        def build_models():
+            # select を列に絞った場合と同じく、モデルの列だけを取り出してから変換する
+            def pruned(row, model):
+                return _copy_row({key: row[key] for key in model.COLUMNS.split(', ')})
+
+            return {
+                family['id']: (
+                    Family.from_row(pruned(family, Family)),
+                    [Child.from_row(pruned(r, Child)) for r in child_rows],
+                    [Action.from_row(pruned(r, Action)) for r in action_rows],
+                    [Goal.from_row(pruned(r, Goal)) for r in goal_rows],
+                )
+                for family, child_rows, action_rows, goal_rows in rows
+            }
+
+        dict_bytes = measure(build_dicts)
+        model_bytes = measure(build_models)
+        print(f"{families:>8} {dict_bytes / 1e6:>10.1f} {model_bytes / 1e6:>11.1f} "
+              f"{1 - model_bytes / dict_bytes:>7.0%}")
+
+
+if __name__ == '__main__':
+    main()
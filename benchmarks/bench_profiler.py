@@ -0,0 +1,79 @@
+"""
+プロファイラーのオーバーヘッド計測ベンチマーク
+
+app.handle_text_events と同じ形（profiler.profile_request() で囲む）で処理を呼び出し、
+- 囲まない場合
+- 無効（sample_rate=0）
+- 有効（sample_rate を指定）
+の1件あたりの所要時間を比較する。処理の中身は --work-us マイクロ秒の待ち＋計算で代用する
+
+使い方:
+    python benchmarks/bench_profiler.py --iterations 20000 --work-us 200 --rate 0.1
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiler import SamplingProfiler  # noqa: E402
+
+
+def fake_handler(work_us: float):
+    """Webhook処理の代わり（I/O待ちと少しの計算）"""
+    if work_us:
+        time.sleep(work_us / 1_000_000)
+    return sum(range(200))
+
+
+def run(label: str, call, iterations: int, repeats: int) -> float:
+    """call を iterations 回呼ぶ計測を repeats 回行い、1件あたりの中央値（マイクロ秒）を返す"""
+    per_call = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        per_call.append((time.perf_counter() - start) / iterations * 1_000_000)
+    median = statistics.median(per_call)
+    print(f"{label:<24} {median:10.2f} us/件")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロファイラーのオーバーヘッド計測")
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--work-us', type=float, default=0, help="1件あたりの処理時間の代用（マイクロ秒）")
+    parser.add_argument('--rate', type=float, default=0.1, help="有効時のサンプリング割合")
+    parser.add_argument('--interval-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    disabled = SamplingProfiler(0.0)
+    enabled = SamplingProfiler(args.rate, args.interval_ms / 1000)
+
+    def bare():
+        fake_handler(args.work_us)
+
+    def with_disabled():
+        with disabled.profile_request():
+            fake_handler(args.work_us)
+
+    def with_enabled():
+        with enabled.profile_request():
+            fake_handler(args.work_us)
+
+    print(f"iterations={args.iterations} repeats={args.repeats} work={args.work_us}us")
+    base = run('囲まない', bare, args.iterations, args.repeats)
+    off = run('無効 (rate=0)', with_disabled, args.iterations, args.repeats)
+    on = run(f'有効 (rate={args.rate})', with_enabled, args.iterations, args.repeats)
+    enabled.configure(sample_rate=0)
+
+    print(f"\n無効時の増分: {off - base:+.2f} us/件")
+    print(f"有効時の増分: {on - base:+.2f} us/件")
+    print(f"採取したスタック: {enabled.stats()['samples']}件 / 対象リクエスト {enabled.stats()['requests']}件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Webhook サーバーの並行処理モデル比較ベンチマーク
+
+gunicorn.conf.py の各モード（sync / threaded / async）でサーバーを起動し、
+署名付きWebhookリクエストを並列に送信してスループットとレイテンシを計測する
+
+使い方:
+    python benchmarks/bench_webhook.py --modes sync threaded --requests 500 --concurrency 16
+
+--url を指定した場合はサーバーを起動せず、既存のサーバー（ステージング等）に送信する
+--url なしの --event message は、DATA_SOURCE=memory（初期データ入り）と line_api_stub.py で
+ネットワークを使わずにメッセージ処理全体を計測する（memory はワーカー1つで起動される）
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import base64
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_SECRET = 'bench-channel-secret'
+BENCH_USER_ID = 'Ubench000000000000000000000000000'
+
+
+def write_memory_seed(data_dir: str) -> None:
+    """DATA_SOURCE=memory の初期データ（ベンチマーク用のユーザーが紐付いた家庭）を作成"""
+    family_id = '11111111-1111-1111-1111-111111111111'
+    snapshot = {
+        'seq': 0,
+        'families': [{'id': family_id, 'share_code': 'bench', 'timezone': 'Asia/Tokyo'}],
+        'line_users': [{'line_user_id': BENCH_USER_ID, 'family_id': family_id, 'default_child_id': None}],
+        'children': [{'id': '22222222-2222-2222-2222-222222222222', 'family_id': family_id, 'name': 'たろう',
+                      'nickname': None, 'total_points': 0, 'cycle_points': 0}],
+        'actions': [{'id': f'33333333-3333-3333-3333-33333333333{i}', 'family_id': family_id, 'name': name,
+                     'points': points, 'is_active': True}
+                    for i, (name, points) in enumerate([('宿題', 1), ('早寝', 2), ('お手伝い', 2)])],
+        'goals': [],
+        'records': [],
+    }
+    with open(os.path.join(data_dir, 'snapshot.json'), 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+
+
+def build_body(event_type: str, text: str = '今日のポイント') -> str:
+    """ベンチマーク用のWebhookボディを作成"""
+    event = {
+        'type': event_type,
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': BENCH_USER_ID},
+        'webhookEventId': '01BENCH',
+        'deliveryContext': {'isRedelivery': False},
+        'replyToken': '0' * 32,
+    }
+    if event_type == 'message':
+        event['message'] = {'type': 'text', 'id': '1', 'quoteToken': 'q', 'text': text}
+    return json.dumps({'destination': 'Ubench', 'events': [event]})
+
+
+def sign(body: str, secret: str) -> str:
+    """X-Line-Signature を計算"""
+    digest = hmac.new(secret.encode(), body.encode(), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode()
+
+
+def send(url: str, body: str, signature: str) -> float:
+    """1リクエスト送信して所要時間（秒）を返す"""
+    req = urllib.request.Request(
+        url,
+        data=body.encode(),
+        headers={'Content-Type': 'application/json', 'X-Line-Signature': signature},
+        method='POST'
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=30) as res:
+        res.read()
+    return time.perf_counter() - start
+
+
+def run_load(url: str, body: str, signature: str, total: int, concurrency: int) -> dict:
+    """負荷をかけて集計結果を返す"""
+    errors = 0
+    latencies = []
+
+    def task(_):
+        try:
+            return send(url, body, signature)
+        except Exception:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency in pool.map(task, range(total)):
+            if latency is None:
+                errors += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p99_index = max(0, int(len(latencies) * 0.99) - 1)
+    return {
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[p99_index] * 1000 if latencies else 0,
+        'errors': errors,
+    }
+
+
+def wait_ready(base_url: str, timeout: float = 30) -> None:
+    """/health が応答するまで待つ"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=1):
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("サーバーが起動しませんでした")
+
+
+def start_server(mode: str, port: int, workers: int, threads: int, extra_env: dict = None) -> subprocess.Popen:
+    """指定モードで gunicorn を起動"""
+    env = dict(os.environ)
+    env.update(extra_env or {})
+    env.update({
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(workers),
+        'GUNICORN_THREADS': str(threads),
+        'GUNICORN_WORKER_MODE': mode,
+        'GUNICORN_LOG_LEVEL': 'warning',
+        'LINE_CHANNEL_SECRET': env.get('LINE_CHANNEL_SECRET', BENCH_SECRET),
+        'LINE_CHANNEL_ACCESS_TOKEN': env.get('LINE_CHANNEL_ACCESS_TOKEN', 'bench-token'),
+    })
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook サーバーの並行処理モデル比較")
+    parser.add_argument('--modes', nargs='+', default=['sync', 'threaded', 'async'])
+    parser.add_argument('--url', help="既存サーバーの /callback URL（指定時はサーバーを起動しない）")
+    parser.add_argument('--event', default='follow', choices=['follow', 'message'],
+                        help="follow: ハンドラー未登録イベント（サーバー自体のオーバーヘッド）/ message: テキストメッセージ")
+    parser.add_argument('--text', default='今日のポイント', help="--event message で送るテキスト")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    secret = os.environ.get('LINE_CHANNEL_SECRET', BENCH_SECRET)
+    body = build_body(args.event, args.text)
+    signature = sign(body, secret)
+
+    targets = [('external', args.url)] if args.url else [(mode, None) for mode in args.modes]
+
+    # メッセージ処理はネットワークを使わない memory と LINE API の代替サーバーで動かす
+    extra_env = {}
+    stub = None
+    workers = args.workers
+    if args.event == 'message' and not args.url:
+        data_dir = tempfile.mkdtemp(prefix='bench-memory-')
+        write_memory_seed(data_dir)
+        stub_port = args.port + 1
+        stub = subprocess.Popen(
+            [sys.executable, 'line_api_stub.py', '--port', str(stub_port)],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        extra_env = {
+            'DATA_SOURCE': 'memory',
+            'MEMORY_DATA_DIR': data_dir,
+            'LINE_API_ENDPOINT': f'http://127.0.0.1:{stub_port}',
+        }
+        workers = 1
+
+    print("| mode | workers | threads | req/s | p50 (ms) | p99 (ms) | errors |")
+    print("|------|---------|---------|-------|----------|----------|--------|")
+    try:
+        for mode, url in targets:
+            server = None
+            if url is None:
+                server = start_server(mode, args.port, workers, args.threads, extra_env)
+                base_url = f'http://127.0.0.1:{args.port}'
+                url = f'{base_url}/callback'
+            try:
+                if server:
+                    wait_ready(base_url)
+                result = run_load(url, body, signature, args.requests, args.concurrency)
+            finally:
+                if server:
+                    server.terminate()
+                    server.wait()
+
+            threads = 1 if mode == 'sync' else args.threads
+            print(
+                f"| {mode} | {workers} | {threads} | {result['rps']:.0f} | "
+                f"{result['p50_ms']:.1f} | {result['p99_ms']:.1f} | {result['errors']} |"
+            )
+
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+if __name__ == '__main__':
+    main()
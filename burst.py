@@ -0,0 +1,128 @@
+"""
+LINEユーザーごとの行動記録の書き込みのまとめ処理（グループコミット）
+
+子どもは「宿題」「早寝」「お手伝い」のように数秒の間に続けて送ることが多い。
+同じユーザーの書き込みが実行中のときに届いた記録は、その完了を待つ間に集めておき、
+完了したら集まった分をまとめて1回で書き込む。実行中の書き込みがなければすぐに書き込むため、
+まとめるために待つ時間はない（待つのは前の書き込みの完了だけ）
+
+- 1つのWebhookで届いた同じユーザーの記録は、MessageHandlerV2.handle_messages が
+  1回の submit にまとめる（こちらはワーカーの同時処理数によらない）
+- まとめない処理（今日のポイント・取り消し等）は drain で書き込みの完了を待ってから行う
+  （直前に送った記録が反映された状態で返信するため）
+- ワーカーの同時処理数が1（sync）では後続の要求が来ないため無効。BURST_COALESCE=false でも無効
+"""
+import logging
+import threading
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('burst_batches_total', "まとめて書き込んだ回数")
+metrics.describe('burst_coalesced_total', "まとめ処理に含まれたメッセージ数")
+
+
+class _Batch:
+    """まとめ処理1回分"""
+
+    __slots__ = ('items', 'previous', 'results', 'error', 'done')
+
+    def __init__(self, previous: '_Batch' = None):
+        self.items = []
+        # 完了を待つ前のまとめ処理（実行中の書き込み）
+        self.previous = previous
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BurstCoalescer:
+    """キー（LINEユーザーID）ごとに、実行中の書き込みの間に届いた要求をまとめて処理する"""
+
+    def __init__(self, flush, enabled: bool = None):
+        """
+        初期化
+
+        Args:
+            flush: flush(key, items) -> items と同じ順・同じ数の結果のリスト
+            enabled: まとめ処理を行うか（省略時は BURST_COALESCE かつワーカーの同時処理数が2以上）
+        """
+        self.flush = flush
+        if enabled is None:
+            enabled = Config.BURST_COALESCE and Config.WORKER_CONCURRENCY > 1
+        self.enabled = enabled
+        # 集めている途中のまとめ処理 {key: _Batch}
+        self._open = {}
+        # 書き込みが終わっていないまとめ処理（集めている途中のものを含む） {key: [_Batch, ...]}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, items: list) -> list:
+        """
+        要求をまとめ処理に加えて結果を待つ
+
+        Args:
+            key: まとめる単位（LINEユーザーID）
+            items: flush に渡す要求（受信順）
+
+        Returns:
+            items に対応する flush の結果（flush が例外を送出した場合は同じ例外を送出）
+        """
+        if not self.enabled:
+            return self.flush(key, items)
+
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                pending = self._pending.setdefault(key, [])
+                batch = _Batch(pending[-1] if pending else None)
+                self._open[key] = batch
+                pending.append(batch)
+            start = len(batch.items)
+            batch.items.extend(items)
+
+        if leader:
+            self._lead(key, batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[start:start + len(items)]
+
+    def drain(self, key: str):
+        """key のまとめ処理があれば書き込みが終わるまで待つ"""
+        with self._lock:
+            batches = list(self._pending.get(key, ()))
+        for batch in batches:
+            batch.done.wait()
+
+    def _lead(self, key: str, batch: _Batch):
+        """実行中の書き込みの完了を待ち、それまでに集まった要求をまとめて処理する"""
+        try:
+            if batch.previous is not None:
+                batch.previous.done.wait()
+            # これ以降に届いたメッセージは次のまとめ処理になる
+            with self._lock:
+                del self._open[key]
+            metrics.inc('burst_batches_total')
+            metrics.inc('burst_coalesced_total', value=len(batch.items))
+            if len(batch.items) > 1:
+                logger.info("連続メッセージをまとめて処理: %s件", len(batch.items))
+            batch.results = self.flush(key, batch.items)
+        except Exception as e:
+            batch.error = e
+        finally:
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+                pending = self._pending[key]
+                pending.remove(batch)
+                if not pending:
+                    del self._pending[key]
+            # 完了したまとめ処理を次のまとめ処理から参照し続けない
+            batch.previous = None
+            batch.done.set()
@@ -0,0 +1,152 @@
+"""
+家庭ごとの子どもの名前索引（ワーカー内キャッシュ）
+
+「たろう：宿題」「たろう 宿題」のように名前を付けたメッセージを、
+子どもの name / nickname から引けるようにする。索引はプロセス内に保持し、
+CHILD_INDEX_TTL 秒ごと、または知らない名前が来たときに読み直す。
+ポイントは索引から読まない（古い値になりうるため、必要なときに get_child で取得する）
+"""
+import re
+import time
+import logging
+import threading
+import unicodedata
+from typing import Optional
+
+import metrics
+from config import Config
+from models import Child
+
+logger = logging.getLogger(__name__)
+
+# 名前の後ろに付くことがある敬称（「たろうくん：宿題」も「たろう」として引く）
+HONORIFICS = ('ちゃん', 'くん', '君', 'さん')
+
+# 「名前：本文」「名前:本文」
+_COLON_PATTERN = re.compile(r'^\s*([^:：\s][^:：]*?)\s*[:：]\s*(.+)$', re.S)
+# 「名前 本文」「名前　本文」
+_SPACE_PATTERN = re.compile(r'^\s*(\S+)[ 　]+(.+)$', re.S)
+
+metrics.describe('child_index_loads_total', "子どもの名前索引を読み込んだ回数")
+
+# 知らない名前で読み直す間隔の下限（秒）
+_MIN_REFRESH_INTERVAL = 10
+
+
+def normalize_name(name: str) -> str:
+    """表記ゆれ（全角/半角・大文字/小文字・敬称）をそろえる"""
+    key = unicodedata.normalize('NFKC', name or '').strip().casefold()
+    for suffix in HONORIFICS:
+        if key.endswith(suffix) and len(key) > len(suffix):
+            return key[:-len(suffix)]
+    return key
+
+
+def parse_addressed(text: str) -> tuple:
+    """
+    名前付きのメッセージを分解
+
+    Args:
+        text: メッセージテキスト
+
+    Returns:
+        (名前, 本文, コロン区切りならTrue) or (None, text, False)
+    """
+    match = _COLON_PATTERN.match(text)
+    if match:
+        return match.group(1), match.group(2).strip(), True
+    match = _SPACE_PATTERN.match(text)
+    if match:
+        return match.group(1), match.group(2).strip(), False
+    return None, text, False
+
+
+class FamilyChildren:
+    """家庭1つ分の子どもと名前索引"""
+
+    __slots__ = ('children', '_by_id', '_by_name', 'loaded_at')
+
+    def __init__(self, children: list):
+        self.children = tuple(children)
+        self._by_id = {child.id: child for child in self.children}
+        self._by_name = {}
+        ambiguous = set()
+        for child in self.children:
+            for name in {normalize_name(child.name), normalize_name(child.nickname)} - {''}:
+                if name in self._by_name and self._by_name[name].id != child.id:
+                    ambiguous.add(name)
+                self._by_name[name] = child
+        # 同じ名前の子どもが複数いる場合は名前では選ばない
+        for name in ambiguous:
+            del self._by_name[name]
+        self.loaded_at = time.monotonic()
+
+    @property
+    def first(self) -> Child:
+        """最初に登録された子ども"""
+        return self.children[0]
+
+    def get(self, child_id: Optional[str]) -> Optional[Child]:
+        """IDから子どもを取得"""
+        return self._by_id.get(child_id) if child_id else None
+
+    def resolve(self, name: str) -> Optional[Child]:
+        """名前（name / nickname）から子どもを取得"""
+        return self._by_name.get(normalize_name(name))
+
+
+class ChildIndex:
+    """家庭IDごとの FamilyChildren のキャッシュ"""
+
+    def __init__(self, loader, ttl: float = None, max_families: int = None):
+        """
+        初期化
+
+        Args:
+            loader: 家庭IDから子どもリスト（[Child, ...]）を返す関数
+            ttl: 読み直すまでの秒数
+            max_families: 保持する家庭数の上限（超えたら古いものから捨てる）
+        """
+        self.loader = loader
+        self.ttl = ttl or Config.CHILD_INDEX_TTL
+        self.max_families = max_families or Config.CHILD_INDEX_MAX_FAMILIES
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, family_id: str, refresh: bool = False) -> Optional[FamilyChildren]:
+        """
+        家庭の子どもを取得（キャッシュが有効なら問い合わせない）
+
+        Args:
+            family_id: 家庭ID
+            refresh: 知らない名前が来た場合など、読み直したいときTrue
+                     （直前に読み込んでいれば読み直さない）
+
+        Returns:
+            FamilyChildren（子どもがいない・取得エラーの場合は None）
+        """
+        with self._lock:
+            entry = self._entries.get(family_id)
+        if entry is not None:
+            age = time.monotonic() - entry.loaded_at
+            if age < self.ttl and (not refresh or age < _MIN_REFRESH_INTERVAL):
+                return entry
+
+        children = self.loader(family_id)
+        metrics.inc('child_index_loads_total')
+        if not children:
+            # 取得エラーと区別できないためキャッシュしない
+            return None
+
+        entry = FamilyChildren(children)
+        with self._lock:
+            self._entries.pop(family_id, None)
+            self._entries[family_id] = entry
+            while len(self._entries) > self.max_families:
+                self._entries.pop(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, family_id: str):
+        """家庭の索引を捨てる（次回読み直す）"""
+        with self._lock:
+            self._entries.pop(family_id, None)
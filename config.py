@@ -10,22 +10,77 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _worker_concurrency() -> int:
+    """gunicorn.conf.py の設定でワーカー1つが同時に処理できるリクエスト数"""
+    mode = os.environ.get('GUNICORN_WORKER_MODE', 'threaded')
+    if mode == 'sync':
+        return 1
+    if mode == 'async':
+        import importlib.util
+        # gevent が無ければ gunicorn.conf.py と同じく threaded として数える
+        if importlib.util.find_spec('gevent') is not None:
+            return int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))
+    return int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
 class Config:
     """アプリケーション設定クラス"""
 
     # LINE Bot設定
     LINE_CHANNEL_ACCESS_TOKEN = os.environ.get('LINE_CHANNEL_ACCESS_TOKEN')
     LINE_CHANNEL_SECRET = os.environ.get('LINE_CHANNEL_SECRET')
+    # LINE Messaging API の送信先（ローカル検証時は line_api_stub.py のURLを指定）
+    LINE_API_ENDPOINT = os.environ.get('LINE_API_ENDPOINT', 'https://api.line.me')
+
+    # 家庭全体への通知（マルチキャスト）
+    LINE_MULTICAST_RATE = float(os.environ.get('LINE_MULTICAST_RATE', '50'))  # 1秒あたりの呼び出し数
+    NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', '1000'))
 
     # Supabase設定（v2で追加）
     SUPABASE_URL = os.environ.get('SUPABASE_URL') or os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
     SUPABASE_SERVICE_ROLE_KEY = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
 
-    # データソース切り替え（'supabase' or 'sheets'）
+    # データソース切り替え（'supabase' / 'sheets' / 'memory'）
     DATA_SOURCE = os.environ.get('DATA_SOURCE', 'supabase')
 
+    # memory のデータディレクトリ（snapshot.json と wal.jsonl を置く）
+    MEMORY_DATA_DIR = os.environ.get('MEMORY_DATA_DIR', 'data/memory')
+    # スナップショットを書き出す間隔（WAL の行数・秒）
+    MEMORY_SNAPSHOT_WAL_ENTRIES = int(os.environ.get('MEMORY_SNAPSHOT_WAL_ENTRIES', '10000'))
+    MEMORY_SNAPSHOT_INTERVAL = float(os.environ.get('MEMORY_SNAPSHOT_INTERVAL', '300'))
+    # WAL の追記ごとに fsync する（'true' / 'false'）
+    MEMORY_FSYNC = os.environ.get('MEMORY_FSYNC', 'false').lower() == 'true'
+    # 起動したワーカーがデータディレクトリのロックを待つ秒数（HUP で入れ替わる前のワーカーの終了を待つ。
+    # GUNICORN_GRACEFUL_TIMEOUT 以上、GUNICORN_TIMEOUT 未満にする）
+    MEMORY_LOCK_WAIT = float(os.environ.get('MEMORY_LOCK_WAIT', '27'))
+
     # Google Sheets設定（v1互換用）
     SPREADSHEET_ID = os.environ.get('SPREADSHEET_ID')
+    # Sheets API の1分あたりの呼び出し上限（サービスアカウント全体の割り当てに合わせる。
+    # 各ワーカーはこれを WEB_CONCURRENCY で割った回数までしか呼ばない）
+    SHEETS_READ_PER_MINUTE = float(os.environ.get('SHEETS_READ_PER_MINUTE', '60'))
+    SHEETS_WRITE_PER_MINUTE = float(os.environ.get('SHEETS_WRITE_PER_MINUTE', '60'))
+    # gunicorn のワーカー数（gunicorn.conf.py と同じ環境変数・デフォルト）
+    WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', '2')))
+
+    # バックエンド呼び出しのタイムアウト（秒）
+    BACKEND_TIMEOUT = float(os.environ.get('BACKEND_TIMEOUT', '5'))
+    # リトライを含めた1回の呼び出し全体の期限（秒）
+    BACKEND_TOTAL_TIMEOUT = float(os.environ.get('BACKEND_TOTAL_TIMEOUT', '10'))
+    BACKEND_MAX_ATTEMPTS = int(os.environ.get('BACKEND_MAX_ATTEMPTS', '3'))
+    BACKEND_RETRY_BASE_DELAY = float(os.environ.get('BACKEND_RETRY_BASE_DELAY', '0.2'))
+    BACKEND_RETRY_MAX_DELAY = float(os.environ.get('BACKEND_RETRY_MAX_DELAY', '2'))
+    # リトライ予算（成功1回あたりに貯まるリトライ数、上限）
+    RETRY_BUDGET_RATIO = float(os.environ.get('RETRY_BUDGET_RATIO', '0.1'))
+    RETRY_BUDGET_MAX_TOKENS = float(os.environ.get('RETRY_BUDGET_MAX_TOKENS', '10'))
+    # サーキットブレーカー（連続失敗回数、遮断してから再試行するまでの秒数）
+    BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+    BREAKER_RECOVERY_TIMEOUT = float(os.environ.get('BREAKER_RECOVERY_TIMEOUT', '30'))
+
+    # 返信トークンを使える秒数（イベント発生時刻から。期限を過ぎたらプッシュで送る）
+    REPLY_TOKEN_TTL = float(os.environ.get('REPLY_TOKEN_TTL', '50'))
+    # 期限までの残りがこの秒数を切ったら省略可能な処理（目標表示など）をスキップ
+    OPTIONAL_STEP_MARGIN = float(os.environ.get('OPTIONAL_STEP_MARGIN', '10'))
 
     # Google サービスアカウント認証情報
     @staticmethod
@@ -36,6 +91,53 @@ class Config:
             return json.loads(json_str)
         return None
 
+    # ログ出力（'json' or 'text'）
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # 件数の多いINFOイベントの出力割合（例: 'webhook_received=0.1,reply_sent=0.1'）
+    LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+
+    # プロファイラー（PROFILE_SAMPLE_RATE=0 で無効。/debug/profile から実行中に変更可能）
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '5'))
+    # /debug/profile の認証トークン（未設定ならエンドポイント自体を無効にする）
+    PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN', '')
+    # /export/records の認証トークン（未設定ならエンドポイント自体を無効にする）
+    EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+
+    # 子どもの名前索引のキャッシュ（秒・家庭数）
+    CHILD_INDEX_TTL = float(os.environ.get('CHILD_INDEX_TTL', '300'))
+    CHILD_INDEX_MAX_FAMILIES = int(os.environ.get('CHILD_INDEX_MAX_FAMILIES', '10000'))
+
+    # gunicorn のワーカー1つが同時に処理できるリクエスト数（gunicorn.conf.py の設定から求める）
+    WORKER_CONCURRENCY = _worker_concurrency()
+
+    # 受け付け制御: 同時に処理するイベント数の上限と処理時間の目標（秒）
+    # 上限のデフォルトはワーカーの同時処理数 - 1（/health 等のために1つ空けておく。sync では1）
+    ADMISSION_MAX_INFLIGHT = int(os.environ.get(
+        'ADMISSION_MAX_INFLIGHT', str(max(1, WORKER_CONCURRENCY - 1))
+    ))
+    ADMISSION_LATENCY_TARGET = float(os.environ.get('ADMISSION_LATENCY_TARGET', '2'))
+
+    # 今日のポイント・ごほうび用のキャッシュ（世代カウンター数・エントリ数上限）
+    RESPONSE_CACHE_SLOTS = int(os.environ.get('RESPONSE_CACHE_SLOTS', '65536'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '20000'))
+    # 目標はWebアプリで編集され Bot から無効にできないため、この秒数で読み直す
+    GOALS_CACHE_TTL = float(os.environ.get('GOALS_CACHE_TTL', '300'))
+
+    # 共有ビュー（/view/<共有コード>）のキャッシュ秒数（Webアプリでの編集はこの秒数で反映される）
+    SHARE_VIEW_CACHE_TTL = float(os.environ.get('SHARE_VIEW_CACHE_TTL', '60'))
+    # 共有ビューを読み込めるオリジン（Webアプリのドメイン。CORS）
+    SHARE_VIEW_ALLOWED_ORIGIN = os.environ.get('SHARE_VIEW_ALLOWED_ORIGIN', '*')
+
+    # 同じユーザーの書き込み中に届いた行動記録を、完了後にまとめて書き込む（'true' / 'false'。
+    # ワーカーの同時処理数が1のときは常に無効）
+    BURST_COALESCE = os.environ.get('BURST_COALESCE', 'true').lower() == 'true'
+
+    # 家庭のタイムゾーン（families.timezone が未設定の場合に使用）
+    DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'Asia/Tokyo')
+
     # ごほうび設定
     REWARD_THRESHOLD = 100  # ごほうび達成に必要なポイント
 
@@ -56,6 +158,3 @@ ACTION_MASTER = {
     '早寝': ('早寝', 2),
     'お手伝い': ('お手伝い', 2),
 }
-
-# キーワードリスト（ヘルプメッセージ用）
-AVAILABLE_KEYWORDS = list(ACTION_MASTER.keys())
@@ -0,0 +1,70 @@
+"""
+イベントごとの処理期限を担当するモジュール
+LINEの返信トークンの有効期限からイベントの期限を求め、処理中のスレッドに伝搬する
+"""
+import time
+import contextvars
+
+from config import Config
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class Deadline:
+    """イベント1件分の処理期限"""
+
+    def __init__(self, expires_at: float):
+        """
+        初期化
+
+        Args:
+            expires_at: 期限（UNIX時刻・秒）
+        """
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_event_timestamp(cls, timestamp_ms: int) -> 'Deadline':
+        """
+        Webhookイベントのタイムスタンプから期限を作成
+
+        Args:
+            timestamp_ms: イベント発生時刻（UNIX時刻・ミリ秒）
+
+        Returns:
+            Deadline
+        """
+        return cls(timestamp_ms / 1000 + Config.REPLY_TOKEN_TTL)
+
+    def remaining(self) -> float:
+        """残り秒数（期限切れなら負の値）"""
+        return self.expires_at - time.time()
+
+    @property
+    def expired(self) -> bool:
+        """返信トークンの有効期限を過ぎていればTrue"""
+        return self.remaining() <= 0
+
+    def allows_optional(self) -> bool:
+        """省略可能な処理を実行する余裕があればTrue"""
+        return self.remaining() > Config.OPTIONAL_STEP_MARGIN
+
+
+def current() -> Deadline:
+    """処理中のイベントの期限を取得（イベント外ならNone）"""
+    return _current.get()
+
+
+def start(deadline: Deadline):
+    """処理中のイベントの期限を設定し、解除用のトークンを返す"""
+    return _current.set(deadline)
+
+
+def reset(token):
+    """start で設定した期限を解除"""
+    _current.reset(token)
+
+
+def allows_optional() -> bool:
+    """期限が設定されていない、または余裕があればTrue"""
+    deadline = current()
+    return deadline is None or deadline.allows_optional()
@@ -0,0 +1,86 @@
+"""
+本番用 gunicorn 設定
+`gunicorn -c gunicorn.conf.py app:app` で起動する
+
+環境変数で並行処理モデルを切り替え可能
+- WEB_CONCURRENCY: ワーカープロセス数（デフォルト: 2）
+- GUNICORN_THREADS: ワーカーあたりのスレッド数（デフォルト: 4）
+- GUNICORN_WORKER_MODE: 'sync' / 'threaded' / 'async'（デフォルト: 'threaded'）
+- GUNICORN_TIMEOUT: ワーカーのハングとみなすまでの秒数（デフォルト: 30）
+- GUNICORN_GRACEFUL_TIMEOUT: 停止時に処理中のWebhookを待つ秒数（デフォルト: 25）
+"""
+import os
+import importlib.util
+
+# 待ち受けアドレス（Render は PORT を渡す）
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# memory はデータをプロセス内に持つため、ワーカーが複数だと互いの書き込みが見えない
+if os.environ.get('DATA_SOURCE') == 'memory':
+    workers = 1
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# 並行処理モデル
+# - sync: 1ワーカー1リクエスト（threads は無視される）
+# - threaded: gthread ワーカー（I/O待ちの多いWebhook向け、デフォルト）
+# - async: gevent ワーカー（gevent が未インストールなら threaded にフォールバック）
+_worker_mode = os.environ.get('GUNICORN_WORKER_MODE', 'threaded')
+if _worker_mode == 'sync':
+    # threads > 1 だと gunicorn が gthread に切り替えるため1に固定
+    worker_class = 'sync'
+    threads = 1
+elif _worker_mode == 'async' and importlib.util.find_spec('gevent') is not None:
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '100'))
+    # preload_app ではアプリ（ssl・socket・threading を使うライブラリ）がマスターで読み込まれるため、
+    # ワーカーでのパッチでは遅い。アプリより先に読まれるこの設定ファイルでパッチを当てる
+    from gevent import monkey
+    monkey.patch_all()
+else:
+    worker_class = 'gthread'
+
+# fork 前にアプリを読み込み、initialize_services をマスターで1回だけ実行する
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+# SIGTERM 受信後、処理中のWebhookが返信を終えるまで待つ
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '25'))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """マスター起動時"""
+    if _worker_mode == 'async' and worker_class != 'gevent':
+        server.log.warning("gevent が見つからないため threaded モードで起動します")
+    server.log.info(
+        f"起動設定: worker_class={worker_class}, workers={workers}, threads={threads}"
+    )
+
+
+def post_fork(server, worker):
+    """fork 後にワーカーごとの接続を作り直す（マスターのソケットを共有しない）"""
+    import app as app_module
+    import logging_setup
+    # マスターのログ書き出しスレッドは引き継がれないため、ワーカーで起動し直す
+    logging_setup.setup_logging()
+    app_module.reset_connections()
+
+
+def worker_int(worker):
+    """SIGINT/SIGQUIT 受信時"""
+    worker.log.info(f"ワーカー停止要求: pid={worker.pid}")
+
+
+def worker_exit(server, worker):
+    """ワーカー終了時（処理中のWebhookのドレイン完了後）"""
+    import app as app_module
+    import logging_setup
+    app_module.shutdown_background_tasks()
+    # キューに残ったログを書き出してから終了する
+    logging_setup.shutdown_logging()
+    server.log.info(f"ワーカー終了: pid={worker.pid}")
@@ -0,0 +1,91 @@
+"""
+LINE Messaging API のローカル代替サーバー（検証用）
+
+返信・プッシュ・マルチキャストを受け付けて記録するだけのサーバー。
+LINE_API_ENDPOINT=http://127.0.0.1:5100 を指定して Bot や通知処理を動かすと、
+実際のLINEに送らずに送信内容・回数・レート制限時の挙動を確認できる
+
+使い方:
+    python line_api_stub.py --port 5100 --rate-limit 10 --latency-ms 50
+    curl http://127.0.0.1:5100/stub/messages
+"""
+import time
+import argparse
+import threading
+from flask import Flask, request, jsonify
+
+from rate_limit import TokenBucket
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_received = []
+_bucket = None
+_latency = 0.0
+
+
+def _record(kind: str):
+    """受信内容を記録して応答（レート制限超過時は429）"""
+    if _latency:
+        time.sleep(_latency)
+    if _bucket is not None and not _bucket.try_acquire():
+        return jsonify({'message': 'The API rate limit has been exceeded. Try again later.'}), 429
+
+    body = request.get_json(silent=True) or {}
+    with _lock:
+        _received.append({
+            'kind': kind,
+            'to': body.get('to'),
+            'reply_token': body.get('replyToken'),
+            'retry_key': request.headers.get('X-Line-Retry-Key'),
+            'messages': body.get('messages', []),
+            'received_at': time.time()
+        })
+    if kind == 'push':
+        return jsonify({'sentMessages': [{'id': str(len(_received)), 'quoteToken': 'stub'}]})
+    return jsonify({})
+
+
+@app.route('/v2/bot/message/reply', methods=['POST'])
+def reply():
+    return _record('reply')
+
+
+@app.route('/v2/bot/message/push', methods=['POST'])
+def push():
+    return _record('push')
+
+
+@app.route('/v2/bot/message/multicast', methods=['POST'])
+def multicast():
+    return _record('multicast')
+
+
+@app.route('/stub/messages', methods=['GET', 'DELETE'])
+def messages():
+    """受信した内容を確認（DELETEで消去）"""
+    with _lock:
+        if request.method == 'DELETE':
+            _received.clear()
+            return jsonify({})
+        return jsonify(list(_received))
+
+
+def main():
+    global _bucket, _latency
+
+    parser = argparse.ArgumentParser(description="LINE Messaging API のローカル代替サーバー")
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--rate-limit', type=float, help="1秒あたりの受付数（超過時は429）")
+    parser.add_argument('--latency-ms', type=float, default=0, help="応答までの遅延（ミリ秒）")
+    args = parser.parse_args()
+
+    if args.rate_limit:
+        _bucket = TokenBucket(args.rate_limit)
+    _latency = args.latency_ms / 1000
+
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
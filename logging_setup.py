@@ -0,0 +1,161 @@
+"""
+ログ出力の設定を担当するモジュール
+
+ログはキュー経由でバックグラウンドスレッドが書き出すため、Webhook処理のスレッドは
+文字列の整形や標準出力への書き込みで待たされない。出力は1行1件のJSON。
+件数の多いINFOイベントは LOG_SAMPLE_RATES で間引ける
+"""
+import os
+import json
+import queue
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+
+import metrics
+from config import Config
+
+metrics.describe('logs_dropped_total', "ログキューが満杯で破棄したログ数")
+
+# LogRecord の標準属性（extra で渡された項目と区別するため）
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_listener_pid = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1件のJSON形式で出力するフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        # extra={'event': ..., 'user_id': ...} で渡された項目を追加
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    INFO以下のイベントを間引くフィルター
+
+    extra={'event': 'webhook_received'} のように event 名が付いたログを、
+    LOG_SAMPLE_RATES（例: 'webhook_received=0.1,reply_sent=0.1'）の割合だけ通す。
+    WARNING 以上は常に通す
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, 'event', None))
+        return rate is None or random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    呼び出し元のスレッドで整形せずにキューへ積むハンドラー
+
+    同一プロセス内のキューなので LogRecord をそのまま渡し、メッセージの組み立て
+    （%形式の遅延評価）は書き出しスレッドで行う。キューが満杯なら待たずに破棄する
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc('logs_dropped_total')
+
+
+class _DrainingQueueListener(logging.handlers.QueueListener):
+    """停止時、キューが満杯でも空きを待って終了の合図を積むリスナー"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def parse_sample_rates(value: str) -> dict:
+    """
+    'event=rate,...' 形式の設定を辞書に変換
+
+    Args:
+        value: 設定文字列
+
+    Returns:
+        {event名: 割合}
+    """
+    rates = {}
+    for item in (value or '').split(','):
+        event, _, rate = item.strip().partition('=')
+        if event and rate:
+            rates[event] = float(rate)
+    return rates
+
+
+def _build_stream_handler() -> logging.Handler:
+    stream_handler = logging.StreamHandler()
+    if Config.LOG_FORMAT == 'json':
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    return stream_handler
+
+
+def setup_logging():
+    """
+    ルートロガーをキュー経由の出力に設定（何度呼んでもよい）
+
+    gunicorn の preload_app で fork した場合、書き出しスレッドは子プロセスに
+    引き継がれないため、ワーカー起動後にもう一度呼ぶ
+    """
+    global _listener, _listener_pid, _queue_handler
+
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+
+        # fork 前のキューはロック状態ごと複製されているため、プロセスごとに作り直す
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+
+        if _queue_handler is None:
+            root = logging.getLogger()
+            root.setLevel(Config.LOG_LEVEL)
+            _queue_handler = NonBlockingQueueHandler(log_queue)
+            _queue_handler.addFilter(SamplingFilter(parse_sample_rates(Config.LOG_SAMPLE_RATES)))
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(_queue_handler)
+        else:
+            _queue_handler.queue = log_queue
+
+        _listener = _DrainingQueueListener(log_queue, _build_stream_handler(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def shutdown_logging():
+    """キューに残っているログを書き出してから書き出しスレッドを止める"""
+    global _listener
+
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+        _listener = None
@@ -0,0 +1,583 @@
+"""
+プロセス内のデータで動くリポジトリ（DATA_SOURCE=memory）
+
+家庭1つ〜数十程度の自前運用と、ネットワークを使わないベンチマーク用。
+データはすべてメモリ上の索引（dict）に持ち、1回の操作はマイクロ秒で終わる
+
+永続化
+- 書き込みはメモリに反映する前に WAL（MEMORY_DATA_DIR/wal.jsonl）に1行追記する
+- WAL が MEMORY_SNAPSHOT_WAL_ENTRIES 行を超えるか、前回から MEMORY_SNAPSHOT_INTERVAL 秒たったら
+  全体をスナップショット（snapshot.json）に書き出して WAL を空にする
+- 起動時はスナップショットを読み、それより新しい WAL の操作を順に再適用する
+  （操作には連番と結果の値を記録するため、再適用しても同じ状態になる）
+- MEMORY_FSYNC=true で追記ごとに fsync する（電源断にも耐えるが1件あたり数ミリ秒かかる）
+
+初期データは snapshot.json に置く（形式は _snapshot() を参照。families / line_users /
+children / actions / goals / records の各テーブルを行の dict のリストで持つ）
+
+書き込めるのは1プロセスだけ（データディレクトリをロックする）。gunicorn では
+DATA_SOURCE=memory のときワーカーを1つにする（gunicorn.conf.py）。
+preload_app ではマスターが読み込んだデータを fork 後のワーカーが引き継ぐが、
+再起動したワーカーにとっては古い（前のワーカーの書き込みがない）ため、
+ワーカーは _connect でロックを取ってからスナップショットと WAL を読み直す
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import bisect
+import logging
+import threading
+from collections import Counter
+from dataclasses import replace
+from datetime import datetime, timezone as dt_timezone
+
+from config import Config
+from models import Family, LineUserLink, Child, ChildPoints, Action, Goal
+from resilience import get_policy
+from timezone_util import local_today
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = 'snapshot.json'
+WAL_FILE = 'wal.jsonl'
+LOCK_FILE = 'lock'
+
+
+class MemoryRepository:
+    """メモリ上の索引 + WAL のリポジトリ"""
+
+    def __init__(self, data_dir: str = None):
+        """
+        初期化（スナップショットと WAL を読み込む）
+
+        Args:
+            data_dir: データディレクトリ（省略時は MEMORY_DATA_DIR）
+        """
+        self.data_dir = data_dir or Config.MEMORY_DATA_DIR
+        # 障害にはならないが、app.py が遮断状態を見るため他の実装とそろえる
+        self.policy = get_policy('memory')
+        self._lock = threading.RLock()
+        self._wal = None
+        self._lock_file = None
+        self._seq = 0
+        self._wal_entries = 0
+        self._last_snapshot = time.monotonic()
+        self._reset()
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._load()
+
+    def _reset(self):
+        """索引を空にする"""
+        self._families = {}          # family_id -> Family
+        self._share_codes = {}       # share_code -> family_id
+        self._line_users = {}        # line_user_id -> (family_id, default_child_id)
+        self._children = {}          # child_id -> Child
+        self._child_family = {}      # child_id -> family_id
+        self._family_children = {}   # family_id -> [child_id, ...]（登録順）
+        self._actions = {}           # action_id -> (family_id, Action, is_active)
+        self._family_actions = {}    # family_id -> [action_id, ...]
+        self._goals = {}             # family_id -> {goal_id: (Goal, is_achieved)}（登録順）
+        self._records = {}           # record_id -> 行の dict
+        self._child_records = {}     # child_id -> [(recorded_at, record_id), ...]（時刻順）
+        self._child_day = {}         # (child_id, local_date) -> [record_id, ...]
+        self._family_records = {}    # family_id -> [(recorded_at, record_id), ...]（時刻順）
+
+    def _connect(self):
+        """
+        ロックを取ってデータを読み直す（fork 後のワーカーで呼ばれる）
+
+        HUP での入れ替えでは前のワーカーが終わるまでロックが空かないため、
+        MEMORY_LOCK_WAIT 秒まで待つ
+
+        Raises:
+            RuntimeError: ロックを取れなかった（データは読み直すが書き込みはできない）
+        """
+        with self._lock:
+            self._wal = None
+            self._lock_file = None
+            try:
+                self._open_writer(wait=Config.MEMORY_LOCK_WAIT)
+            finally:
+                # マスターが読み込んだ後の書き込み（前のワーカーの分）を反映する
+                self._reset()
+                self._wal_entries = 0
+                self._last_snapshot = time.monotonic()
+                self._load()
+
+    # --- 永続化 ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def _load(self):
+        """スナップショットを読み込み、その後の WAL を再適用する"""
+        try:
+            with open(self._path(SNAPSHOT_FILE), encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {}
+        self._restore(snapshot)
+        self._seq = snapshot.get('seq', 0)
+
+        replayed = 0
+        try:
+            with open(self._path(WAL_FILE), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で止まった最後の行は捨てる
+                        logger.warning("WAL の壊れた行を無視: %.100s", line)
+                        continue
+                    self._wal_entries += 1
+                    if op['seq'] <= self._seq:
+                        continue
+                    self._apply(op)
+                    self._seq = op['seq']
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        logger.info("メモリデータを読み込みました: 家庭 %s / 子ども %s / 記録 %s（WAL %s件を再適用）",
+                    len(self._families), len(self._children), len(self._records), replayed)
+
+    def _open_writer(self, wait: float = 0):
+        """
+        データディレクトリをロックして WAL を追記用に開く
+
+        Args:
+            wait: ロックが空くまで待つ最大秒数
+        """
+        lock_file = open(self._path(LOCK_FILE), 'w')
+        give_up_at = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() >= give_up_at:
+                    lock_file.close()
+                    raise RuntimeError(f"{self.data_dir} は別のプロセスが使用中です（memory は1プロセスでのみ使用可能）")
+                time.sleep(0.1)
+        self._lock_file = lock_file
+        self._wal = open(self._path(WAL_FILE), 'a', encoding='utf-8')
+        # 書き込み途中で止まった行があれば改行で区切り、次の操作がその行に繋がらないようにする
+        with open(self._path(WAL_FILE), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._wal.write('\n')
+
+    def _write(self, op: dict) -> dict:
+        """
+        操作を WAL に追記してからメモリに反映する
+
+        Args:
+            op: {'op': 操作名, ...}（再適用できるよう結果の値を入れておく）
+
+        Returns:
+            op
+        """
+        with self._lock:
+            if self._wal is None:
+                self._open_writer()
+            op['seq'] = self._seq + 1
+            self._wal.write(json.dumps(op, ensure_ascii=False) + '\n')
+            self._wal.flush()
+            if Config.MEMORY_FSYNC:
+                os.fsync(self._wal.fileno())
+            self._seq = op['seq']
+            self._wal_entries += 1
+            self._apply(op)
+
+            if (self._wal_entries >= Config.MEMORY_SNAPSHOT_WAL_ENTRIES
+                    or time.monotonic() - self._last_snapshot >= Config.MEMORY_SNAPSHOT_INTERVAL):
+                self.snapshot()
+        return op
+
+    def snapshot(self):
+        """全体をスナップショットに書き出して WAL を空にする"""
+        with self._lock:
+            if self._wal is None:
+                self._open_writer()
+            path = self._path(SNAPSHOT_FILE)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self._snapshot(), f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # rename は原子的なので、途中で止まっても古いスナップショット + WAL が残る
+            os.replace(path + '.tmp', path)
+            self._wal.truncate(0)
+            self._wal_entries = 0
+            self._last_snapshot = time.monotonic()
+            logger.info("スナップショットを保存しました: seq=%s", self._seq)
+
+    def _snapshot(self) -> dict:
+        """スナップショットの内容"""
+        return {
+            'seq': self._seq,
+            'families': [
+                {'id': f.id, 'share_code': f.share_code, 'timezone': f.timezone}
+                for f in self._families.values()
+            ],
+            'line_users': [
+                {'line_user_id': line_user_id, 'family_id': family_id, 'default_child_id': default_child_id}
+                for line_user_id, (family_id, default_child_id) in self._line_users.items()
+            ],
+            'children': [
+                {'id': c.id, 'family_id': self._child_family[c.id], 'name': c.name, 'nickname': c.nickname,
+                 'total_points': c.total_points, 'cycle_points': c.cycle_points}
+                for c in self._children.values()
+            ],
+            'actions': [
+                {'id': a.id, 'family_id': family_id, 'name': a.name, 'points': a.points, 'is_active': is_active}
+                for family_id, a, is_active in self._actions.values()
+            ],
+            'goals': [
+                {'id': g.id, 'family_id': family_id, 'title': g.title, 'target_points': g.target_points,
+                 'is_achieved': is_achieved}
+                for family_id, goals in self._goals.items() for g, is_achieved in goals.values()
+            ],
+            'records': list(self._records.values()),
+        }
+
+    def _restore(self, snapshot: dict):
+        """スナップショットから索引を作る"""
+        self._reset()
+        for row in snapshot.get('families', []):
+            self._apply({'op': 'family', **row})
+        for row in snapshot.get('children', []):
+            self._apply({'op': 'child', **row})
+        for row in snapshot.get('line_users', []):
+            self._apply({'op': 'link', **row})
+        for row in snapshot.get('actions', []):
+            self._apply({'op': 'action', **row})
+        for row in snapshot.get('goals', []):
+            self._apply({'op': 'goal', **row})
+        for row in sorted(snapshot.get('records', []), key=lambda r: (r['recorded_at'], r['id'])):
+            self._apply({'op': 'record', **row})
+
+    def _apply(self, op: dict):
+        """操作をメモリに反映（同じ操作を2回適用しても結果は変わらない）"""
+        kind = op['op']
+        if kind == 'family':
+            family = Family(id=op['id'], share_code=op.get('share_code'), timezone=op.get('timezone'))
+            self._families[family.id] = family
+            if family.share_code:
+                self._share_codes[family.share_code] = family.id
+            self._family_children.setdefault(family.id, [])
+        elif kind == 'child':
+            child = Child.from_row(op)
+            if child.id not in self._children:
+                self._family_children.setdefault(op['family_id'], []).append(child.id)
+            self._children[child.id] = child
+            self._child_family[child.id] = op['family_id']
+        elif kind == 'link':
+            self._line_users[op['line_user_id']] = (op['family_id'], op.get('default_child_id'))
+        elif kind == 'action':
+            action = Action.from_row(op)
+            if action.id not in self._actions:
+                self._family_actions.setdefault(op['family_id'], []).append(action.id)
+            self._actions[action.id] = (op['family_id'], action, op.get('is_active', True))
+        elif kind == 'goal':
+            goal = Goal.from_row(op)
+            self._goals.setdefault(op['family_id'], {})[goal.id] = (goal, op.get('is_achieved', False))
+        elif kind == 'record':
+            if op['id'] in self._records:
+                return
+            record = {key: op.get(key) for key in
+                      ('id', 'child_id', 'action_id', 'points', 'recorded_at', 'local_date', 'source')}
+            key = (record['recorded_at'], record['id'])
+            self._records[record['id']] = record
+            bisect.insort(self._child_records.setdefault(record['child_id'], []), key)
+            self._child_day.setdefault((record['child_id'], record['local_date']), []).append(record['id'])
+            family_id = self._child_family.get(record['child_id'])
+            bisect.insort(self._family_records.setdefault(family_id, []), key)
+        elif kind == 'records':
+            for row in op['rows']:
+                self._apply({'op': 'record', **row})
+        elif kind == 'points':
+            child = self._children.get(op['child_id'])
+            if child is not None:
+                self._children[child.id] = replace(
+                    child, total_points=op['total_points'], cycle_points=op['cycle_points']
+                )
+        elif kind == 'delete_record':
+            record = self._records.pop(op['id'], None)
+            if record is None:
+                return
+            key = (record['recorded_at'], record['id'])
+            self._child_records[record['child_id']].remove(key)
+            self._child_day[(record['child_id'], record['local_date'])].remove(record['id'])
+            self._family_records[self._child_family.get(record['child_id'])].remove(key)
+        else:
+            raise ValueError(f"不明な WAL 操作: {kind}")
+
+    # --- LINEユーザーと家庭 ---
+
+    def get_line_user_link(self, line_user_id: str) -> LineUserLink:
+        """LINEユーザーの紐付け（家庭といつもの子ども）"""
+        entry = self._line_users.get(line_user_id)
+        if entry is None:
+            return None
+        family_id, default_child_id = entry
+        return LineUserLink(family=self._families[family_id], default_child_id=default_child_id)
+
+    def get_family_by_line_user(self, line_user_id: str) -> Family:
+        """LINEユーザーが紐付いた家庭"""
+        link = self.get_line_user_link(line_user_id)
+        return link.family if link else None
+
+    def link_line_user_to_family(self, line_user_id: str, family_share_code: str) -> bool:
+        """共有コードの家庭にLINEユーザーを紐付ける"""
+        family_id = self._share_codes.get(family_share_code)
+        if family_id is None:
+            logger.warning("共有コードが見つかりません: %s", family_share_code)
+            return False
+        try:
+            self._write({'op': 'link', 'line_user_id': line_user_id, 'family_id': family_id,
+                         'default_child_id': None})
+        except Exception as e:
+            logger.error("紐付けエラー: %s", e)
+            return False
+        logger.info("LINEユーザー紐付け: %s -> %s", line_user_id, family_id)
+        return True
+
+    def set_default_child(self, line_user_id: str, child_id: str) -> bool:
+        """LINEユーザーのいつもの子どもを設定"""
+        entry = self._line_users.get(line_user_id)
+        if entry is None:
+            return False
+        try:
+            self._write({'op': 'link', 'line_user_id': line_user_id, 'family_id': entry[0],
+                         'default_child_id': child_id})
+            return True
+        except Exception as e:
+            logger.error("いつもの子ども設定エラー: %s", e)
+            return False
+
+    def get_line_user_ids(self, family_id: str) -> list:
+        """家庭に紐付いたLINEユーザーID"""
+        with self._lock:
+            return [line_user_id for line_user_id, (linked, _) in self._line_users.items() if linked == family_id]
+
+    # --- 子ども・行動・目標 ---
+
+    def get_children(self, family_id: str) -> list:
+        """家庭の子ども（登録順）"""
+        return [self._children[child_id] for child_id in self._family_children.get(family_id, [])]
+
+    def get_child(self, child_id: str) -> Child:
+        """子ども（最新のポイント）"""
+        return self._children.get(child_id)
+
+    def get_actions(self, family_id: str, include_inactive: bool = False) -> list:
+        """家庭の行動マスタ"""
+        actions = (self._actions[action_id] for action_id in self._family_actions.get(family_id, []))
+        return [action for _, action, is_active in actions if is_active or include_inactive]
+
+    def create_action(self, family_id: str, name: str, points: int, is_active: bool = True) -> Action:
+        """行動を追加"""
+        try:
+            op = self._write({'op': 'action', 'id': str(uuid.uuid4()), 'family_id': family_id,
+                              'name': name, 'points': points, 'is_active': is_active})
+        except Exception as e:
+            logger.error("行動追加エラー: %s", e)
+            return None
+        return self._actions[op['id']][1]
+
+    def get_goals(self, family_id: str) -> list:
+        """家庭の未達成の目標"""
+        return [goal for goal, is_achieved in self._goals.get(family_id, {}).values() if not is_achieved]
+
+    # --- 記録とポイント ---
+
+    def add_record(self, child_id: str, action_id: str, points: int) -> bool:
+        """行動記録を追加"""
+        family_id = self._child_family.get(child_id)
+        if family_id is None:
+            logger.error("記録追加エラー: 子どもが見つかりません %s", child_id)
+            return False
+        try:
+            self._write({
+                'op': 'record',
+                'id': str(uuid.uuid4()),
+                'child_id': child_id,
+                'action_id': action_id,
+                'points': points,
+                'recorded_at': datetime.now(dt_timezone.utc).isoformat(timespec='microseconds'),
+                'local_date': local_today(self._families[family_id].timezone),
+                'source': 'line',
+            })
+        except Exception as e:
+            logger.error("記録追加エラー: %s", e)
+            return False
+        logger.info("記録追加: %s (%spt) for %s", action_id, points, child_id, extra={'event': 'record_added'})
+        return True
+
+    def add_records_bulk(self, records: list) -> bool:
+        """行動記録をまとめて追加（WAL には1行で書く）"""
+        if not records:
+            return True
+        now = datetime.now(dt_timezone.utc).isoformat(timespec='microseconds')
+        rows = []
+        for record in records:
+            family_id = self._child_family.get(record['child_id'])
+            if family_id is None:
+                logger.error("記録一括追加エラー: 子どもが見つかりません %s", record['child_id'])
+                return False
+            rows.append({
+                'id': record.get('id') or str(uuid.uuid4()),
+                'child_id': record['child_id'],
+                'action_id': record.get('action_id'),
+                'points': record['points'],
+                'recorded_at': record.get('recorded_at') or now,
+                'local_date': record.get('local_date') or local_today(self._families[family_id].timezone),
+                'source': record.get('source', 'line'),
+            })
+        try:
+            self._write({'op': 'records', 'rows': rows})
+        except Exception as e:
+            logger.error("記録一括追加エラー: %s", e)
+            return False
+        logger.info("記録一括追加: %s件", len(rows))
+        return True
+
+    def update_child_points(self, child_id: str, points_to_add: int, reward_threshold: int = 100) -> dict:
+        """ポイントを加算（周回ポイントが閾値に達したら閾値を引く）"""
+        with self._lock:
+            child = self._children.get(child_id)
+            if child is None:
+                return None
+            total = child.total_points + points_to_add
+            cycle = child.cycle_points + points_to_add
+            achieved = cycle >= reward_threshold
+            if achieved:
+                cycle -= reward_threshold
+            try:
+                self._write({'op': 'points', 'child_id': child_id, 'total_points': total, 'cycle_points': cycle})
+            except Exception as e:
+                logger.error("ポイント更新エラー: %s", e)
+                return None
+
+        logger.info("ポイント更新: %s - total=%s, cycle=%s", child_id, total, cycle, extra={'event': 'points_updated'})
+        return {'total_points': total, 'cycle_points': cycle, 'reward_achieved': achieved}
+
+    def undo_last_record(self, child_id: str, reward_threshold: int = 100) -> dict:
+        """最新の LINE からの記録を取り消してポイントを戻す"""
+        with self._lock:
+            child = self._children.get(child_id)
+            if child is None:
+                return {}
+            record = next((
+                self._records[record_id] for _, record_id in reversed(self._child_records.get(child_id, []))
+                if self._records[record_id]['source'] == 'line'
+            ), None)
+            if record is None:
+                return {}
+
+            total = child.total_points - record['points']
+            cycle = child.cycle_points - record['points']
+            reverted = cycle < 0
+            if reverted:
+                cycle += reward_threshold
+            try:
+                self._write({'op': 'delete_record', 'id': record['id']})
+                self._write({'op': 'points', 'child_id': child_id, 'total_points': total, 'cycle_points': cycle})
+            except Exception as e:
+                logger.error("記録取り消しエラー: %s", e)
+                return None
+
+        action = self._actions.get(record['action_id'])
+        logger.info("記録取り消し: %s (%spt) child=%s", record['id'], record['points'], child_id)
+        return {
+            'record_id': record['id'],
+            'action_name': action[1].name if action else None,
+            'points': record['points'],
+            'total_points': total,
+            'cycle_points': cycle,
+            'reward_reverted': reverted,
+        }
+
+    def get_today_summary(self, child_id: str, timezone: str = None) -> dict:
+        """今日の記録サマリー（(child_id, 日付) の索引で引く）"""
+        total_points = 0
+        action_counts = Counter()
+        # 取り消しと同時に走っても索引と記録がずれないようロックする
+        with self._lock:
+            for record_id in self._child_day.get((child_id, local_today(timezone)), []):
+                record = self._records[record_id]
+                action = self._actions.get(record['action_id'])
+                total_points += record['points']
+                action_counts[action[1].name if action else '不明'] += 1
+        return {'total_points': total_points, 'actions': dict(action_counts)}
+
+    def get_family_points(self, family_id: str, timezone: str = None) -> list:
+        """家庭の子ども全員の 今日・周回・累計ポイント"""
+        today = local_today(timezone)
+        with self._lock:
+            return [
+                ChildPoints(
+                    id=child.id,
+                    name=child.name,
+                    nickname=child.nickname,
+                    today_points=sum(self._records[r]['points'] for r in self._child_day.get((child.id, today), [])),
+                    cycle_points=child.cycle_points,
+                    total_points=child.total_points
+                )
+                for child in self.get_children(family_id)
+            ]
+
+    def get_share_view(self, share_code: str, recent_limit: int = 10) -> dict:
+        """共有URLの表示データ"""
+        with self._lock:
+            family_id = self._share_codes.get(share_code)
+            if family_id is None:
+                return {}
+            family = self._families[family_id]
+            recent = [self._records[record_id] for _, record_id in self._family_records.get(family_id, [])[-recent_limit:]]
+            goals = [goal for goal, is_achieved in self._goals.get(family_id, {}).values() if not is_achieved]
+            children = self.get_family_points(family_id, family.timezone)
+
+        return {
+            'family_id': family_id,
+            'timezone': family.timezone,
+            'children': [{
+                'id': child.id,
+                'name': child.name,
+                'nickname': child.nickname,
+                'total_points': child.total_points,
+                'cycle_points': child.cycle_points,
+                'today_points': child.today_points,
+            } for child in children],
+            'goals': [
+                {'id': goal.id, 'title': goal.title, 'description': None, 'target_points': goal.target_points}
+                for goal in goals
+            ],
+            'recent_records': [{
+                'recorded_at': record['recorded_at'],
+                'child_id': record['child_id'],
+                'action_name': self._actions[record['action_id']][1].name if record['action_id'] in self._actions else None,
+                'points': record['points'],
+            } for record in reversed(recent)],
+        }
+
+    def get_family_records_page(self, family_id: str, after: tuple = None, limit: int = 1000) -> list:
+        """家庭の記録を (recorded_at, id) 順に1ページ"""
+        with self._lock:
+            keys = self._family_records.get(family_id, [])
+            start = bisect.bisect_right(keys, tuple(after)) if after else 0
+            page = [self._records[record_id] for _, record_id in keys[start:start + limit]]
+        rows = []
+        for record in page:
+            child = self._children.get(record['child_id'])
+            action = self._actions.get(record['action_id'])
+            rows.append({
+                **record,
+                'child_name': child.name if child else None,
+                'action_name': action[1].name if action else None,
+            })
+        return rows
@@ -1,26 +1,57 @@
 """
-メッセージ処理ロジック（v2: Supabase版）
-LINEユーザーと家庭の紐付け、Supabaseからの行動マスタ取得に対応
+メッセージ処理ロジック（v2）
+LINEユーザーと家庭の紐付け、データソースからの行動マスタ取得に対応
+データソースは repository.Repository の実装（Supabase / Google Sheets / memory）
 """
+import time
+import uuid
 import logging
+from functools import partial
+from datetime import datetime, timedelta, timezone as dt_timezone
+import deadline
+import share_view
+from burst import BurstCoalescer
 from config import Config
-from supabase_service import SupabaseService
+from child_index import ChildIndex, parse_addressed
+from models import Child
+from response_cache import ReadCache
+from repository import Repository
+from timezone_util import next_local_midnight
 
 logger = logging.getLogger(__name__)
 
+# 直前の記録を取り消すキーワード
+UNDO_KEYWORDS = ('取り消し', '取消', 'キャンセル')
+# 「いつもの子ども」を切り替えるキーワード（例: 「切り替え たろう」）
+SWITCH_KEYWORD = '切り替え'
+# 子ども全員のポイントを表示するキーワード（「みんなのポイント」）
+EVERYONE_KEYWORD = 'みんな'
+# 順位の表示（4位以降は「4.」）
+RANK_MARKS = ('🥇', '🥈', '🥉')
+
+RECORD_FAILED_REPLY = "記録に失敗しました。しばらくしてからもう一度送ってください。"
+
 
 class MessageHandlerV2:
-    """LINEメッセージを処理するクラス（Supabase版）"""
+    """LINEメッセージを処理するクラス"""
 
-    def __init__(self, supabase_service: SupabaseService):
+    def __init__(self, repository: Repository, notification_service=None):
         """
         初期化
 
         Args:
-            supabase_service: Supabase操作サービス
+            repository: データソース
+            notification_service: 家庭全体への通知サービス（省略時は通知しない）
         """
-        self.supabase = supabase_service
+        self.repository = repository
+        self.notifier = notification_service
         self.reward_threshold = Config.REWARD_THRESHOLD
+        # 子どもの名前索引（キャッシュが有効な間は子どもを問い合わせない）
+        self.child_index = ChildIndex(repository.get_children)
+        # 今日のポイント・ごほうび用のキャッシュ（記録・取り消しで無効になる）
+        self.read_cache = ReadCache()
+        # 同じユーザーの書き込み中に届いた行動記録をまとめて書き込む
+        self.burst = BurstCoalescer(self._flush_burst)
 
     def handle_message(self, text: str, line_user_id: str) -> str:
         """
@@ -33,6 +64,61 @@ class MessageHandlerV2:
         Returns:
             返信メッセージ
         """
+        return self.handle_messages([text], line_user_id)[0]
+
+    def handle_messages(self, texts: list, line_user_id: str) -> list:
+        """
+        同じユーザーから1つのWebhookで届いたメッセージを順に処理して返信文を生成
+
+        続けて届いた行動記録は1回の書き込みにまとめる。記録を読む処理（今日のポイント・取り消し等）の
+        前と最後に、それまでの記録を書き込む
+
+        Args:
+            texts: 受信したメッセージテキスト（受信順）
+            line_user_id: LINEユーザーID
+
+        Returns:
+            texts と同じ順の返信メッセージ
+        """
+        replies = [None] * len(texts)
+        # まだ書き込んでいない行動記録 [(texts の位置, _flush_burst の要求), ...]
+        pending = []
+
+        def write_pending():
+            if pending:
+                results = self.burst.submit(line_user_id, [item for _, item in pending])
+                for (index, _), reply in zip(pending, results):
+                    replies[index] = reply
+                pending.clear()
+
+        for index, text in enumerate(texts):
+            result = self._dispatch(text, line_user_id)
+            if isinstance(result, tuple):
+                pending.append((index, result))
+                continue
+            if callable(result):
+                # 直前に送った記録（同じWebhook・実行中の書き込み）が反映されてから読む
+                write_pending()
+                self.burst.drain(line_user_id)
+                result = result()
+            replies[index] = result
+
+        write_pending()
+        return replies
+
+    def _dispatch(self, text: str, line_user_id: str):
+        """
+        メッセージ1件の処理を決める
+
+        Args:
+            text: 受信したメッセージテキスト
+            line_user_id: LINEユーザーID
+
+        Returns:
+            - 返信メッセージ（str）
+            - 記録を読んで返信を作る関数（それまでの記録を書き込んでから呼ぶ）
+            - 行動記録の要求 (子ども情報, (行動情報, ポイント), タイムゾーン, 家庭ID)
+        """
         text = text.strip()
 
         # 紐付けコマンド（例: 「登録 abc123xyz789」）
@@ -41,33 +127,63 @@ class MessageHandlerV2:
             return self._handle_link_family(line_user_id, share_code)
 
         # 家庭情報を取得
-        family = self.supabase.get_family_by_line_user(line_user_id)
-        if not family:
+        link = self.repository.get_line_user_link(line_user_id)
+        if not link:
             return self._handle_not_linked()
+        family = link.family
 
-        # 子どもリストを取得（最初の子どもを使用）
-        children = self.supabase.get_children(family['id'])
-        if not children:
+        # 子どもの名前索引を取得（キャッシュ）
+        directory = self.child_index.get(family.id)
+        if directory is None:
             return "お子さんが登録されていません。\nWebアプリで子どもを登録してください。"
 
-        child = children[0]  # v2では最初の子どもを使用
-        child_id = child['id']
+        # 全員の状況確認（1回の集計で全員分を取得する）
+        if EVERYONE_KEYWORD in text and 'ポイント' in text:
+            return partial(self._handle_everyone_points, family.id, family.timezone)
+
+        # いつもの子どもの切り替え（例: 「切り替え たろう」）
+        if text.startswith(SWITCH_KEYWORD):
+            return self._handle_switch_child(line_user_id, family.id, text[len(SWITCH_KEYWORD):].strip(), directory)
+
+        # 名前付きのメッセージ（例: 「たろう：宿題」「たろう 宿題」）はその子どもに記録する
+        child = None
+        name, body, explicit = parse_addressed(text)
+        if name is not None:
+            child = directory.resolve(name)
+            if child is None and explicit:
+                # 最近追加された子どもかもしれないので読み直す
+                directory = self.child_index.get(family.id, refresh=True) or directory
+                child = directory.resolve(name)
+                if child is None:
+                    return self._handle_unknown_child(name, directory)
+            if child is not None:
+                text = body
+
+        # 名前がなければいつもの子ども（未設定なら最初に登録した子ども）
+        if child is None:
+            child = directory.get(link.default_child_id) or directory.first
+        child_id = child.id
+        timezone = family.timezone
+
+        # 直前の記録の取り消し
+        if any(keyword in text for keyword in UNDO_KEYWORDS):
+            return partial(self._handle_undo, child_id, child, family.id)
 
         # 今日のポイント確認
         if '今日' in text and 'ポイント' in text:
-            return self._handle_today_points(child_id, child)
+            return partial(self._handle_today_points, child_id, child, timezone)
 
-        # ごほうび状況確認
+        # ごほうび状況確認（索引のポイントは古い可能性があるため、キャッシュか最新の値を使う）
         if 'ごほうび' in text or 'ご褒美' in text:
-            return self._handle_reward_status(child, family['id'])
+            return lambda: self._handle_reward_status(self._current_child(child, timezone), family.id, timezone)
 
         # 行動記録
-        action_result = self._detect_action(text, family['id'])
+        action_result = self._detect_action(text, family.id)
         if action_result:
-            return self._handle_action_record(action_result, child_id, child)
+            return (child, action_result, timezone, family.id)
 
         # 未対応キーワード
-        return self._handle_unknown(family['id'])
+        return self._handle_unknown(family.id)
 
     def _handle_link_family(self, line_user_id: str, share_code: str) -> str:
         """
@@ -84,12 +200,12 @@ class MessageHandlerV2:
             return "共有コードを入力してください。\n例: 「登録 abc123xyz789」\n\n共有コードはWebアプリの「共有URL」画面で確認できます。"
 
         # 既に紐付けられているか確認
-        existing = self.supabase.get_family_by_line_user(line_user_id)
+        existing = self.repository.get_family_by_line_user(line_user_id)
         if existing:
             return "すでに家庭と紐付けられています。\n別の家庭に変更する場合は、管理者にお問い合わせください。"
 
         # 紐付け実行
-        if self.supabase.link_line_user_to_family(line_user_id, share_code):
+        if self.repository.link_line_user_to_family(line_user_id, share_code):
             return "✅ 紐付けが完了しました！\n\nこれで行動を記録できます。\n「宿題やった」などと送ってみてください。"
         else:
             return "共有コードが見つかりませんでした。\n正しいコードを入力してください。\n\n共有コードはWebアプリの「共有URL」画面で確認できます。"
@@ -112,74 +228,225 @@ class MessageHandlerV2:
             family_id: 家庭ID
 
         Returns:
-            (行動情報dict, ポイント) or None
+            (Action, ポイント) or None
         """
-        actions = self.supabase.get_actions(family_id)
+        actions = self.repository.get_actions(family_id)
 
         for action in actions:
             # 行動名がテキストに含まれているか確認
-            if action['name'] in text:
-                return (action, action['points'])
+            if action.name in text:
+                return (action, action.points)
 
         return None
 
-    def _handle_action_record(self, action_result: tuple, child_id: str, child: dict) -> str:
+    def _flush_burst(self, line_user_id: str, items: list) -> list:
         """
-        行動記録を処理
+        まとめた行動記録を子どもごとに書き込む（BurstCoalescer から呼ばれる。無効時は1回の submit 分）
+
+        Args:
+            line_user_id: 送信者のLINEユーザーID
+            items: [(子ども情報, (行動情報, ポイント), タイムゾーン, 家庭ID), ...]（受信順）
+
+        Returns:
+            items と同じ順の返信メッセージ
+        """
+        groups = {}
+        for index, (child, _, _, _) in enumerate(items):
+            groups.setdefault(child.id, []).append(index)
+
+        replies = [None] * len(items)
+        for indexes in groups.values():
+            child, _, timezone, family_id = items[indexes[0]]
+            entries = [items[index][1] for index in indexes]
+            for index, reply in zip(indexes, self._record_actions(child, entries, timezone, family_id, line_user_id)):
+                replies[index] = reply
+        return replies
+
+    def _record_actions(self, child: Child, entries: list, timezone: str = None,
+                        family_id: str = None, line_user_id: str = None) -> list:
+        """
+        1人の子どもの行動記録を書き込み、1件ずつの返信を作る
+
+        記録の追加・ポイントの更新・今日の合計の取得は件数によらず1回ずつ。
+        各返信の「今日」「累計」は、最終的な値からその記録より後の分を引いて求める
 
         Args:
-            action_result: (行動情報, ポイント)
-            child_id: 子どもID
             child: 子ども情報
+            entries: [(行動情報, ポイント), ...]（受信順）
+            timezone: 家庭のタイムゾーン
+            family_id: 家庭ID（ごほうび達成の通知先）
+            line_user_id: 送信者のLINEユーザーID（通知から除く）
 
         Returns:
-            返信メッセージ
+            entries と同じ順の返信メッセージ
         """
-        action, points = action_result
-        action_name = action['name']
-        action_id = action['id']
+        child_id = child.id
+        added = sum(points for _, points in entries)
 
         # 記録を追加
-        if not self.supabase.add_record(child_id, action_id, points):
-            return "記録に失敗しました。しばらくしてからもう一度送ってください。"
+        if len(entries) == 1:
+            action, points = entries[0]
+            saved = self.repository.add_record(child_id, action.id, points)
+        else:
+            saved = self.repository.add_records_bulk(self._burst_records(child_id, entries))
+        if not saved:
+            return [RECORD_FAILED_REPLY] * len(entries)
 
         # ポイントを更新
-        result = self.supabase.update_child_points(child_id, points, self.reward_threshold)
+        result = self.repository.update_child_points(child_id, added, self.reward_threshold)
+        # 今日の記録・ポイントと共有URLのキャッシュを無効にする（ポイントの更新に失敗した場合も記録は増えている）
+        self.read_cache.invalidate(child_id)
+        share_view.invalidate(family_id)
         if not result:
-            return "記録に失敗しました。しばらくしてからもう一度送ってください。"
+            return [RECORD_FAILED_REPLY] * len(entries)
+
+        child_name = child.display_name
+        name_prefix = f"【{child_name}】" if child_name else ""
+
+        # 今日の合計を取得（返信期限が近い場合は省略）
+        today_summary = self._today_summary(child_id, timezone) if deadline.allows_optional() else None
+        if today_summary is None:
+            logger.info("返信期限が近いため今日の合計の取得を省略")
+
+        # 書き込む前の値から1件ずつ足していく
+        total = result['total_points'] - added
+        cycle = result['cycle_points'] - added + (self.reward_threshold if result['reward_achieved'] else 0)
+        today = today_summary['total_points'] - added if today_summary is not None else None
+        rewarded = False
+
+        replies = []
+        for i, (action, points) in enumerate(entries):
+            total += points
+            cycle += points
+            response = f"{name_prefix}✅ {action.name}を記録しました！（+{points}pt）\n"
+            if today is not None:
+                today += points
+                response += f"今日は {today}pt、累計は {total}pt です。"
+            else:
+                response += f"累計は {total}pt です。"
+
+            # ごほうび達成チェック（update_child_points と同じく、1回の更新で達成は1回だけ）
+            if result['reward_achieved'] and not rewarded and (cycle >= self.reward_threshold or i == len(entries) - 1):
+                rewarded = True
+                cycle -= self.reward_threshold
+                response += f"\n\n🎉 おめでとう！{self.reward_threshold}ptたまりました！ごほうびを一緒に決めよう！"
+                # 家庭の他の保護者にも通知（送信はバックグラウンド）
+                if self.notifier and family_id:
+                    self.notifier.notify_reward(family_id, child_name, self.reward_threshold, line_user_id)
+
+            replies.append(response)
+
+        return replies
+
+    @staticmethod
+    def _burst_records(child_id: str, entries: list) -> list:
+        """
+        まとめて追加する記録の行（add_records_bulk に渡す）
+
+        ID を付けて再送しても重複しないようにし、受信順が「最新の記録」（取り消しの対象）の順になるよう
+        recorded_at を1マイクロ秒ずつずらす
+        """
+        now = datetime.now(dt_timezone.utc)
+        return [{
+            'id': str(uuid.uuid4()),
+            'child_id': child_id,
+            'action_id': action.id,
+            'points': points,
+            'source': 'line',
+            'recorded_at': (now + timedelta(microseconds=i)).isoformat(timespec='microseconds'),
+        } for i, (action, points) in enumerate(entries)]
+
+    def _handle_switch_child(self, line_user_id: str, family_id: str, name: str, directory) -> str:
+        """
+        いつもの子どもの切り替えを処理
+
+        Args:
+            line_user_id: LINEユーザーID
+            family_id: 家庭ID
+            name: 子どもの名前
+            directory: 家庭の子ども（FamilyChildren）
+
+        Returns:
+            返信メッセージ
+        """
+        child = directory.resolve(name) if name else None
+        if child is None and name:
+            directory = self.child_index.get(family_id, refresh=True) or directory
+            child = directory.resolve(name)
+        if child is None:
+            return self._handle_unknown_child(name, directory)
+
+        if not self.repository.set_default_child(line_user_id, child.id):
+            return "切り替えに失敗しました。しばらくしてからもう一度送ってください。"
+
+        return f"✅ これからは【{child.display_name}】の記録になります。\nほかの子は「名前：宿題」のように送ってね。"
+
+    def _handle_unknown_child(self, name: str, directory) -> str:
+        """
+        名前に該当する子どもがいない場合の応答
+
+        Args:
+            name: 送られた名前
+            directory: 家庭の子ども（FamilyChildren）
+
+        Returns:
+            返信メッセージ
+        """
+        names = "」「".join(child.display_name for child in directory.children)
+        if not name:
+            return f"名前を付けて送ってね。\n例: 「{SWITCH_KEYWORD} {directory.first.display_name}」\n\n登録されている子: 「{names}」"
+        return f"「{name}」という名前の子が見つかりません。\n登録されている子: 「{names}」"
 
-        # ごほうび達成チェック
-        reward_message = ""
-        if result['reward_achieved']:
-            reward_message = f"\n\n🎉 おめでとう！{self.reward_threshold}ptたまりました！ごほうびを一緒に決めよう！"
+    def _handle_undo(self, child_id: str, child: Child, family_id: str) -> str:
+        """
+        直前の記録の取り消しを処理
 
-        # 今日の合計を取得
-        today_summary = self.supabase.get_today_summary(child_id)
-        today_points = today_summary['total_points']
+        Args:
+            child_id: 子どもID
+            child: 子ども情報
+            family_id: 家庭ID
 
-        child_name = child.get('nickname') or child.get('name', '')
+        Returns:
+            返信メッセージ
+        """
+        result = self.repository.undo_last_record(child_id, self.reward_threshold)
+        # エラーでも取り消しが反映されている可能性があるため常に無効にする
+        self.read_cache.invalidate(child_id)
+        share_view.invalidate(family_id)
+        if result is None:
+            return "取り消しに失敗しました。しばらくしてからもう一度送ってください。"
+
+        child_name = child.display_name
         name_prefix = f"【{child_name}】" if child_name else ""
 
-        response = f"{name_prefix}✅ {action_name}を記録しました！（+{points}pt）\n"
-        response += f"今日は {today_points}pt、累計は {result['total_points']}pt です。"
-        response += reward_message
+        if not result:
+            return f"{name_prefix}取り消せる記録がありません。"
+
+        action_name = result.get('action_name') or '記録'
+        response = f"{name_prefix}↩️ {action_name}（+{result['points']}pt）を取り消しました。\n"
+        response += f"累計は {result['total_points']}pt です。"
+        if result['reward_reverted']:
+            response += f"\n\n{self.reward_threshold}ptのごほうび達成も取り消しました。"
 
         return response
 
-    def _handle_today_points(self, child_id: str, child: dict) -> str:
+    def _handle_today_points(self, child_id: str, child: Child, timezone: str = None) -> str:
         """
         今日のポイント確認を処理
 
         Args:
             child_id: 子どもID
             child: 子ども情報
+            timezone: 家庭のタイムゾーン
 
         Returns:
             返信メッセージ
         """
-        summary = self.supabase.get_today_summary(child_id)
+        summary = self._today_summary(child_id, timezone)
+        if summary is None:
+            return "今日の記録を取得できませんでした。しばらくしてからもう一度送ってください。"
 
-        child_name = child.get('nickname') or child.get('name', '')
+        child_name = child.display_name
         name_prefix = f"【{child_name}】" if child_name else ""
 
         if summary['total_points'] == 0:
@@ -192,22 +459,60 @@ class MessageHandlerV2:
 
         return response.rstrip()
 
-    def _handle_reward_status(self, child: dict, family_id: str) -> str:
+    def _handle_everyone_points(self, family_id: str, timezone: str = None) -> str:
+        """
+        全員の状況確認（「みんなのポイント」）を処理
+
+        Args:
+            family_id: 家庭ID
+            timezone: 家庭のタイムゾーン
+
+        Returns:
+            返信メッセージ（今日のポイントの多い順、同点は累計の多い順）
+        """
+        standings = self.repository.get_family_points(family_id, timezone)
+        if standings is None:
+            return "ポイントを取得できませんでした。しばらくしてからもう一度送ってください。"
+        if not standings:
+            return "お子さんが登録されていません。\nWebアプリで子どもを登録してください。"
+
+        # sorted は安定なので、同点なら登録順のまま
+        standings = sorted(standings, key=lambda s: (-s.today_points, -s.total_points))
+
+        response = "👨‍👩‍👧 みんなのポイント\n"
+        rank = 0
+        previous = None
+        for i, standing in enumerate(standings):
+            # 今日・累計とも同じなら同じ順位にする
+            if (standing.today_points, standing.total_points) != previous:
+                rank = i + 1
+                previous = (standing.today_points, standing.total_points)
+            mark = RANK_MARKS[rank - 1] if rank <= len(RANK_MARKS) else f"{rank}."
+            remaining = self.reward_threshold - standing.cycle_points
+            response += (
+                f"\n{mark} {standing.display_name}　今日 {standing.today_points}pt / 累計 {standing.total_points}pt\n"
+                f"　ごほうびまであと {remaining}pt\n"
+            )
+
+        return response.rstrip()
+
+    def _handle_reward_status(self, child: Child, family_id: str, timezone: str = None) -> str:
         """
         ごほうび状況確認を処理
 
         Args:
             child: 子ども情報
             family_id: 家庭ID
+            timezone: 家庭のタイムゾーン
 
         Returns:
             返信メッセージ
         """
-        cycle_points = child['cycle_points']
-        total_points = child['total_points']
+        cycle_points = child.cycle_points
+        total_points = child.total_points
         remaining = self.reward_threshold - cycle_points
 
-        child_name = child.get('nickname') or child.get('name', '')
+        child_name = child.display_name
         name_prefix = f"【{child_name}】" if child_name else ""
 
         response = f"{name_prefix}🎁 ごほうび状況\n"
@@ -219,16 +524,53 @@ class MessageHandlerV2:
         else:
             response += f"🎉 ごほうび達成済み！次の {self.reward_threshold}pt を目指そう！"
 
-        # 目標を表示
-        goals = self.supabase.get_goals(family_id)
+        # 目標を表示（返信期限が近い場合は省略）
+        if not deadline.allows_optional():
+            logger.info("返信期限が近いため目標の取得を省略")
+            return response.rstrip()
+
+        goals = self._goals(family_id, timezone)
         if goals:
             response += "\n\n📌 目標:\n"
             for goal in goals[:3]:  # 最大3件表示
-                target = f"（{goal['target_points']}pt）" if goal.get('target_points') else ""
-                response += f"・{goal['title']}{target}\n"
+                target = f"（{goal.target_points}pt）" if goal.target_points else ""
+                response += f"・{goal.title}{target}\n"
 
         return response.rstrip()
 
+    def _today_summary(self, child_id: str, timezone: str = None) -> dict:
+        """今日の記録サマリー（キャッシュがあれば問い合わせない）"""
+        summary = self.read_cache.get(child_id, 'today')
+        if summary is None:
+            generation = self.read_cache.generation(child_id)
+            summary = self.repository.get_today_summary(child_id, timezone)
+            if summary is not None:
+                self.read_cache.put(child_id, 'today', summary, generation, next_local_midnight(timezone))
+        return summary
+
+    def _current_child(self, child: Child, timezone: str = None) -> Child:
+        """最新のポイントの子ども情報（キャッシュがあれば問い合わせない）"""
+        current = self.read_cache.get(child.id, 'points')
+        if current is None:
+            generation = self.read_cache.generation(child.id)
+            current = self.repository.get_child(child.id)
+            if current is None:
+                return child
+            self.read_cache.put(child.id, 'points', current, generation, next_local_midnight(timezone))
+        return current
+
+    def _goals(self, family_id: str, timezone: str = None) -> list:
+        """家庭の目標（GOALS_CACHE_TTL 秒までキャッシュ）"""
+        goals = self.read_cache.get(family_id, 'goals')
+        if goals is None:
+            generation = self.read_cache.generation(family_id)
+            goals = self.repository.get_goals(family_id)
+            if goals is None:
+                return []
+            expires_at = min(time.time() + Config.GOALS_CACHE_TTL, next_local_midnight(timezone))
+            self.read_cache.put(family_id, 'goals', goals, generation, expires_at)
+        return goals
+
     def _handle_unknown(self, family_id: str) -> str:
         """
         未対応キーワードの応答を生成
@@ -239,12 +581,12 @@ class MessageHandlerV2:
         Returns:
             返信メッセージ
         """
-        actions = self.supabase.get_actions(family_id)
+        actions = self.repository.get_actions(family_id)
 
         if not actions:
             return "行動が登録されていません。\nWebアプリで行動を登録してください。"
 
-        keywords = [action['name'] for action in actions]
+        keywords = [action.name for action in actions]
         keywords_str = "」「".join(keywords)
 
-        return f"まだその言葉には対応していないよ。\n「{keywords_str}」などの言葉を含めて送ってね！\n\n「今日のポイント」で今日の記録を確認できるよ。"
+        return f"まだその言葉には対応していないよ。\n「{keywords_str}」などの言葉を含めて送ってね！\n\n「今日のポイント」で今日の記録、「みんなのポイント」で全員のポイントを確認できるよ。"
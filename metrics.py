@@ -0,0 +1,89 @@
+"""
+プロセス内メトリクスの集計を担当するモジュール
+/metrics エンドポイントから Prometheus テキスト形式で出力する
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_help = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    """メトリクス名とラベルから集計キーを作成"""
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+def describe(name: str, help_text: str):
+    """メトリクスの説明文を登録"""
+    _help[name] = help_text
+
+
+def inc(name: str, labels: dict = None, value: float = 1):
+    """
+    カウンターを加算
+
+    Args:
+        name: メトリクス名
+        labels: ラベル {'backend': 'supabase', ...}
+        value: 加算値
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, labels: dict = None):
+    """
+    ゲージを設定
+
+    Args:
+        name: メトリクス名
+        value: 値
+        labels: ラベル
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def get_value(name: str, labels: dict = None) -> float:
+    """カウンターまたはゲージの現在値を取得（未登録なら0）"""
+    key = _key(name, labels)
+    with _lock:
+        if key in _gauges:
+            return _gauges[key]
+        return _counters.get(key, 0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{k}="{v}"' for k, v in labels)
+    return '{' + pairs + '}'
+
+
+def render_prometheus() -> str:
+    """
+    全メトリクスを Prometheus テキスト形式で出力
+
+    Returns:
+        テキスト形式のメトリクス
+    """
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+
+    lines = []
+    for metric_type, values in (('counter', counters), ('gauge', gauges)):
+        names = sorted({name for name, _ in values})
+        for name in names:
+            if name in _help:
+                lines.append(f'# HELP {name} {_help[name]}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for (key_name, labels), value in sorted(values.items()):
+                if key_name == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
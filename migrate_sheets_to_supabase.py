@@ -0,0 +1,230 @@
+"""
+Google Sheets（v1）から Supabase（v2）へのデータ移行ツール
+
+records シートを行範囲ごとに読み込み、行動名を actions.id に変換して
+records テーブルへまとめて書き込む。進捗はチェックポイントファイルに保存するため、
+途中で止まっても同じコマンドで再開できる。最後に子どもごとのポイント合計を照合する。
+
+使い方:
+    python migrate_sheets_to_supabase.py --family-id <家庭ID> --child-map child_01=<子どもID>
+
+環境変数は app.py と同じもの（GOOGLE_SERVICE_ACCOUNT_JSON, SPREADSHEET_ID,
+SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY）を使用する
+"""
+import os
+import sys
+import json
+import uuid
+import logging
+import argparse
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from config import Config
+from sheets_service import SheetsService
+from supabase_service import SupabaseService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 行番号から records.id を決めるための名前空間（再実行しても同じIDになる）
+RECORD_ID_NAMESPACE = uuid.UUID('6f1c2d0e-8a0b-4e55-9d2a-3b7f5c1e9a42')
+
+
+class MigrationError(Exception):
+    """移行を続行できないエラー"""
+
+
+def load_checkpoint(path: str) -> dict:
+    """チェックポイントを読み込む（なければ初期値）"""
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'next_row': 2, 'migrated': 0, 'skipped': 0}
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """チェックポイントを書き込む（一時ファイル経由で置き換え）"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def parse_child_map(pairs: list, children: list) -> dict:
+    """
+    v1 の child_id と Supabase の children.id の対応を作成
+
+    指定がなく子どもが1人だけの場合は DEFAULT_CHILD_ID をその子どもに対応させる
+    """
+    if not pairs:
+        if len(children) != 1:
+            raise MigrationError("子どもが複数いるため --child-map を指定してください")
+        return {Config.DEFAULT_CHILD_ID: children[0].id}
+
+    child_ids = {child.id for child in children}
+    child_map = {}
+    for pair in pairs:
+        sheet_child_id, _, supabase_child_id = pair.partition('=')
+        if supabase_child_id not in child_ids:
+            raise MigrationError(f"家庭に存在しない子どもIDです: {supabase_child_id}")
+        child_map[sheet_child_id] = supabase_child_id
+    return child_map
+
+
+class SheetsMigrator:
+    """records / status シートを Supabase に移行するクラス"""
+
+    def __init__(self, sheets: SheetsService, supabase: SupabaseService, family_id: str,
+                 child_map: dict, source_tz: ZoneInfo, create_missing_actions: bool):
+        self.sheets = sheets
+        self.supabase = supabase
+        self.family_id = family_id
+        self.child_map = child_map
+        self.source_tz = source_tz
+        self.create_missing_actions = create_missing_actions
+
+        # 無効化された行動も過去の記録には使われているため含めて取得
+        actions = supabase.get_actions(family_id, include_inactive=True)
+        self.action_ids = {action.name: action.id for action in actions}
+
+    def _action_id(self, name: str, points: int) -> str:
+        """行動名を actions.id に変換（必要なら無効な行動として追加）"""
+        if name in self.action_ids:
+            return self.action_ids[name]
+
+        if not self.create_missing_actions:
+            raise MigrationError(
+                f"行動マスタにない行動です: {name}\n"
+                "Webアプリで行動を追加するか --create-missing-actions を指定して再実行してください"
+            )
+
+        action = self.supabase.create_action(self.family_id, name, points, is_active=False)
+        if not action:
+            raise MigrationError(f"行動の追加に失敗しました: {name}")
+        self.action_ids[name] = action.id
+        return action.id
+
+    def _to_record(self, row_number: int, row: list) -> dict:
+        """シートの1行を records の1行に変換（対象外・値が不正ならNone）"""
+        row = row + [''] * (6 - len(row))
+        date, time_str, sheet_child_id, action_name, points, _memo = row[:6]
+        if not date or not action_name or sheet_child_id not in self.child_map:
+            return None
+
+        try:
+            points = int(points or 0)
+            recorded_at = datetime.strptime(
+                f'{date} {time_str or "00:00:00"}', '%Y-%m-%d %H:%M:%S'
+            ).replace(tzinfo=self.source_tz)
+        except (ValueError, TypeError) as e:
+            # 壊れた行で止めると再開しても同じ行で止まるため、対象外として数えて先に進む
+            logger.warning("%s行目を読み飛ばします（値が不正）: %s", row_number, e)
+            return None
+
+        return {
+            'id': str(uuid.uuid5(RECORD_ID_NAMESPACE, f'{Config.SPREADSHEET_ID}:{row_number}')),
+            'child_id': self.child_map[sheet_child_id],
+            'action_id': self._action_id(action_name, points),
+            'points': points,
+            'recorded_at': recorded_at.isoformat(),
+            'source': 'line'
+        }
+
+    def migrate_records(self, checkpoint: dict, checkpoint_path: str, chunk_size: int, batch_size: int):
+        """records シートを移行（バッチ書き込みごとにチェックポイントを保存）"""
+        batch = []
+        last_row = checkpoint['next_row'] - 1
+
+        def flush():
+            if batch and not self.supabase.add_records_bulk(batch):
+                raise MigrationError(f"{last_row}行目までの書き込みに失敗しました（再実行で再開できます）")
+            checkpoint['migrated'] += len(batch)
+            checkpoint['next_row'] = last_row + 1
+            save_checkpoint(checkpoint_path, checkpoint)
+            batch.clear()
+
+        for row_number, row in self.sheets.iter_records(checkpoint['next_row'], chunk_size):
+            record = self._to_record(row_number, row)
+            last_row = row_number
+            if record is None:
+                checkpoint['skipped'] += 1
+            else:
+                batch.append(record)
+
+            if len(batch) >= batch_size:
+                flush()
+                logger.info("%s行目まで移行（累計 %s件）", row_number, checkpoint['migrated'])
+
+        flush()
+
+    def migrate_status(self) -> dict:
+        """status シートのポイントを children に反映し、シート側の値を返す"""
+        statuses = self.sheets.get_all_statuses()
+        for sheet_child_id, child_id in self.child_map.items():
+            status = statuses.get(sheet_child_id)
+            if status is None:
+                continue
+            if not self.supabase.set_child_points(child_id, status['total_points'], status['cycle_points']):
+                raise MigrationError(f"ポイントの反映に失敗しました: {sheet_child_id}")
+        return statuses
+
+    def verify(self, statuses: dict) -> bool:
+        """子どもごとに records の合計とシートの累計ポイントを照合"""
+        ok = True
+        for sheet_child_id, child_id in self.child_map.items():
+            expected = statuses.get(sheet_child_id, {}).get('total_points', 0)
+            actual = self.supabase.sum_record_points(child_id)
+            if actual == expected:
+                logger.info("照合OK: %s -> %s = %spt", sheet_child_id, child_id, actual)
+            else:
+                ok = False
+                logger.error("照合NG: %s -> %s シート=%spt 移行後=%spt", sheet_child_id, child_id, expected, actual)
+        return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Google Sheets から Supabase へのデータ移行")
+    parser.add_argument('--family-id', required=True, help="移行先の家庭ID")
+    parser.add_argument('--child-map', action='append', default=[],
+                        help="v1のchild_idとSupabaseの子どもIDの対応（例: child_01=<uuid>）。複数指定可")
+    parser.add_argument('--source-timezone', default='UTC',
+                        help="シートの日付・時刻のタイムゾーン（v1サーバーの時刻、デフォルト: UTC）")
+    parser.add_argument('--chunk-size', type=int, default=500, help="1回に読み込むシートの行数")
+    parser.add_argument('--batch-size', type=int, default=500, help="1回に書き込む記録の件数")
+    parser.add_argument('--checkpoint', help="チェックポイントファイルのパス")
+    parser.add_argument('--create-missing-actions', action='store_true',
+                        help="行動マスタにない行動を無効な行動として追加する")
+    parser.add_argument('--skip-status', action='store_true', help="status シートの反映を行わない")
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or f'.migrate_{args.family_id}.json'
+
+    try:
+        sheets = SheetsService()
+        supabase = SupabaseService()
+
+        child_map = parse_child_map(args.child_map, supabase.get_children(args.family_id))
+        migrator = SheetsMigrator(
+            sheets, supabase, args.family_id, child_map,
+            ZoneInfo(args.source_timezone), args.create_missing_actions
+        )
+
+        checkpoint = load_checkpoint(checkpoint_path)
+        logger.info("移行開始: %s行目から", checkpoint['next_row'])
+        migrator.migrate_records(checkpoint, checkpoint_path, args.chunk_size, args.batch_size)
+        logger.info("記録の移行完了: %s件（対象外 %s件）", checkpoint['migrated'], checkpoint['skipped'])
+
+        statuses = sheets.get_all_statuses() if args.skip_status else migrator.migrate_status()
+        if not migrator.verify(statuses):
+            sys.exit(1)
+    except MigrationError as e:
+        logger.error("移行エラー: %s", e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
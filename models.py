@@ -0,0 +1,129 @@
+"""
+Supabase の行を表す軽量モデル
+
+PostgREST の dict をそのまま持ち回すと、使わないタイムスタンプ等の列と
+キーの文字列・dict 本体の分だけメモリを消費する。Bot が使う列だけを
+__slots__ 付きの frozen dataclass に詰め、select もその列に絞る
+（COLUMNS を select にそのまま渡す）
+"""
+import sys
+from dataclasses import dataclass
+from typing import ClassVar, Optional
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """同じIDの文字列を1つにまとめる（多数の行で同じ値を共有する）"""
+    return sys.intern(value) if value is not None else None
+
+
+@dataclass(frozen=True, slots=True)
+class Family:
+    """家庭"""
+
+    COLUMNS: ClassVar[str] = 'id, share_code, timezone'
+
+    id: str
+    share_code: Optional[str] = None
+    timezone: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Family':
+        return cls(
+            id=_intern(row['id']),
+            share_code=row.get('share_code'),
+            timezone=_intern(row.get('timezone'))
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class LineUserLink:
+    """LINEユーザーと家庭の紐付け"""
+
+    family: Family
+    default_child_id: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class Child:
+    """子ども"""
+
+    COLUMNS: ClassVar[str] = 'id, name, nickname, total_points, cycle_points'
+
+    id: str
+    name: str
+    nickname: Optional[str] = None
+    total_points: int = 0
+    cycle_points: int = 0
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Child':
+        return cls(
+            id=_intern(row['id']),
+            name=row.get('name') or '',
+            nickname=row.get('nickname'),
+            total_points=row.get('total_points') or 0,
+            cycle_points=row.get('cycle_points') or 0
+        )
+
+    @property
+    def display_name(self) -> str:
+        """返信に使う名前（ニックネーム優先）"""
+        return self.nickname or self.name
+
+
+@dataclass(frozen=True, slots=True)
+class ChildPoints:
+    """子どもの 今日・周回・累計ポイント（family_points_summary 関数の行）"""
+
+    id: str
+    name: str
+    nickname: Optional[str] = None
+    today_points: int = 0
+    cycle_points: int = 0
+    total_points: int = 0
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'ChildPoints':
+        return cls(
+            id=_intern(row['child_id']),
+            name=row.get('name') or '',
+            nickname=row.get('nickname'),
+            today_points=row.get('today_points') or 0,
+            cycle_points=row.get('cycle_points') or 0,
+            total_points=row.get('total_points') or 0
+        )
+
+    @property
+    def display_name(self) -> str:
+        """返信に使う名前（ニックネーム優先）"""
+        return self.nickname or self.name
+
+
+@dataclass(frozen=True, slots=True)
+class Action:
+    """行動マスタ"""
+
+    COLUMNS: ClassVar[str] = 'id, name, points'
+
+    id: str
+    name: str
+    points: int
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Action':
+        return cls(id=_intern(row['id']), name=row['name'], points=row['points'])
+
+
+@dataclass(frozen=True, slots=True)
+class Goal:
+    """目標"""
+
+    COLUMNS: ClassVar[str] = 'id, title, target_points'
+
+    id: str
+    title: str
+    target_points: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'Goal':
+        return cls(id=_intern(row['id']), title=row['title'], target_points=row.get('target_points'))
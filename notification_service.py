@@ -0,0 +1,221 @@
+"""
+家庭全体への通知（LINEマルチキャスト）を担当するモジュール
+通知はキューに積み、リクエスト処理とは別のスレッドで送信する
+"""
+import os
+import uuid
+import queue
+import logging
+import threading
+
+from linebot.v3.messaging import (
+    ApiClient,
+    MessagingApi,
+    MulticastRequest,
+    TextMessage
+)
+from linebot.v3.messaging.exceptions import ApiException
+import urllib3
+
+import metrics
+from config import Config
+from rate_limit import TokenBucket
+from resilience import get_policy
+
+logger = logging.getLogger(__name__)
+
+# LINEのマルチキャストで1回に送れる宛先の上限
+MULTICAST_MAX_RECIPIENTS = 500
+
+metrics.describe('notifications_enqueued_total', "キューに積んだ通知数")
+metrics.describe('notifications_dropped_total', "キューが満杯で破棄した通知数")
+metrics.describe('notification_recipients_total', "マルチキャストで送信した宛先数")
+metrics.describe('notification_queue_depth', "送信待ちの通知数")
+
+
+def is_line_api_failure(error: Exception) -> bool:
+    """通信エラー・429・5xx をLINE APIの障害とみなす"""
+    if isinstance(error, urllib3.exceptions.HTTPError):
+        return True
+    if isinstance(error, ApiException):
+        return error.status == 429 or (error.status or 0) >= 500
+    return False
+
+
+def get_line_policy(name: str = 'line'):
+    """
+    LINE API 呼び出し用のポリシーを取得
+
+    Args:
+        name: ポリシー名（一斉送信は 'line_multicast' として返信とブレーカーを分ける）
+    """
+    return get_policy(name, is_line_api_failure)
+
+
+def chunk_recipients(user_ids: list, size: int = MULTICAST_MAX_RECIPIENTS) -> list:
+    """
+    宛先をマルチキャスト1回分ずつに分割
+
+    Args:
+        user_ids: LINEユーザーIDのリスト
+        size: 1回あたりの宛先数
+
+    Returns:
+        [[user_id, ...], ...]
+    """
+    return [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+
+class MulticastSender:
+    """LINEマルチキャストの送信（レート制限・リトライ付き）"""
+
+    def __init__(self, configuration, rate: float = None):
+        """
+        初期化
+
+        Args:
+            configuration: LINE Messaging API の Configuration
+            rate: 1秒あたりのマルチキャスト呼び出し数の上限
+        """
+        self.configuration = configuration
+        self.bucket = TokenBucket(rate or Config.LINE_MULTICAST_RATE)
+        # 一斉送信の429で返信用のブレーカーが開かないよう別のポリシーを使う
+        self.policy = get_line_policy('line_multicast')
+
+    def send(self, user_ids: list, text: str) -> int:
+        """
+        同じメッセージを複数のユーザーに送信
+
+        Args:
+            user_ids: LINEユーザーIDのリスト（500件を超える場合は分割して送信）
+            text: メッセージ
+
+        Returns:
+            送信できた宛先数
+        """
+        sent = 0
+        with ApiClient(self.configuration) as api_client:
+            messaging_api = MessagingApi(api_client)
+            for batch in chunk_recipients(user_ids):
+                self.bucket.acquire()
+                try:
+                    # 同じリトライキーで再送すれば、LINE側で重複送信が防がれる
+                    self.policy.call(
+                        messaging_api.multicast,
+                        MulticastRequest(to=batch, messages=[TextMessage(text=text)]),
+                        x_line_retry_key=str(uuid.uuid4()),
+                        _request_timeout=Config.BACKEND_TIMEOUT
+                    )
+                    sent += len(batch)
+                    metrics.inc('notification_recipients_total', value=len(batch))
+                except ApiException as e:
+                    if e.status == 429:
+                        # レート制限に達したので、以降の送信を1秒遅らせる
+                        self.bucket.penalize(1)
+                    logger.error("マルチキャスト送信エラー: status=%s 宛先%s件", e.status, len(batch))
+                except Exception as e:
+                    logger.error("マルチキャスト送信エラー: %s 宛先%s件", e, len(batch))
+        return sent
+
+
+class NotificationService:
+    """
+    家庭に紐付いた全LINEユーザーへの通知
+
+    notify_* はキューに積むだけで、宛先の取得と送信はバックグラウンドスレッドで行う
+    """
+
+    def __init__(self, sender: MulticastSender, recipient_lookup, max_queue_size: int = None):
+        """
+        初期化
+
+        Args:
+            sender: マルチキャスト送信
+            recipient_lookup: 家庭IDからLINEユーザーIDのリストを返す関数
+            max_queue_size: キューの最大長
+        """
+        self.sender = sender
+        self.recipient_lookup = recipient_lookup
+        self._queue = queue.Queue(maxsize=max_queue_size or Config.NOTIFY_QUEUE_SIZE)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def notify_reward(self, family_id: str, child_name: str, reward_threshold: int, exclude_user_id: str = None):
+        """
+        ごほうび達成を家庭の全員に通知（送信者本人は返信で知るため除く）
+
+        Args:
+            family_id: 家庭ID
+            child_name: 子どもの表示名
+            reward_threshold: ごほうび閾値
+            exclude_user_id: 通知しないLINEユーザーID
+        """
+        name = f"{child_name}が" if child_name else ""
+        text = f"🎉 {name}{reward_threshold}ptたまりました！ごほうびを一緒に決めよう！"
+        self.enqueue(family_id, text, exclude_user_id)
+
+    def enqueue(self, family_id: str, text: str, exclude_user_id: str = None) -> bool:
+        """
+        通知をキューに積む（満杯なら破棄）
+
+        Returns:
+            積めた場合True
+        """
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((family_id, text, exclude_user_id))
+        except queue.Full:
+            metrics.inc('notifications_dropped_total')
+            logger.warning("通知キューが満杯のため破棄: family=%s", family_id)
+            return False
+
+        metrics.inc('notifications_enqueued_total')
+        metrics.set_gauge('notification_queue_depth', self._queue.qsize())
+        return True
+
+    def _ensure_worker(self):
+        """送信スレッドを起動（fork 後のプロセスでは作り直す）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='notification-worker', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._deliver(*item)
+            finally:
+                self._queue.task_done()
+                metrics.set_gauge('notification_queue_depth', self._queue.qsize())
+
+    def _deliver(self, family_id: str, text: str, exclude_user_id: str):
+        try:
+            user_ids = [uid for uid in self.recipient_lookup(family_id) if uid != exclude_user_id]
+            if not user_ids:
+                return
+            sent = self.sender.send(user_ids, text)
+            logger.info("家庭通知送信: family=%s %s/%s件", family_id, sent, len(user_ids))
+        except Exception as e:
+            logger.error("家庭通知エラー: family=%s %s", family_id, e)
+
+    def shutdown(self, timeout: float = 5):
+        """
+        キューに残っている通知を送信してからスレッドを止める
+
+        Args:
+            timeout: 最大待ち秒数
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
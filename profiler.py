@@ -0,0 +1,191 @@
+"""
+Webhook処理のサンプリングプロファイラー
+
+有効にすると、Webhookの一部（sample_rate の割合）について処理中のスレッドの
+スタックを一定間隔で採取し、関数の呼び出し経路ごとに集計する。
+出力は flamegraph.pl / speedscope がそのまま読める folded 形式
+（`module:func;module:func 件数`）
+
+無効時（sample_rate=0）のコストは、リクエストごとの属性参照1回だけ
+
+gevent ワーカー（GUNICORN_WORKER_MODE=async）では、すべてのグリーンレットが同じ
+OS スレッドで動くため、スレッド単位の採取ではリクエストのスタックが取れない。
+この場合は無効のままにする（supported が False）
+"""
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('profiled_requests_total', "プロファイル対象になったリクエスト数")
+metrics.describe('profile_samples_total', "採取したスタック数")
+
+# サンプリングで外れたリクエスト用（使い回してジェネレーターの生成を省く）
+_NOT_SAMPLED = nullcontext()
+
+# 集計するスタックの種類の上限（超えた分は破棄してメモリを抑える）
+MAX_STACKS = 20000
+
+
+def _frame_label(frame) -> str:
+    """フレームを 'module:function' 形式にする"""
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}:{frame.f_code.co_name}"
+
+
+def threads_are_greenlets() -> bool:
+    """gevent のモンキーパッチで threading がグリーンレットに置き換わっているか"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+class SamplingProfiler:
+    """
+    スレッド単位のサンプリングプロファイラー
+
+    対象リクエストを処理しているスレッドを登録し、別スレッドから
+    sys._current_frames() でスタックを採取する。対象スレッドの処理には割り込まない
+    """
+
+    def __init__(self, sample_rate: float = 0.0, interval: float = 0.005):
+        """
+        初期化
+
+        Args:
+            sample_rate: プロファイル対象にするリクエストの割合（0で無効）
+            interval: スタックの採取間隔（秒）
+        """
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._active = set()
+        self._stacks = Counter()
+        self._samples = 0
+        self._requests = 0
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        if sample_rate and not self.supported:
+            logger.warning("gevent ワーカーではプロファイラーを使用できないため無効にします")
+            self.sample_rate = 0.0
+
+    @property
+    def supported(self) -> bool:
+        """スレッド単位の採取でリクエストのスタックが取れるか（gevent ワーカーでは False）"""
+        return not threads_are_greenlets()
+
+    def configure(self, sample_rate: float = None, interval: float = None):
+        """
+        実行中に設定を変更
+
+        Args:
+            sample_rate: プロファイル対象にするリクエストの割合（0で無効）
+            interval: スタックの採取間隔（秒）
+        """
+        if interval is not None:
+            self.interval = max(0.001, interval)
+        if sample_rate is not None:
+            self.sample_rate = min(1.0, max(0.0, sample_rate))
+            logger.info("プロファイラー設定: sample_rate=%s interval=%s", self.sample_rate, self.interval)
+
+    def profile_request(self):
+        """リクエスト1件の処理をプロファイル対象にする（サンプリングで外れた場合は何もしない）"""
+        rate = self.sample_rate
+        if not rate or random.random() >= rate:
+            return _NOT_SAMPLED
+        return self._profile_current_thread()
+
+    @contextmanager
+    def _profile_current_thread(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._active.add(ident)
+            self._requests += 1
+        metrics.inc('profiled_requests_total')
+        self._ensure_sampler()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.discard(ident)
+
+    def folded(self) -> str:
+        """集計結果を folded 形式で返す（件数の多い順）"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        """集計状況"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'sample_rate': self.sample_rate,
+                'interval': self.interval,
+                'requests': self._requests,
+                'samples': self._samples,
+                'stacks': len(self._stacks),
+                'since': self._started_at,
+            }
+
+    def reset(self):
+        """集計結果を消去"""
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+            self._requests = 0
+            self._started_at = time.time()
+
+    def _ensure_sampler(self):
+        """採取スレッドを起動（fork 後のプロセスでは作り直す）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        sampler_ident = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                targets = [ident for ident in self._active if ident != sampler_ident]
+                if not targets and not self.sample_rate:
+                    # 無効化されて対象もなくなったら終了（次の対象で再起動する）
+                    self._thread = None
+                    return
+            if not targets:
+                continue
+
+            frames = sys._current_frames()
+            collected = []
+            for ident in targets:
+                frame = frames.get(ident)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    collected.append(';'.join(reversed(labels)))
+            del frames
+
+            with self._lock:
+                for stack in collected:
+                    if stack in self._stacks or len(self._stacks) < MAX_STACKS:
+                        self._stacks[stack] += 1
+                self._samples += len(collected)
+            metrics.inc('profile_samples_total', value=len(collected))
+
+
+# プロセス内で共有するプロファイラー
+profiler = SamplingProfiler(Config.PROFILE_SAMPLE_RATE, Config.PROFILE_INTERVAL_MS / 1000)
@@ -0,0 +1,89 @@
+"""
+レート制限を担当するモジュール
+外部APIの呼び出し頻度をトークンバケットで制御する
+"""
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    トークンバケット
+
+    1秒あたり rate 個のトークンが貯まり、最大 capacity 個まで保持する。
+    呼び出し1回ごとにトークンを消費し、足りなければ貯まるまで待つ
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        初期化
+
+        Args:
+            rate: 1秒あたりに補充するトークン数
+            capacity: 最大トークン数（省略時は rate と同じ = 1秒分のバースト）
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        トークンを取り出す（足りなければ待たずにFalse）
+
+        Args:
+            tokens: 消費するトークン数
+
+        Returns:
+            取り出せた場合True
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """
+        トークンが貯まるまで待って取り出す
+
+        Args:
+            tokens: 消費するトークン数
+            timeout: 最大待ち秒数（省略時は無期限）
+
+        Returns:
+            取り出せた場合True（タイムアウト時False）
+        """
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+
+            if give_up_at is not None:
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """
+        429 応答などを受けたとき、指定秒数分トークンを減らして送信を遅らせる
+
+        Args:
+            seconds: 遅らせる秒数
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= seconds * self.rate
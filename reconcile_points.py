@@ -0,0 +1,149 @@
+"""
+子どものポイント整合性チェック・補正ツール
+
+children.total_points / cycle_points と records の合計を突き合わせ、ずれを報告する。
+--fix を指定すると、ずれている子どもを少しずつ補正する（1件ずつの短い更新で、
+読み取り時から値が変わっていない場合のみ更新する）
+
+使い方:
+    python reconcile_points.py                     # 全家庭をチェック
+    python reconcile_points.py --family-id <ID> --fix
+
+集計は child_record_totals 関数（supabase/migrations）でサーバー側で行う。
+関数を作成していない環境では --client-side で records をページングして集計する
+（子どもと記録を別々に読むため、補正は利用の少ない時間帯に行うこと）
+"""
+import sys
+import time
+import logging
+import argparse
+
+from config import Config
+from supabase_service import SupabaseService
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def expected_points(record_points: int, reward_threshold: int) -> tuple:
+    """
+    records の合計から本来の (累計, 周回) ポイントを求める
+
+    ごほうび達成のたびに周回ポイントから閾値を引くため、周回ポイントは合計の剰余になる
+    """
+    return record_points, record_points % reward_threshold
+
+
+def iter_totals(supabase: SupabaseService, family_id: str, page_size: int, client_side: bool):
+    """
+    子どもごとのポイントと records 合計をページ単位で返す
+
+    Yields:
+        [{'child_id', 'family_id', 'total_points', 'cycle_points', 'record_points'}, ...]
+    """
+    after = None
+    while True:
+        if client_side:
+            children = supabase.get_children_page(after, page_size, family_id)
+            if children is None:
+                raise RuntimeError("子どもの取得に失敗しました")
+            totals = supabase.get_record_totals([child['id'] for child in children]) if children else {}
+            if totals is None:
+                raise RuntimeError("記録の集計に失敗しました")
+            page = [{
+                'child_id': child['id'],
+                'family_id': child['family_id'],
+                'total_points': child['total_points'],
+                'cycle_points': child['cycle_points'],
+                'record_points': totals.get(child['id'], 0)
+            } for child in children]
+        else:
+            page = supabase.get_child_record_totals(after, page_size, family_id)
+            if page is None:
+                raise RuntimeError("記録の集計に失敗しました")
+
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        after = page[-1]['child_id']
+
+
+def reconcile(supabase: SupabaseService, family_id: str = None, fix: bool = False,
+              page_size: int = 200, batch_size: int = 50, pause: float = 0.2,
+              client_side: bool = False) -> dict:
+    """
+    ポイントのずれを検出（fix=True なら補正）
+
+    Returns:
+        {'checked': int, 'drifted': int, 'fixed': int, 'conflicts': int}
+    """
+    stats = {'checked': 0, 'drifted': 0, 'fixed': 0, 'conflicts': 0}
+    pending = 0
+
+    for page in iter_totals(supabase, family_id, page_size, client_side):
+        for row in page:
+            stats['checked'] += 1
+            total, cycle = expected_points(row['record_points'], Config.REWARD_THRESHOLD)
+            if row['total_points'] == total and row['cycle_points'] == cycle:
+                continue
+
+            stats['drifted'] += 1
+            logger.warning(
+                "ずれ検出: child=%s family=%s total %s -> %s, cycle %s -> %s",
+                row['child_id'], row['family_id'], row['total_points'], total, row['cycle_points'], cycle
+            )
+            if not fix:
+                continue
+
+            if supabase.correct_child_points(
+                row['child_id'], row['total_points'], row['cycle_points'], total, cycle
+            ):
+                stats['fixed'] += 1
+            else:
+                # 集計後に記録が追加された等。次回の実行で再チェックされる
+                stats['conflicts'] += 1
+                logger.warning("同時更新のため補正を見送り: child=%s", row['child_id'])
+
+            # ロックを長く持たないよう、一定件数ごとに間を空ける
+            pending += 1
+            if pending >= batch_size:
+                pending = 0
+                time.sleep(pause)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="子どものポイント整合性チェック・補正")
+    parser.add_argument('--family-id', help="対象の家庭ID（省略時は全家庭）")
+    parser.add_argument('--fix', action='store_true', help="ずれを補正する")
+    parser.add_argument('--page-size', type=int, default=200, help="1ページの子どもの数")
+    parser.add_argument('--batch-size', type=int, default=50, help="補正を何件ごとに休止するか")
+    parser.add_argument('--pause', type=float, default=0.2, help="補正バッチ間の休止秒数")
+    parser.add_argument('--client-side', action='store_true',
+                        help="child_record_totals 関数を使わずに集計する")
+    args = parser.parse_args()
+
+    try:
+        stats = reconcile(
+            SupabaseService(), args.family_id, args.fix,
+            args.page_size, args.batch_size, args.pause, args.client_side
+        )
+    except RuntimeError as e:
+        logger.error("整合性チェックエラー: %s", e)
+        sys.exit(1)
+
+    logger.info(
+        "チェック完了: %s人中 %s人にずれ（補正 %s人、見送り %s人）",
+        stats['checked'], stats['drifted'], stats['fixed'], stats['conflicts']
+    )
+    if stats['drifted'] > stats['fixed']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
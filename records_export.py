@@ -0,0 +1,147 @@
+"""
+家庭の記録の全件エクスポート（CSV / JSON Lines）
+
+記録を (recorded_at, id) のキーセットで1ページずつ読み、行動名・子どもの名前を付けて
+1行ずつ書き出す。全件をメモリに載せないため、記録が何件あっても使用メモリは一定。
+HTTP の /export/records からも同じ処理でストリーミングで返す
+
+使い方:
+    python records_export.py --family-id <ID> --format csv --output records.csv
+    python records_export.py --family-id <ID> --format jsonl > records.jsonl
+"""
+import io
+import sys
+import csv
+import json
+import logging
+import argparse
+
+from supabase_service import SupabaseService
+
+logger = logging.getLogger(__name__)
+
+# 出力する列（この順で書き出す）
+EXPORT_FIELDS = ['recorded_at', 'local_date', 'child_id', 'child_name', 'action_name', 'points', 'source', 'id']
+
+
+class ExportError(Exception):
+    """エクスポート中の取得エラー"""
+
+
+def iter_family_records(supabase: SupabaseService, family_id: str, page_size: int = 1000):
+    """
+    家庭の記録を古い順に1件ずつ返す
+
+    Args:
+        supabase: Supabase操作サービス
+        family_id: 家庭ID
+        page_size: 1回に取得する件数
+
+    Yields:
+        {列名: 値}（EXPORT_FIELDS の列）
+    """
+    after = None
+    while True:
+        rows = supabase.get_family_records_page(family_id, after, page_size)
+        if rows is None:
+            raise ExportError("記録の取得に失敗しました")
+
+        for row in rows:
+            yield {field: row.get(field) for field in EXPORT_FIELDS}
+
+        if len(rows) < page_size:
+            return
+        after = (rows[-1]['recorded_at'], rows[-1]['id'])
+
+
+def iter_csv(records):
+    """記録を CSV の行（ヘッダー付き）にして返す"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    for record in records:
+        writer.writerow([record[field] for field in EXPORT_FIELDS])
+        yield flush()
+
+
+def iter_jsonl(records):
+    """記録を JSON Lines の行にして返す"""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+# 形式ごとの (書き出し関数, Content-Type, 拡張子)
+FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8', 'csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+
+def export(supabase: SupabaseService, family_id: str, fmt: str, out, page_size: int = 1000) -> int:
+    """
+    家庭の記録を out に書き出す
+
+    Args:
+        supabase: Supabase操作サービス
+        family_id: 家庭ID
+        fmt: 'csv' or 'jsonl'
+        out: 書き出し先（テキストのファイルオブジェクト）
+        page_size: 1回に取得する件数
+
+    Returns:
+        書き出した件数
+    """
+    count = 0
+
+    def counted(records):
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    serialize = FORMATS[fmt][0]
+    for chunk in serialize(counted(iter_family_records(supabase, family_id, page_size))):
+        out.write(chunk)
+    return count
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description="家庭の記録の全件エクスポート")
+    parser.add_argument('--family-id', required=True, help="対象の家庭ID")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', help="出力ファイル（省略時は標準出力）")
+    parser.add_argument('--page-size', type=int, default=1000, help="1回に取得する件数")
+    args = parser.parse_args()
+
+    supabase = SupabaseService()
+    # CSV は Excel で開けるよう BOM 付きにする
+    encoding = 'utf-8-sig' if args.format == 'csv' and args.output else 'utf-8'
+    out = open(args.output, 'w', encoding=encoding, newline='') if args.output else sys.stdout
+
+    try:
+        count = export(supabase, args.family_id, args.format, out, args.page_size)
+    except ExportError as e:
+        logger.error("エクスポートエラー: %s", e)
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    logger.info("エクスポート完了: %s件", count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+夕方のリマインド配信ジョブ
+
+今日まだ記録がない子どもがいる家庭のLINEユーザーに「今日はまだ記録がないよ」を送る。
+対象は reminder_recipients 関数で1回の問い合わせ（ページ単位）で取得し、
+同じ文面をマルチキャストでまとめて送る。送信済みの位置は job_checkpoints に保存するため、
+途中で止まっても同じ日のうちに再実行すれば続きから送る
+
+使い方（Render の Cron Job などから実行）:
+    python reminder_job.py
+    python reminder_job.py --timezone Asia/Tokyo --dry-run
+"""
+import sys
+import time
+import logging
+import argparse
+
+from linebot.v3.messaging import Configuration
+
+from config import Config
+from notification_service import MulticastSender, MULTICAST_MAX_RECIPIENTS
+from supabase_service import SupabaseService
+from timezone_util import local_today
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+JOB_NAME = 'daily_reminder'
+REMINDER_TEXT = "今日はまだ記録がないよ！\nがんばったことを送ってね😊"
+# 進捗の保存を試みる回数（保存できないまま次を送ると、再実行時に同じ宛先へ二重に送る）
+CHECKPOINT_SAVE_ATTEMPTS = 3
+CHECKPOINT_RETRY_INTERVAL = 1.0
+
+
+def save_checkpoint(supabase: SupabaseService, run_key: str, cursor: str, processed: int,
+                    completed: bool = False):
+    """
+    送信済みの位置を保存（失敗したら間を空けて再試行し、それでも失敗したら中断する）
+
+    Args:
+        supabase: Supabase操作サービス
+        run_key: 実行単位のキー
+        cursor: 送信済みの最後の宛先
+        processed: 送信済み件数
+        completed: 配信が完了した場合True
+
+    Raises:
+        RuntimeError: 保存できなかった
+    """
+    for attempt in range(1, CHECKPOINT_SAVE_ATTEMPTS + 1):
+        if supabase.save_job_checkpoint(JOB_NAME, run_key, cursor, processed, completed):
+            return
+        logger.warning("進捗の保存に失敗: %s（%s/%s回目）", cursor, attempt, CHECKPOINT_SAVE_ATTEMPTS)
+        if attempt < CHECKPOINT_SAVE_ATTEMPTS:
+            time.sleep(CHECKPOINT_RETRY_INTERVAL)
+    raise RuntimeError(f"{cursor} までの送信済み位置を保存できませんでした（二重送信を防ぐため中断します）")
+
+
+def run_reminder(supabase: SupabaseService, sender: MulticastSender, timezone: str = None,
+                 page_size: int = 5000, dry_run: bool = False) -> int:
+    """
+    リマインドを配信
+
+    Args:
+        supabase: Supabase操作サービス
+        sender: マルチキャスト送信
+        timezone: 対象の家庭のタイムゾーン（省略時は全家庭）
+        page_size: 1回に取得する宛先数
+        dry_run: Trueなら送信せず件数だけ数える
+
+    Returns:
+        送信した宛先数（再開時は前回分を含む）
+    """
+    run_key = f"{local_today(timezone)}:{timezone or 'all'}"
+    checkpoint = supabase.get_job_checkpoint(JOB_NAME, run_key) or {'cursor': None, 'processed': 0}
+    if checkpoint.get('completed'):
+        logger.info("本日の配信は完了済み: %s", run_key)
+        return checkpoint['processed']
+
+    cursor = checkpoint['cursor']
+    processed = checkpoint['processed']
+    if cursor:
+        logger.info("前回の続きから配信: %s 以降（送信済み %s件）", cursor, processed)
+
+    while True:
+        recipients = supabase.get_reminder_recipients(cursor, page_size, timezone)
+        if recipients is None:
+            raise RuntimeError("配信対象の取得に失敗しました")
+
+        for start in range(0, len(recipients), MULTICAST_MAX_RECIPIENTS):
+            batch = recipients[start:start + MULTICAST_MAX_RECIPIENTS]
+            if dry_run:
+                processed += len(batch)
+            else:
+                sent = sender.send(batch, REMINDER_TEXT)
+                if sent < len(batch):
+                    raise RuntimeError(f"{batch[0]} からの送信に失敗しました（再実行で再開できます）")
+                processed += sent
+                # バッチごとに送信済みの位置を保存（保存できるまで次のバッチは送らない）
+                save_checkpoint(supabase, run_key, batch[-1], processed)
+            cursor = batch[-1]
+
+        if len(recipients) < page_size:
+            break
+
+    if not dry_run:
+        save_checkpoint(supabase, run_key, cursor, processed, completed=True)
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="夕方のリマインド配信")
+    parser.add_argument('--timezone', help="対象の家庭のタイムゾーン（省略時は全家庭）")
+    parser.add_argument('--page-size', type=int, default=5000, help="1回に取得する宛先数")
+    parser.add_argument('--rate', type=float, default=Config.LINE_MULTICAST_RATE,
+                        help="1秒あたりのマルチキャスト呼び出し数")
+    parser.add_argument('--dry-run', action='store_true', help="送信せずに対象数だけ表示")
+    args = parser.parse_args()
+
+    configuration = Configuration(
+        host=Config.LINE_API_ENDPOINT,
+        access_token=Config.LINE_CHANNEL_ACCESS_TOKEN
+    )
+
+    try:
+        total = run_reminder(
+            SupabaseService(),
+            MulticastSender(configuration, rate=args.rate),
+            args.timezone, args.page_size, args.dry_run
+        )
+    except RuntimeError as e:
+        logger.error("リマインド配信エラー: %s", e)
+        sys.exit(1)
+
+    logger.info("リマインド配信完了: %s件%s", total, '（dry-run）' if args.dry_run else '')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+データソース（リポジトリ）の共通インターフェース
+
+Bot のメッセージ処理と app.py はこのインターフェースだけを使い、
+DATA_SOURCE でどの実装を使うかを切り替える
+- 'supabase': SupabaseService（デフォルト）
+- 'sheets': SheetsService（v1互換。家庭・子どもは1つずつとして振る舞う）
+- 'memory': MemoryRepository（プロセス内のデータ + WAL。小規模な自前運用・ベンチマーク用）
+
+各メソッドの戻り値の約束（SupabaseService に合わせる）
+- 取得エラー時は None（「該当なし」の空リスト・{} と区別する）。ただし get_children はエラーでも []
+- 書き込みの成否は bool
+- バックエンド障害は resilience.BackendUnavailableError を送出してよい
+"""
+from typing import Optional, Protocol, runtime_checkable
+
+from config import Config
+from models import Family, LineUserLink, Child
+from resilience import BackendPolicy
+
+
+@runtime_checkable
+class Repository(Protocol):
+    """Bot が使うデータ操作"""
+
+    # 呼び出しポリシー（app.py が遮断中かどうかを見る）
+    policy: BackendPolicy
+
+    def _connect(self):
+        """接続を作り直す（fork 後のワーカーで呼ばれる）"""
+
+    # --- LINEユーザーと家庭 ---
+
+    def get_line_user_link(self, line_user_id: str) -> Optional[LineUserLink]:
+        """LINEユーザーの紐付け（家庭といつもの子ども）"""
+
+    def get_family_by_line_user(self, line_user_id: str) -> Optional[Family]:
+        """LINEユーザーが紐付いた家庭"""
+
+    def link_line_user_to_family(self, line_user_id: str, family_share_code: str) -> bool:
+        """共有コードの家庭にLINEユーザーを紐付ける"""
+
+    def set_default_child(self, line_user_id: str, child_id: str) -> bool:
+        """LINEユーザーのいつもの子どもを設定"""
+
+    def get_line_user_ids(self, family_id: str) -> list:
+        """家庭に紐付いたLINEユーザーID（通知先）"""
+
+    # --- 子ども・行動・目標 ---
+
+    def get_children(self, family_id: str) -> list:
+        """家庭の子ども [Child, ...]（登録順）"""
+
+    def get_child(self, child_id: str) -> Optional[Child]:
+        """子ども（最新のポイント）"""
+
+    def get_actions(self, family_id: str, include_inactive: bool = False) -> list:
+        """家庭の行動マスタ [Action, ...]"""
+
+    def get_goals(self, family_id: str) -> Optional[list]:
+        """家庭の未達成の目標 [Goal, ...]"""
+
+    # --- 記録とポイント ---
+
+    def add_record(self, child_id: str, action_id: str, points: int) -> bool:
+        """行動記録を追加"""
+
+    def add_records_bulk(self, records: list) -> bool:
+        """行動記録をまとめて追加（全件に id があれば再送しても重複しない）"""
+
+    def update_child_points(self, child_id: str, points_to_add: int, reward_threshold: int = 100) -> Optional[dict]:
+        """ポイントを加算 → {'total_points', 'cycle_points', 'reward_achieved'}"""
+
+    def undo_last_record(self, child_id: str, reward_threshold: int = 100) -> Optional[dict]:
+        """最新の LINE からの記録を取り消す（取り消す記録がなければ {}）"""
+
+    def get_today_summary(self, child_id: str, timezone: str = None) -> Optional[dict]:
+        """今日の記録サマリー {'total_points': int, 'actions': {'行動名': 回数}}"""
+
+    def get_family_points(self, family_id: str, timezone: str = None) -> Optional[list]:
+        """家庭の子ども全員の 今日・周回・累計ポイント [ChildPoints, ...]"""
+
+    def get_share_view(self, share_code: str, recent_limit: int = 10) -> Optional[dict]:
+        """共有URLの表示データ（共有コードが見つからなければ {}）"""
+
+    def get_family_records_page(self, family_id: str, after: tuple = None, limit: int = 1000) -> Optional[list]:
+        """家庭の記録を (recorded_at, id) 順に1ページ（records_export.EXPORT_FIELDS の列）"""
+
+
+def create_repository(source: str = None) -> Repository:
+    """
+    DATA_SOURCE に対応するリポジトリを作成
+
+    Args:
+        source: 'supabase' / 'sheets' / 'memory'（省略時は Config.DATA_SOURCE）
+
+    Returns:
+        Repository
+    """
+    source = source or Config.DATA_SOURCE
+    # 使わないバックエンドのライブラリは読み込まない
+    if source == 'supabase':
+        from supabase_service import SupabaseService
+        return SupabaseService()
+    if source == 'sheets':
+        from sheets_service import SheetsService
+        return SheetsService()
+    if source == 'memory':
+        from memory_repository import MemoryRepository
+        return MemoryRepository()
+    raise ValueError(f"DATA_SOURCE が不正です: {source}")
+
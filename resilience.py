@@ -0,0 +1,250 @@
+"""
+バックエンド呼び出しの耐障害性を担当するモジュール
+タイムアウト・ジッター付きリトライ（リトライ予算つき）・サーキットブレーカーを提供する
+"""
+import time
+import random
+import logging
+import threading
+
+import metrics
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# サーキットブレーカーの状態
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# メトリクス出力用の数値（0: 正常, 1: 遮断中, 2: 試行中）
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_OPEN: 1, STATE_HALF_OPEN: 2}
+
+metrics.describe('backend_circuit_state', "サーキットブレーカーの状態（0: closed, 1: open, 2: half_open）")
+metrics.describe('backend_calls_total', "バックエンド呼び出し回数（結果別）")
+metrics.describe('backend_retries_total', "バックエンド呼び出しのリトライ回数")
+metrics.describe('backend_short_circuits_total', "ブレーカー遮断中に即時失敗させた回数")
+
+
+class BackendUnavailableError(Exception):
+    """バックエンドが利用できない（ブレーカー遮断中・リトライ上限到達）"""
+
+    def __init__(self, backend: str, message: str = ''):
+        super().__init__(message or f"{backend} は現在利用できません")
+        self.backend = backend
+
+
+class CircuitBreaker:
+    """
+    バックエンドごとのサーキットブレーカー
+
+    連続失敗が閾値を超えると open になり、recovery_timeout の間は呼び出しを
+    即時失敗させる。経過後は half_open で1件だけ試行し、成功すれば closed に戻る
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        """現在の状態（recovery_timeout 経過後は half_open を返す）"""
+        with self._lock:
+            if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return STATE_HALF_OPEN
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """呼び出しを遮断中ならTrue"""
+        return self.state == STATE_OPEN
+
+    def allow_request(self) -> bool:
+        """呼び出しを許可するか判定"""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+
+            if self._state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    return False
+                self._set_state(STATE_HALF_OPEN)
+
+            # half_open: 同時に1件だけ試行させる
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """成功を記録"""
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self._state != STATE_CLOSED:
+                logger.info("サーキットブレーカー復旧: %s", self.name)
+                self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        """失敗を記録"""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    logger.warning("サーキットブレーカー遮断: %s (連続失敗 %s回)", self.name, self._failures)
+                self._opened_at = time.monotonic()
+                self._set_state(STATE_OPEN)
+
+    def _set_state(self, state: str):
+        self._state = state
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('backend_circuit_state', _STATE_VALUES[self._state], {'backend': self.name})
+
+
+class RetryBudget:
+    """
+    リトライ予算
+
+    成功した呼び出しごとに ratio 分のトークンを貯め、リトライ1回ごとに1トークン消費する。
+    障害時にリトライが通常の呼び出し数の ratio 倍を超えて増幅しないようにする
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """呼び出し1回分のトークンを貯める"""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """リトライ1回分のトークンを取り出す（不足ならFalse）"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class BackendPolicy:
+    """
+    バックエンド1つ分の呼び出しポリシー
+
+    1回ごとのタイムアウトはクライアント側（httpx / requests / urllib3）に設定し、
+    ここではリトライを含めた全体の期限・ジッター付きバックオフ・ブレーカーを扱う
+    """
+
+    def __init__(self, name: str, is_failure=None):
+        """
+        初期化
+
+        Args:
+            name: バックエンド名（'supabase', 'sheets', 'line'）
+            is_failure: 例外がバックエンド障害か判定する関数（省略時はすべて障害扱い）
+        """
+        self.name = name
+        self.is_failure = is_failure or (lambda e: True)
+        self.timeout = Config.BACKEND_TIMEOUT
+        self.total_timeout = Config.BACKEND_TOTAL_TIMEOUT
+        self.max_attempts = Config.BACKEND_MAX_ATTEMPTS
+        self.base_delay = Config.BACKEND_RETRY_BASE_DELAY
+        self.max_delay = Config.BACKEND_RETRY_MAX_DELAY
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=Config.BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=Config.BREAKER_RECOVERY_TIMEOUT
+        )
+        self.budget = RetryBudget(Config.RETRY_BUDGET_RATIO, Config.RETRY_BUDGET_MAX_TOKENS)
+
+    def call(self, func, *args, idempotent: bool = True, **kwargs):
+        """
+        ポリシーを適用して関数を呼び出す
+
+        Args:
+            func: 呼び出す関数
+            idempotent: 冪等な呼び出しならTrue（False の場合はリトライしない）
+
+        Returns:
+            関数の戻り値
+
+        Raises:
+            BackendUnavailableError: ブレーカー遮断中
+            Exception: 関数が送出した例外（リトライ上限到達時）
+        """
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow_request():
+                metrics.inc('backend_short_circuits_total', {'backend': self.name})
+                raise BackendUnavailableError(self.name)
+
+            attempt += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_failure(e):
+                    # バックエンドは応答している（4xx等）のでブレーカーには数えない
+                    self.breaker.record_success()
+                    metrics.inc('backend_calls_total', {'backend': self.name, 'outcome': 'client_error'})
+                    raise
+
+                self.breaker.record_failure()
+                metrics.inc('backend_calls_total', {'backend': self.name, 'outcome': 'failure'})
+
+                delay = self._backoff(attempt)
+                if (
+                    not idempotent
+                    or attempt >= self.max_attempts
+                    or time.monotonic() + delay >= deadline
+                    or not self.budget.try_withdraw()
+                ):
+                    raise
+
+                logger.warning("%s 呼び出し失敗、%.2f秒後にリトライ (%s/%s): %s", self.name, delay, attempt, self.max_attempts, e)
+                metrics.inc('backend_retries_total', {'backend': self.name})
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.budget.deposit()
+            metrics.inc('backend_calls_total', {'backend': self.name, 'outcome': 'success'})
+            return result
+
+    def _backoff(self, attempt: int) -> float:
+        """フルジッター付き指数バックオフの待ち時間"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(name: str, is_failure=None) -> BackendPolicy:
+    """
+    バックエンド名に対応するポリシーを取得（プロセス内で共有）
+
+    Args:
+        name: バックエンド名
+        is_failure: 初回作成時に使う障害判定関数
+
+    Returns:
+        BackendPolicy
+    """
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = BackendPolicy(name, is_failure)
+        return _policies[name]
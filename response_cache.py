@@ -0,0 +1,126 @@
+"""
+読み取り専用コマンド（今日のポイント・ごほうび）用のキャッシュ
+
+子どもごとに「今日の記録サマリー」「ポイント」をキャッシュし、
+その子どもへの記録・取り消しのたびに世代を進めて無効にする。
+エントリは家庭のタイムゾーンの0時で切れる（「今日」が変わるため）
+
+世代カウンターは fork 前に確保した共有メモリに置くため、gunicorn の
+別ワーカーで記録された場合も無効になる（preload_app=True が前提）。
+カウンターは子どもIDのハッシュで共有するので、衝突しても無効化が増えるだけ
+"""
+import mmap
+import time
+import zlib
+import threading
+import multiprocessing
+
+import metrics
+from config import Config
+
+metrics.describe('response_cache_hits_total', "読み取りキャッシュのヒット数")
+metrics.describe('response_cache_misses_total', "読み取りキャッシュのミス数")
+
+_COUNTER_SIZE = 8
+
+
+class SharedGenerations:
+    """ワーカープロセス間で共有する世代カウンター"""
+
+    def __init__(self, slots: int = None):
+        """
+        初期化（gunicorn のマスターで fork 前に作成すること）
+
+        Args:
+            slots: カウンターの数
+        """
+        self.slots = slots or Config.RESPONSE_CACHE_SLOTS
+        self._memory = mmap.mmap(-1, self.slots * _COUNTER_SIZE)
+        self._counters = memoryview(self._memory).cast('Q')
+        self._lock = multiprocessing.Lock()
+
+    def _slot(self, key: str) -> int:
+        # hash() はプロセスごとに値が変わりうるため crc32 を使う
+        return zlib.crc32(key.encode()) % self.slots
+
+    def get(self, key: str) -> int:
+        """現在の世代"""
+        return self._counters[self._slot(key)]
+
+    def bump(self, key: str):
+        """世代を進める（それ以前に作られたエントリを無効にする）"""
+        slot = self._slot(key)
+        with self._lock:
+            self._counters[slot] += 1
+
+
+class ReadCache:
+    """世代と有効期限つきのキャッシュ"""
+
+    def __init__(self, generations: SharedGenerations = None, max_entries: int = None):
+        """
+        初期化
+
+        Args:
+            generations: 世代カウンター（省略時はプロセス共通のもの）
+            max_entries: 保持するエントリ数の上限（超えたら古いものから捨てる）
+        """
+        self.generations = generations or shared_generations
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def generation(self, key: str) -> int:
+        """
+        現在の世代（バックエンドから読む前に取得して put に渡す）
+
+        読む前に取得しておくことで、読み取り中に別の書き込みがあった場合は
+        put したエントリが最初から無効になる
+        """
+        return self.generations.get(key)
+
+    def get(self, key: str, kind: str):
+        """
+        キャッシュを取得
+
+        Args:
+            key: 子どもID等
+            kind: 値の種類（'today' / 'points' 等）
+
+        Returns:
+            値（ないか無効なら None）
+        """
+        with self._lock:
+            entry = self._entries.get((key, kind))
+        if entry is not None:
+            generation, expires_at, value = entry
+            if generation == self.generations.get(key) and time.time() < expires_at:
+                metrics.inc('response_cache_hits_total', {'kind': kind})
+                return value
+        metrics.inc('response_cache_misses_total', {'kind': kind})
+        return None
+
+    def put(self, key: str, kind: str, value, generation: int, expires_at: float):
+        """
+        キャッシュに保存
+
+        Args:
+            key: 子どもID等
+            kind: 値の種類
+            value: 値（共有されるため変更しないこと）
+            generation: 読む前に generation() で取得した世代
+            expires_at: 有効期限（UNIX時刻）
+        """
+        with self._lock:
+            self._entries.pop((key, kind), None)
+            self._entries[(key, kind)] = (generation, expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+
+    def invalidate(self, key: str):
+        """key のエントリをすべてのワーカーで無効にする"""
+        self.generations.bump(key)
+
+
+# import 時（gunicorn のマスター）に作成し、fork したワーカーで共有する
+shared_generations = SharedGenerations()
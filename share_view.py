@@ -0,0 +1,118 @@
+"""
+共有URL（/view/[shareCode]）の表示データのキャッシュ
+
+共有URLは祖父母のグループLINE等で回覧され、同じ家庭に閲覧が集中する。
+表示データは記録が書かれたときにしか変わらないため、共有コードごとに
+JSON を組み立てた状態でキャッシュし、ETag で再検証させる
+
+- 記録・取り消しのたびに Bot が invalidate(family_id) で世代を進める（全ワーカーで無効になる）
+- Webアプリでの編集（名前・目標・ポイント修正）は Bot から無効にできないため、
+  SHARE_VIEW_CACHE_TTL 秒で読み直す。「今日」が変わるため家庭のタイムゾーンの0時でも切れる
+- ETag は組み立てた JSON のハッシュ。If-None-Match が一致すれば本文を返さない（304）
+"""
+import json
+import time
+import hashlib
+import threading
+
+import metrics
+from config import Config
+from response_cache import ReadCache, shared_generations
+from timezone_util import next_local_midnight
+
+metrics.describe('share_view_not_modified_total', "共有ビューで 304 を返した回数")
+
+# ReadCache の値の種類（メトリクスのラベルになるため共有コードは入れない）
+CACHE_KIND = 'share_view'
+
+
+def cache_key(family_id: str) -> str:
+    """家庭の共有ビューの世代キー"""
+    return f'share_view:{family_id}'
+
+
+def invalidate(family_id: str):
+    """家庭の共有ビューをすべてのワーカーで無効にする（記録・取り消しの後に呼ぶ）"""
+    shared_generations.bump(cache_key(family_id))
+
+
+class ShareView:
+    """組み立て済みの共有ビュー"""
+
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # 引用符なしの値（応答では Response.set_etag で付ける）
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+
+
+class ShareViewCache:
+    """共有コードごとの ShareView のキャッシュ"""
+
+    def __init__(self, ttl: float = None, max_codes: int = None):
+        """
+        初期化
+
+        Args:
+            ttl: 読み直すまでの秒数
+            max_codes: 覚えておく共有コードの数の上限（超えたら古いものから捨てる）
+        """
+        self.ttl = ttl or Config.SHARE_VIEW_CACHE_TTL
+        self.max_codes = max_codes or Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.cache = ReadCache()
+        # 共有コード -> 家庭ID（世代を引くため。古くてもキャッシュが外れるだけ）
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def get(self, repository, share_code: str) -> ShareView:
+        """
+        共有ビューを取得（キャッシュが有効なら問い合わせない）
+
+        Args:
+            repository: データソース
+            share_code: 共有コード
+
+        Returns:
+            ShareView（共有コードが見つからなければ None）
+
+        Raises:
+            LookupError: 取得エラー
+        """
+        with self._lock:
+            known_family_id = self._families.get(share_code)
+        generation = None
+        if known_family_id is not None:
+            entry = self.cache.get(cache_key(known_family_id), CACHE_KIND)
+            # 共有コードが変更された家庭の古いコードには返さない
+            if entry is not None and entry[0] == share_code:
+                return entry[1]
+            # 読み取り中に記録された場合に備えて、読む前の世代で保存する
+            generation = self.cache.generation(cache_key(known_family_id))
+
+        data = repository.get_share_view(share_code)
+        if data is None:
+            raise LookupError("共有ビューの取得に失敗しました")
+        if not data:
+            return None
+
+        family_id = data['family_id']
+        if family_id != known_family_id:
+            # 初めての共有コードは読んだ後の世代になる（読み取り中の記録は TTL までに反映される）
+            generation = self.cache.generation(cache_key(family_id))
+        view = ShareView(json.dumps({
+            'reward_threshold': Config.REWARD_THRESHOLD,
+            'children': data['children'],
+            'goals': data['goals'],
+            'recent_records': data['recent_records'],
+        }, ensure_ascii=False, separators=(',', ':')).encode())
+
+        expires_at = min(time.time() + self.ttl, next_local_midnight(data.get('timezone')))
+        # 家庭の共有コードは1つなので家庭ごとに1件（世代も家庭単位で進む）
+        self.cache.put(cache_key(family_id), CACHE_KIND, (share_code, view), generation, expires_at)
+        with self._lock:
+            self._families.pop(share_code, None)
+            self._families[share_code] = family_id
+            while len(self._families) > self.max_codes:
+                self._families.pop(next(iter(self._families)))
+        return view
@@ -0,0 +1,232 @@
+"""
+Google Sheets API の呼び出しを割り当て（クォータ）に合わせて調整するモジュール
+
+Sheets API は1分あたりの読み取り・書き込み回数に上限があり、超えると 429 を返す。
+SheetsService のすべての呼び出しをこのスケジューラーに通し、
+- 読み取り・書き込みそれぞれのトークンバケットで送信間隔を調整する
+  （割り当てはサービスアカウント単位で全ワーカーが分け合うため、バケットはワーカーごとに
+  SHEETS_*_PER_MINUTE / WEB_CONCURRENCY の速さにする）
+- 429 を受けたら全体を一時停止し、再開時は書き込みを読み取りより先に通す
+- 同じシートへの同じ読み取りは、実行中のものに相乗りする（そのシートへの書き込み後に
+  始まった読み取りは相乗りしない）。完了した結果は使い回さない（別のワーカーの書き込みを
+  知る方法がないため）
+- 書き込みの元になる読み取り（読み取り→計算→書き込み）は coalesce=False で相乗りもしない
+"""
+import time
+import random
+import logging
+import threading
+
+import gspread
+
+import metrics
+from config import Config
+from rate_limit import TokenBucket
+from resilience import BackendUnavailableError
+
+logger = logging.getLogger(__name__)
+
+READ = 'read'
+WRITE = 'write'
+
+# 429 が続いたときの一時停止の上限（秒）
+MAX_PAUSE = 60
+
+metrics.describe('sheets_requests_total', "Sheets API の呼び出し数（読み取り/書き込み別）")
+metrics.describe('sheets_coalesced_reads_total', "実行中の読み取りに相乗りして省略した読み取り数")
+metrics.describe('sheets_rate_limited_total', "Sheets API から 429 を受けた回数")
+metrics.describe('sheets_quota_wait_timeouts_total', "割り当ての空き待ちがタイムアウトした回数")
+
+
+class QuotaWaitTimeout(BackendUnavailableError):
+    """割り当ての空きを待ちきれなかった"""
+
+    def __init__(self, kind: str):
+        super().__init__('sheets', f"Sheets API の{kind}割り当ての空きを待ちきれませんでした")
+        self.kind = kind
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """429（割り当て超過）か判定"""
+    return isinstance(error, gspread.exceptions.APIError) and error.response.status_code == 429
+
+
+class _Flight:
+    """実行中の読み取り（相乗りする呼び出しは完了を待つ）"""
+
+    __slots__ = ('generation', 'done', 'result', 'error')
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SheetsScheduler:
+    """Sheets API 呼び出しのスケジューラー（プロセス内で共有）"""
+
+    def __init__(self, read_per_minute: float = None, write_per_minute: float = None,
+                 max_wait: float = None):
+        """
+        初期化
+
+        Args:
+            read_per_minute: このプロセスの1分あたりの読み取り回数の上限
+                （省略時は SHEETS_READ_PER_MINUTE をワーカー数で割った値）
+            write_per_minute: このプロセスの1分あたりの書き込み回数の上限
+                （省略時は SHEETS_WRITE_PER_MINUTE をワーカー数で割った値）
+            max_wait: 割り当ての空きを待つ最大秒数
+        """
+        read_per_minute = read_per_minute or Config.SHEETS_READ_PER_MINUTE / Config.WEB_CONCURRENCY
+        write_per_minute = write_per_minute or Config.SHEETS_WRITE_PER_MINUTE / Config.WEB_CONCURRENCY
+        # 1分の割り当てを一気に使い切らないよう、バーストは10秒分までにする
+        self.buckets = {
+            READ: TokenBucket(read_per_minute / 60, capacity=max(1, read_per_minute / 6)),
+            WRITE: TokenBucket(write_per_minute / 60, capacity=max(1, write_per_minute / 6)),
+        }
+        self.max_wait = max_wait or Config.BACKEND_TOTAL_TIMEOUT
+
+        self._cond = threading.Condition()
+        self._pending_writes = 0
+        self._paused_until = 0.0
+        self._rate_limited_streak = 0
+        self._generations = {}
+        self._inflight = {}
+
+    def read(self, sheet: str, func, *args, coalesce: bool = True, **kwargs):
+        """
+        読み取りを実行（同じ読み取りが実行中なら結果を共有する）
+
+        Args:
+            sheet: 対象のシート名（書き込みによる無効化の単位）
+            func: gspread のメソッド
+            coalesce: False なら相乗りせずに読む（結果を書き込みに使う場合）
+
+        Returns:
+            呼び出し結果（共有されるため変更しないこと）
+        """
+        if not coalesce:
+            return self._run(READ, func, *args, **kwargs)
+
+        key = (sheet, getattr(func, '__name__', repr(func)), args, tuple(sorted(kwargs.items())))
+
+        with self._cond:
+            generation = self._generations.get(sheet, 0)
+            flight = self._inflight.get(key)
+            leader = flight is None or flight.generation != generation
+            if leader:
+                flight = _Flight(generation)
+                self._inflight[key] = flight
+
+        if not leader:
+            metrics.inc('sheets_coalesced_reads_total')
+            if not flight.done.wait(self.max_wait):
+                metrics.inc('sheets_quota_wait_timeouts_total')
+                raise QuotaWaitTimeout(READ)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._run(READ, func, *args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._cond:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.done.set()
+
+    def write(self, sheet: str, func, *args, **kwargs):
+        """
+        書き込みを実行（以降に始まる読み取りは、実行中の読み取りに相乗りしない）
+
+        Args:
+            sheet: 対象のシート名
+            func: gspread のメソッド
+
+        Returns:
+            呼び出し結果
+        """
+        self._invalidate(sheet)
+        try:
+            return self._run(WRITE, func, *args, **kwargs)
+        finally:
+            # 書き込み中に始まった読み取りの結果も古い可能性がある
+            self._invalidate(sheet)
+
+    def _invalidate(self, sheet: str):
+        with self._cond:
+            self._generations[sheet] = self._generations.get(sheet, 0) + 1
+
+    def _run(self, kind: str, func, *args, **kwargs):
+        """割り当ての空きを待ってから呼び出す"""
+        give_up_at = time.monotonic() + self.max_wait
+        self._admit(kind, give_up_at)
+        if not self.buckets[kind].acquire(timeout=max(0, give_up_at - time.monotonic())):
+            metrics.inc('sheets_quota_wait_timeouts_total')
+            raise QuotaWaitTimeout(kind)
+
+        metrics.inc('sheets_requests_total', {'kind': kind})
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limited(e):
+                self._on_rate_limited(kind, e)
+            raise
+
+        with self._cond:
+            self._rate_limited_streak = 0
+        return result
+
+    def _admit(self, kind: str, give_up_at: float):
+        """一時停止中なら再開まで待つ（書き込みが待っている間は読み取りを通さない）"""
+        with self._cond:
+            if kind == WRITE:
+                self._pending_writes += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    paused = now < self._paused_until
+                    if not paused and (kind == WRITE or not self._pending_writes):
+                        return
+                    remaining = give_up_at - now
+                    if remaining <= 0:
+                        metrics.inc('sheets_quota_wait_timeouts_total')
+                        raise QuotaWaitTimeout(kind)
+                    self._cond.wait(min(remaining, self._paused_until - now) if paused else remaining)
+            finally:
+                if kind == WRITE:
+                    self._pending_writes -= 1
+                    self._cond.notify_all()
+
+    def _on_rate_limited(self, kind: str, error: Exception):
+        """429 を受けたら全体を一時停止し、そのバケットのトークンも減らす"""
+        retry_after = error.response.headers.get('Retry-After') if error.response is not None else None
+        with self._cond:
+            self._rate_limited_streak += 1
+            if retry_after and retry_after.isdigit():
+                pause = float(retry_after)
+            else:
+                pause = random.uniform(0.5, 1.0) * min(MAX_PAUSE, 2 ** self._rate_limited_streak)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._cond.notify_all()
+        self.buckets[kind].penalize(pause)
+        metrics.inc('sheets_rate_limited_total', {'kind': kind})
+        logger.warning("Sheets API の割り当て超過（%s）: %.1f秒停止", kind, pause)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> SheetsScheduler:
+    """プロセス内で共有するスケジューラーを取得（割り当てのうちこのワーカーの取り分を使う）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SheetsScheduler()
+        return _scheduler
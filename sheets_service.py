@@ -1,12 +1,20 @@
 """
 Google Sheets API との連携を担当するモジュール
+
+v1 のスプレッドシートには家庭・子どもが1つずつしかない。repository.Repository として使う場合は、
+すべての LINE ユーザーが SHEETS_FAMILY に紐付き、子どもは Config.DEFAULT_CHILD_ID だけの家庭として振る舞う
 """
 import gspread
+import requests
 from google.oauth2.service_account import Credentials
 from datetime import datetime
 import logging
+import threading
 
-from config import Config
+from config import Config, ACTION_MASTER
+from models import Family, LineUserLink, Child, ChildPoints, Action
+from resilience import get_policy
+from sheets_scheduler import get_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +24,19 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
+# スプレッドシート全体を表す家庭（/export/records の family_id の検証を通るよう UUID の形にする）
+SHEETS_FAMILY = Family(id='00000000-0000-0000-0000-000000000000')
+
+
+def _is_backend_failure(error: Exception) -> bool:
+    """通信エラー・タイムアウト・429・5xx をバックエンド障害とみなす"""
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
 
 class SheetsService:
     """Google Sheets操作クラス"""
@@ -24,6 +45,11 @@ class SheetsService:
         """初期化: Google Sheets APIクライアントを設定"""
         self.client = None
         self.spreadsheet = None
+        self.policy = get_policy('sheets', _is_backend_failure)
+        self.scheduler = get_scheduler()
+        self._worksheets = {}
+        # ポイントの読み取り→計算→書き込みをプロセス内で1つずつにする
+        self._points_lock = threading.Lock()
         self._connect()
 
     def _connect(self):
@@ -38,12 +64,52 @@ class SheetsService:
                 scopes=SCOPES
             )
             self.client = gspread.authorize(credentials)
-            self.spreadsheet = self.client.open_by_key(Config.SPREADSHEET_ID)
+            self.client.set_timeout(Config.BACKEND_TIMEOUT)
+            self._worksheets = {}
+            self.spreadsheet = self._call(self.client.open_by_key, Config.SPREADSHEET_ID)
             logger.info("Google Sheetsに接続しました")
         except Exception as e:
-            logger.error(f"Google Sheets接続エラー: {e}")
+            logger.error("Google Sheets接続エラー: %s", e)
             raise
 
+    def _call(self, func, *args, sheet: str = None, idempotent: bool = True, coalesce: bool = True, **kwargs):
+        """
+        割り当ての調整（スケジューラー）とタイムアウト・リトライ・ブレーカーを適用して読み取りAPIを呼び出す
+
+        Args:
+            func: gspread のメソッド
+            sheet: 対象のシート名（同じシートへの実行中の読み取りにはまとめられる）
+            idempotent: 再送しても安全ならTrue
+            coalesce: False ならまとめずに読む（読んだ値を元に書き込む場合）
+
+        Returns:
+            呼び出し結果
+        """
+        return self.policy.call(self.scheduler.read, sheet, func, *args, idempotent=idempotent,
+                                coalesce=coalesce, **kwargs)
+
+    def _write(self, sheet: str, func, *args, idempotent: bool = False, **kwargs):
+        """
+        書き込みAPIを呼び出す（429 で一時停止した後は読み取りより先に送信される）
+
+        Args:
+            sheet: 対象のシート名
+            func: gspread のメソッド
+            idempotent: 再送しても安全ならTrue
+
+        Returns:
+            呼び出し結果
+        """
+        return self.policy.call(self.scheduler.write, sheet, func, *args, idempotent=idempotent, **kwargs)
+
+    def _worksheet(self, name: str):
+        """ワークシートを取得（シートの構成は変わらないため接続ごとに1回だけ問い合わせる）"""
+        worksheet = self._worksheets.get(name)
+        if worksheet is None:
+            worksheet = self._call(self.spreadsheet.worksheet, name)
+            self._worksheets[name] = worksheet
+        return worksheet
+
     def add_record(self, child_id: str, action: str, points: int, memo: str = '') -> bool:
         """
         行動記録を追加
@@ -58,7 +124,7 @@ class SheetsService:
             成功時True、失敗時False
         """
         try:
-            sheet = self.spreadsheet.worksheet(Config.SHEET_RECORDS)
+            sheet = self._worksheet(Config.SHEET_RECORDS)
             now = datetime.now()
             row = [
                 now.strftime('%Y-%m-%d'),  # date
@@ -68,11 +134,42 @@ class SheetsService:
                 points,                     # points
                 memo                        # memo
             ]
-            sheet.append_row(row)
-            logger.info(f"記録追加: {action} ({points}pt) for {child_id}")
+            self._write(Config.SHEET_RECORDS, sheet.append_row, row)
+            logger.info("記録追加: %s (%spt) for %s", action, points, child_id, extra={'event': 'record_added'})
+            return True
+        except Exception as e:
+            logger.error("記録追加エラー: %s", e)
+            return False
+
+    def add_records_bulk(self, records: list) -> bool:
+        """
+        行動記録をまとめて追加（1回のAPI呼び出しで追記）
+
+        Args:
+            records: [{'child_id': str, 'action_id': str（行動名）, 'points': int}, ...]
+
+        Returns:
+            成功時True、失敗時False
+        """
+        if not records:
+            return True
+
+        try:
+            sheet = self._worksheet(Config.SHEET_RECORDS)
+            now = datetime.now()
+            rows = [[
+                now.strftime('%Y-%m-%d'),
+                now.strftime('%H:%M:%S'),
+                record['child_id'],
+                record['action_id'],
+                record['points'],
+                ''
+            ] for record in records]
+            self._write(Config.SHEET_RECORDS, sheet.append_rows, rows)
+            logger.info("記録一括追加: %s件", len(rows), extra={'event': 'record_added'})
             return True
         except Exception as e:
-            logger.error(f"記録追加エラー: {e}")
+            logger.error("記録一括追加エラー: %s", e)
             return False
 
     def get_status(self, child_id: str) -> dict:
@@ -86,46 +183,52 @@ class SheetsService:
             {'total_points': int, 'cycle_points': int} or None
         """
         try:
-            sheet = self.spreadsheet.worksheet(Config.SHEET_STATUS)
-
-            # シートの全データを取得（ヘッダー含む）
-            all_values = sheet.get_all_values()
-
-            # ヘッダー行のみ、またはデータがない場合
-            if len(all_values) <= 1:
-                logger.info(f"ステータスが存在しないため新規作成: {child_id}")
+            status, row_number = self._read_status(child_id)
+            if row_number is None:
+                logger.info("child_id %s のステータスがないため新規作成", child_id)
                 self._create_status(child_id)
-                return {'total_points': 0, 'cycle_points': 0}
-
-            # ヘッダー行を除いてデータを検索
-            headers = all_values[0]
-            for row in all_values[1:]:
-                if len(row) >= 3 and row[0] == child_id:
-                    return {
-                        'total_points': int(row[1]) if row[1] else 0,
-                        'cycle_points': int(row[2]) if row[2] else 0
-                    }
-
-            # 該当するchild_idがない場合は新規作成
-            logger.info(f"child_id {child_id} が見つからないため新規作成")
-            self._create_status(child_id)
-            return {'total_points': 0, 'cycle_points': 0}
+            return status
         except Exception as e:
-            logger.error(f"ステータス取得エラー: {e}")
+            logger.error("ステータス取得エラー: %s", e)
             import traceback
             logger.error(traceback.format_exc())
             return None
 
+    def _read_status(self, child_id: str, coalesce: bool = True) -> tuple:
+        """
+        ステータスとその行番号を読み取る
+
+        Args:
+            child_id: 子どもID
+            coalesce: False なら実行中の読み取りにまとめずに読む（読んだ値を元に書き込む場合）
+
+        Returns:
+            ({'total_points': int, 'cycle_points': int}, 行番号)。行がなければ (0ポイント, None)
+        """
+        sheet = self._worksheet(Config.SHEET_STATUS)
+
+        # シートの全データを取得（ヘッダー含む）
+        all_values = self._call(sheet.get_all_values, sheet=Config.SHEET_STATUS, coalesce=coalesce)
+
+        # ヘッダー行を除いてデータを検索
+        for i, row in enumerate(all_values[1:], start=2):
+            if len(row) >= 3 and row[0] == child_id:
+                return {
+                    'total_points': int(row[1]) if row[1] else 0,
+                    'cycle_points': int(row[2]) if row[2] else 0
+                }, i
+        return {'total_points': 0, 'cycle_points': 0}, None
+
     def _create_status(self, child_id: str):
         """新規ステータス行を作成"""
         try:
-            sheet = self.spreadsheet.worksheet(Config.SHEET_STATUS)
-            sheet.append_row([child_id, 0, 0])
-            logger.info(f"新規ステータス作成: {child_id}")
+            sheet = self._worksheet(Config.SHEET_STATUS)
+            self._write(Config.SHEET_STATUS, sheet.append_row, [child_id, 0, 0])
+            logger.info("新規ステータス作成: %s", child_id)
         except Exception as e:
-            logger.error(f"ステータス作成エラー: {e}")
+            logger.error("ステータス作成エラー: %s", e)
 
-    def update_status(self, child_id: str, total_points: int, cycle_points: int) -> bool:
+    def update_status(self, child_id: str, total_points: int, cycle_points: int, row_number: int = None) -> bool:
         """
         ステータスを更新
 
@@ -133,53 +236,64 @@ class SheetsService:
             child_id: 子どもID
             total_points: 累計ポイント
             cycle_points: 周回ポイント
+            row_number: 直前に _read_status で読んだ行番号（省略時は読み直して探す）
 
         Returns:
             成功時True、失敗時False
         """
         try:
-            sheet = self.spreadsheet.worksheet(Config.SHEET_STATUS)
+            sheet = self._worksheet(Config.SHEET_STATUS)
+
+            if row_number is not None:
+                self._write(Config.SHEET_STATUS, sheet.update, f'B{row_number}:C{row_number}',
+                            [[total_points, cycle_points]], idempotent=True)
+                logger.info("ステータス更新: %s - total=%s, cycle=%s", child_id, total_points, cycle_points,
+                            extra={'event': 'points_updated'})
+                return True
 
-            # シートの全データを取得（ヘッダー含む）
-            all_values = sheet.get_all_values()
+            # シートの全データを取得（ヘッダー含む。行番号を決めるため他の読み取りにまとめない）
+            all_values = self._call(sheet.get_all_values, sheet=Config.SHEET_STATUS, coalesce=False)
 
             # ヘッダー行のみ、またはデータがない場合は新規作成
             if len(all_values) <= 1:
-                sheet.append_row([child_id, total_points, cycle_points])
-                logger.info(f"ステータス新規作成: {child_id} - total={total_points}, cycle={cycle_points}")
+                self._write(Config.SHEET_STATUS, sheet.append_row, [child_id, total_points, cycle_points])
+                logger.info("ステータス新規作成: %s - total=%s, cycle=%s", child_id, total_points, cycle_points)
                 return True
 
             # 既存のchild_idを検索
             for i, row in enumerate(all_values[1:], start=2):  # 2行目から開始
                 if len(row) >= 1 and row[0] == child_id:
-                    sheet.update_cell(i, 2, total_points)  # total_points
-                    sheet.update_cell(i, 3, cycle_points)  # cycle_points
-                    logger.info(f"ステータス更新: {child_id} - total={total_points}, cycle={cycle_points}")
+                    # total_points / cycle_points を1回の書き込みで更新（同じ値の再送は安全）
+                    self._write(Config.SHEET_STATUS, sheet.update, f'B{i}:C{i}', [[total_points, cycle_points]],
+                                idempotent=True)
+                    logger.info("ステータス更新: %s - total=%s, cycle=%s", child_id, total_points, cycle_points,
+                                extra={'event': 'points_updated'})
                     return True
 
             # 該当するchild_idがない場合は新規作成
-            sheet.append_row([child_id, total_points, cycle_points])
-            logger.info(f"ステータス新規追加: {child_id} - total={total_points}, cycle={cycle_points}")
+            self._write(Config.SHEET_STATUS, sheet.append_row, [child_id, total_points, cycle_points])
+            logger.info("ステータス新規追加: %s - total=%s, cycle=%s", child_id, total_points, cycle_points)
             return True
         except Exception as e:
-            logger.error(f"ステータス更新エラー: {e}")
+            logger.error("ステータス更新エラー: %s", e)
             import traceback
             logger.error(traceback.format_exc())
             return False
 
-    def get_today_records(self, child_id: str) -> list:
+    def get_today_records(self, child_id: str, timezone: str = None) -> list:
         """
         今日の記録を取得
 
         Args:
             child_id: 子どもID
+            timezone: 未使用（v1 の記録はサーバーの現地時刻で日付を付けている）
 
         Returns:
-            今日の記録リスト [{'action': str, 'points': int}, ...]
+            今日の記録リスト [{'action': str, 'points': int}, ...]（エラー時は None）
         """
         try:
-            sheet = self.spreadsheet.worksheet(Config.SHEET_RECORDS)
-            records = sheet.get_all_records()
+            sheet = self._worksheet(Config.SHEET_RECORDS)
+            records = self._call(sheet.get_all_records, sheet=Config.SHEET_RECORDS)
             today = datetime.now().strftime('%Y-%m-%d')
 
             today_records = []
@@ -192,23 +306,70 @@ class SheetsService:
 
             return today_records
         except Exception as e:
-            logger.error(f"今日の記録取得エラー: {e}")
-            return []
+            logger.error("今日の記録取得エラー: %s", e)
+            return None
+
+    def iter_records(self, start_row: int = 2, chunk_size: int = 500):
+        """
+        records シートを行範囲ごとに読み込んで1行ずつ返す（全件をメモリに載せない）
+
+        Args:
+            start_row: 読み込みを開始する行番号（1行目はヘッダー）
+            chunk_size: 1回のAPI呼び出しで読む行数
+
+        Yields:
+            (行番号, [date, time, child_id, action, points, memo])
+        """
+        sheet = self._worksheet(Config.SHEET_RECORDS)
+        row_number = start_row
+
+        while True:
+            end_row = row_number + chunk_size - 1
+            rows = self._call(sheet.get, f'A{row_number}:F{end_row}', sheet=Config.SHEET_RECORDS)
+
+            for offset, row in enumerate(rows):
+                yield row_number + offset, row
+
+            if len(rows) < chunk_size:
+                return
+            row_number = end_row + 1
 
-    def get_today_summary(self, child_id: str) -> dict:
+    def get_all_statuses(self) -> dict:
+        """
+        status シートの全行を取得
+
+        Returns:
+            {child_id: {'total_points': int, 'cycle_points': int}, ...}
+        """
+        sheet = self._worksheet(Config.SHEET_STATUS)
+        statuses = {}
+        for row in self._call(sheet.get_all_values, sheet=Config.SHEET_STATUS)[1:]:
+            if len(row) >= 3 and row[0]:
+                statuses[row[0]] = {
+                    'total_points': int(row[1]) if row[1] else 0,
+                    'cycle_points': int(row[2]) if row[2] else 0
+                }
+        return statuses
+
+    def get_today_summary(self, child_id: str, timezone: str = None) -> dict:
         """
         今日の記録サマリーを取得
 
         Args:
             child_id: 子どもID
+            timezone: 未使用（get_today_records を参照）
 
         Returns:
             {
                 'total_points': int,
                 'actions': {'行動名': 回数, ...}
             }
+            エラー時は None
         """
         records = self.get_today_records(child_id)
+        if records is None:
+            return None
+
         total_points = 0
         action_counts = {}
 
@@ -222,3 +383,208 @@ class SheetsService:
             'total_points': total_points,
             'actions': action_counts
         }
+
+    # --- repository.Repository としての操作（家庭・子どもは1つずつ） ---
+
+    def get_line_user_link(self, line_user_id: str) -> LineUserLink:
+        """すべての LINE ユーザーをスプレッドシートの家庭に紐付いているものとして扱う"""
+        return LineUserLink(family=SHEETS_FAMILY)
+
+    def get_family_by_line_user(self, line_user_id: str) -> Family:
+        """LINEユーザーが紐付いた家庭（常に SHEETS_FAMILY）"""
+        return SHEETS_FAMILY
+
+    def link_line_user_to_family(self, line_user_id: str, family_share_code: str) -> bool:
+        """紐付けは不要（すでに紐付いている扱い）"""
+        return False
+
+    def set_default_child(self, line_user_id: str, child_id: str) -> bool:
+        """子どもは1人のため切り替えない"""
+        return False
+
+    def get_line_user_ids(self, family_id: str) -> list:
+        """家族への通知先は持たない"""
+        return []
+
+    def get_children(self, family_id: str) -> list:
+        """
+        子どもリストを取得（Config.DEFAULT_CHILD_ID の1人だけ）
+
+        名前は空にする（返信に【名前】を付けない v1 の形式のまま）
+        """
+        return [Child(id=Config.DEFAULT_CHILD_ID, name='')]
+
+    def get_child(self, child_id: str) -> Child:
+        """
+        子ども情報を取得（ポイントは status シートから）
+
+        Args:
+            child_id: 子どもID
+
+        Returns:
+            子ども情報 or None
+        """
+        status = self.get_status(child_id)
+        if status is None:
+            return None
+        return Child(id=child_id, name='', total_points=status['total_points'], cycle_points=status['cycle_points'])
+
+    def get_actions(self, family_id: str, include_inactive: bool = False) -> list:
+        """
+        行動マスタを取得（config.ACTION_MASTER）
+
+        キーワードを Action.name、記録する行動名を Action.id にする
+        （メッセージはキーワードで判定し、records シートには行動名を書く）
+
+        Returns:
+            [Action, ...]
+        """
+        return [
+            Action(id=action_name, name=keyword, points=points)
+            for keyword, (action_name, points) in ACTION_MASTER.items()
+        ]
+
+    def get_goals(self, family_id: str) -> list:
+        """目標はスプレッドシートにないため常に空"""
+        return []
+
+    def update_child_points(self, child_id: str, points_to_add: int, reward_threshold: int = 100) -> dict:
+        """
+        ポイントを加算（周回ポイントが閾値に達したら閾値を引く）
+
+        Args:
+            child_id: 子どもID
+            points_to_add: 追加するポイント
+            reward_threshold: ごほうび達成に必要なポイント
+
+        Returns:
+            {'total_points': int, 'cycle_points': int, 'reward_achieved': bool} or None
+        """
+        with self._points_lock:
+            # 書き込む値の元になるため、他の読み取りの結果を使わずに読む
+            try:
+                status, row_number = self._read_status(child_id, coalesce=False)
+            except Exception as e:
+                logger.error("ステータス取得エラー: %s", e)
+                return None
+
+            total_points = status['total_points'] + points_to_add
+            cycle_points = status['cycle_points'] + points_to_add
+            reward_achieved = cycle_points >= reward_threshold
+            if reward_achieved:
+                cycle_points -= reward_threshold
+
+            if not self.update_status(child_id, total_points, cycle_points, row_number):
+                return None
+            return {'total_points': total_points, 'cycle_points': cycle_points, 'reward_achieved': reward_achieved}
+
+    def undo_last_record(self, child_id: str, reward_threshold: int = 100) -> dict:
+        """
+        子どもの最新の記録の行を削除してポイントを戻す
+
+        Args:
+            child_id: 子どもID
+            reward_threshold: ごほうび達成に必要なポイント
+
+        Returns:
+            {'record_id', 'action_name', 'points', 'total_points', 'cycle_points', 'reward_reverted'}
+            取り消す記録がない場合は {}、エラー時は None
+        """
+        with self._points_lock:
+            try:
+                sheet = self._worksheet(Config.SHEET_RECORDS)
+                # 削除する行番号と戻すポイントを決めるため、他の読み取りの結果を使わずに読む
+                rows = self._call(sheet.get_all_values, sheet=Config.SHEET_RECORDS, coalesce=False)
+                row_number = next((
+                    i for i in range(len(rows), 1, -1)
+                    if len(rows[i - 1]) >= 5 and rows[i - 1][2] == child_id
+                ), None)
+                if row_number is None:
+                    return {}
+
+                row = rows[row_number - 1]
+                points = int(row[4]) if row[4] else 0
+                status, status_row = self._read_status(child_id, coalesce=False)
+
+                # 再送すると別の行を消してしまうためリトライしない
+                self._write(Config.SHEET_RECORDS, sheet.delete_rows, row_number)
+                total_points = status['total_points'] - points
+                cycle_points = status['cycle_points'] - points
+                reward_reverted = cycle_points < 0
+                if reward_reverted:
+                    cycle_points += reward_threshold
+                if not self.update_status(child_id, total_points, cycle_points, status_row):
+                    return None
+
+                logger.info("記録取り消し: 行%s (%spt) child=%s", row_number, points, child_id)
+                return {
+                    'record_id': str(row_number),
+                    'action_name': row[3],
+                    'points': points,
+                    'total_points': total_points,
+                    'cycle_points': cycle_points,
+                    'reward_reverted': reward_reverted,
+                }
+            except Exception as e:
+                logger.error("記録取り消しエラー: %s", e)
+                return None
+
+    def get_family_points(self, family_id: str, timezone: str = None) -> list:
+        """
+        子どもの 今日・周回・累計ポイントを取得
+
+        Returns:
+            [ChildPoints] or None
+        """
+        child_id = Config.DEFAULT_CHILD_ID
+        status = self.get_status(child_id)
+        summary = self.get_today_summary(child_id)
+        if status is None or summary is None:
+            return None
+        return [ChildPoints(
+            id=child_id,
+            # get_children と同じく名前は空（v1 のスプレッドシートには子どもの名前がない）
+            name='',
+            today_points=summary['total_points'],
+            cycle_points=status['cycle_points'],
+            total_points=status['total_points']
+        )]
+
+    def get_share_view(self, share_code: str, recent_limit: int = 10) -> dict:
+        """スプレッドシートには共有コードがないため常に見つからない扱い"""
+        return {}
+
+    def get_family_records_page(self, family_id: str, after: tuple = None, limit: int = 1000) -> list:
+        """
+        records シートを行番号順に1ページ取得（行番号を記録のIDとする）
+
+        Args:
+            family_id: 家庭ID（未使用）
+            after: この (recorded_at, 行番号) より後から取得
+            limit: 1ページの件数
+
+        Returns:
+            records_export.EXPORT_FIELDS の列の dict のリスト or None
+        """
+        start_row = int(after[1]) + 1 if after else 2
+        try:
+            sheet = self._worksheet(Config.SHEET_RECORDS)
+            rows = self._call(sheet.get, f'A{start_row}:F{start_row + limit - 1}', sheet=Config.SHEET_RECORDS)
+        except Exception as e:
+            logger.error("記録エクスポート取得エラー: %s", e)
+            return None
+
+        page = []
+        for row_number, row in enumerate(rows, start=start_row):
+            date, time_str, child_id, action, points = (list(row) + [''] * 5)[:5]
+            page.append({
+                'id': row_number,
+                'recorded_at': f'{date}T{time_str}',
+                'local_date': date,
+                'child_id': child_id,
+                'child_name': '',
+                'action_name': action,
+                'points': int(points) if points else 0,
+                'source': 'line',
+            })
+        return page
@@ -0,0 +1,41 @@
+-- ポイント整合性チェック用の集計関数
+-- children を id 順にキーセットページングし、各子どもの records 合計をサーバー側で集計する
+-- （reconcile_points.py から呼び出す）
+
+create index if not exists records_child_id_idx on public.records (child_id);
+
+create or replace function public.child_record_totals(
+  p_after uuid default null,
+  p_limit integer default 500,
+  p_family_id uuid default null
+)
+returns table (
+  child_id uuid,
+  family_id uuid,
+  total_points integer,
+  cycle_points integer,
+  record_points bigint
+)
+language sql
+stable
+as $$
+  with page as (
+    select c.id, c.family_id, c.total_points, c.cycle_points
+    from public.children c
+    where (p_after is null or c.id > p_after)
+      and (p_family_id is null or c.family_id = p_family_id)
+    order by c.id
+    limit p_limit
+  )
+  select
+    p.id,
+    p.family_id,
+    p.total_points,
+    p.cycle_points,
+    coalesce((select sum(r.points) from public.records r where r.child_id = p.id), 0)
+  from page p
+  order by p.id
+$$;
+
+-- 管理用のため service_role のみ実行可能にする
+revoke execute on function public.child_record_totals(uuid, integer, uuid) from public, anon, authenticated;
@@ -0,0 +1,40 @@
+-- 家庭のタイムゾーンでの日付（local_date）を records に持たせる
+-- 「今日の記録」を (child_id, local_date) の完全一致で引けるようにする
+-- ※ records.recorded_at は timestamptz（Supabase の既定）を前提とする
+
+alter table public.families
+  add column if not exists timezone text not null default 'Asia/Tokyo';
+
+alter table public.records
+  add column if not exists local_date date;
+
+-- 挿入・記録日時の更新時に、子どもの家庭のタイムゾーンで local_date を設定する
+create or replace function public.set_record_local_date()
+returns trigger
+language plpgsql
+as $$
+begin
+  select (new.recorded_at at time zone f.timezone)::date
+    into new.local_date
+  from public.children c
+  join public.families f on f.id = c.family_id
+  where c.id = new.child_id;
+  return new;
+end;
+$$;
+
+drop trigger if exists records_set_local_date on public.records;
+create trigger records_set_local_date
+  before insert or update of recorded_at, child_id on public.records
+  for each row execute function public.set_record_local_date();
+
+-- 既存の記録を埋める
+update public.records r
+set local_date = (r.recorded_at at time zone f.timezone)::date
+from public.children c
+join public.families f on f.id = c.family_id
+where c.id = r.child_id
+  and r.local_date is null;
+
+create index if not exists records_child_local_date_idx
+  on public.records (child_id, local_date);
@@ -0,0 +1,50 @@
+-- 夕方のリマインド配信用
+-- 今日（家庭のタイムゾーン）まだ記録がない子どもがいる家庭の LINE ユーザーを1回の問い合わせで取得する
+
+create or replace function public.reminder_recipients(
+  p_after text default null,
+  p_limit integer default 5000,
+  p_timezone text default null
+)
+returns table (line_user_id text)
+language sql
+stable
+as $$
+  select distinct luf.line_user_id
+  from public.line_user_families luf
+  join public.families f on f.id = luf.family_id
+  where (p_after is null or luf.line_user_id > p_after)
+    and (p_timezone is null or f.timezone = p_timezone)
+    and exists (
+      select 1
+      from public.children c
+      where c.family_id = f.id
+        and not exists (
+          -- (child_id, local_date) インデックスで判定
+          select 1
+          from public.records r
+          where r.child_id = c.id
+            and r.local_date = (now() at time zone f.timezone)::date
+        )
+    )
+  order by luf.line_user_id
+  limit p_limit
+$$;
+
+revoke execute on function public.reminder_recipients(text, integer, text) from public, anon, authenticated;
+
+create index if not exists line_user_families_family_id_idx
+  on public.line_user_families (family_id);
+
+-- 定期ジョブの進捗（クラッシュ後に同じ日の配信を途中から再開する）
+create table if not exists public.job_checkpoints (
+  job_name text not null,
+  run_key text not null,
+  cursor text,
+  processed integer not null default 0,
+  completed boolean not null default false,
+  updated_at timestamptz not null default now(),
+  primary key (job_name, run_key)
+);
+
+alter table public.job_checkpoints enable row level security;
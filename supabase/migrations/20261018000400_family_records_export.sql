@@ -0,0 +1,52 @@
+-- 家庭の記録の全件エクスポート用
+-- (recorded_at, id) のキーセットで1ページずつ返す（records_export.py から呼び出す）
+-- 子どもごとに (child_id, recorded_at, id) インデックスの範囲を p_limit 件だけ読み、
+-- それらを並べ替えて先頭 p_limit 件を返すため、何ページ目でも読む行数は一定
+
+create index if not exists records_child_recorded_at_id_idx
+  on public.records (child_id, recorded_at, id);
+
+create or replace function public.family_records_page(
+  p_family_id uuid,
+  p_after_recorded_at timestamptz default null,
+  p_after_id uuid default null,
+  p_limit integer default 1000
+)
+returns table (
+  id uuid,
+  recorded_at timestamptz,
+  local_date date,
+  child_id uuid,
+  child_name text,
+  action_name text,
+  points integer,
+  source text
+)
+language sql
+stable
+as $$
+  select
+    r.id,
+    r.recorded_at,
+    r.local_date,
+    c.id,
+    coalesce(c.nickname, c.name),
+    a.name,
+    r.points,
+    r.source
+  from public.children c
+  cross join lateral (
+    select r.*
+    from public.records r
+    where r.child_id = c.id
+      and (p_after_recorded_at is null or (r.recorded_at, r.id) > (p_after_recorded_at, p_after_id))
+    order by r.recorded_at, r.id
+    limit p_limit
+  ) r
+  left join public.actions a on a.id = r.action_id
+  where c.family_id = p_family_id
+  order by r.recorded_at, r.id
+  limit p_limit
+$$;
+
+revoke execute on function public.family_records_page(uuid, timestamptz, uuid, integer) from public, anon, authenticated;
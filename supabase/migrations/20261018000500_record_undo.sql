@@ -0,0 +1,119 @@
+-- 「取り消し」用
+-- 子どもの最新の LINE からの記録を削除し、ポイントを戻す処理を1トランザクションで行う。
+-- 加算側も同じく children の行をロックして更新する関数にし、
+-- 取り消しと記録が同時に走ってもポイントがずれないようにする
+
+-- 最新の LINE からの記録を (child_id, recorded_at desc) で1件だけ引く
+create index if not exists records_child_line_recorded_at_idx
+  on public.records (child_id, recorded_at desc, id desc)
+  where source = 'line';
+
+-- ポイントを加算（周回ポイントが閾値に達したら閾値を引く）
+create or replace function public.add_child_points(
+  p_child_id uuid,
+  p_points integer,
+  p_reward_threshold integer
+)
+returns table (
+  total_points integer,
+  cycle_points integer,
+  reward_achieved boolean
+)
+language plpgsql
+as $$
+declare
+  v_total integer;
+  v_cycle integer;
+  v_achieved boolean := false;
+begin
+  select c.total_points + p_points, c.cycle_points + p_points
+    into v_total, v_cycle
+  from public.children c
+  where c.id = p_child_id
+  for update;
+
+  if not found then
+    return;
+  end if;
+
+  if v_cycle >= p_reward_threshold then
+    v_cycle := v_cycle - p_reward_threshold;
+    v_achieved := true;
+  end if;
+
+  update public.children
+  set total_points = v_total, cycle_points = v_cycle, updated_at = now()
+  where id = p_child_id;
+
+  return query select v_total, v_cycle, v_achieved;
+end;
+$$;
+
+-- 最新の LINE からの記録を取り消してポイントを戻す（ごほうび達成をまたいだ場合は周回ポイントも戻す）
+create or replace function public.undo_last_record(
+  p_child_id uuid,
+  p_reward_threshold integer
+)
+returns table (
+  record_id uuid,
+  action_name text,
+  points integer,
+  total_points integer,
+  cycle_points integer,
+  reward_reverted boolean
+)
+language plpgsql
+as $$
+declare
+  v_total integer;
+  v_cycle integer;
+  v_record public.records%rowtype;
+  v_reverted boolean := false;
+begin
+  -- 同じ子どもへの加算・取り消しを直列にする
+  select c.total_points, c.cycle_points
+    into v_total, v_cycle
+  from public.children c
+  where c.id = p_child_id
+  for update;
+
+  if not found then
+    return;
+  end if;
+
+  delete from public.records r
+  where r.id = (
+    select r2.id
+    from public.records r2
+    where r2.child_id = p_child_id
+      and r2.source = 'line'
+    order by r2.recorded_at desc, r2.id desc
+    limit 1
+  )
+  returning r.* into v_record;
+
+  if v_record.id is null then
+    return;
+  end if;
+
+  v_total := v_total - v_record.points;
+  v_cycle := v_cycle - v_record.points;
+  if v_cycle < 0 then
+    -- 加算時に閾値を引いていたので戻す
+    v_cycle := v_cycle + p_reward_threshold;
+    v_reverted := true;
+  end if;
+
+  update public.children
+  set total_points = v_total, cycle_points = v_cycle, updated_at = now()
+  where id = p_child_id;
+
+  return query
+  select v_record.id, a.name, v_record.points, v_total, v_cycle, v_reverted
+  from (select 1) as one
+  left join public.actions a on a.id = v_record.action_id;
+end;
+$$;
+
+revoke execute on function public.add_child_points(uuid, integer, integer) from public, anon, authenticated;
+revoke execute on function public.undo_last_record(uuid, integer) from public, anon, authenticated;
@@ -0,0 +1,7 @@
+-- LINEユーザーごとの「いつもの子ども」
+-- 名前を付けずに送った記録はこの子どもに付ける（未設定なら最初に登録した子ども）
+-- 子どもが削除されたら未設定に戻す
+
+alter table public.line_user_families
+  add column if not exists default_child_id uuid
+    references public.children (id) on delete set null;
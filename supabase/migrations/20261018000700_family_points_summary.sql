@@ -0,0 +1,42 @@
+-- 「みんなのポイント」用
+-- 家庭の子ども全員の 今日・周回・累計ポイントを1回の呼び出しで返す。
+-- 今日のポイントは子どもごとに (child_id, local_date) インデックスで集計するため、
+-- 子どもの数が増えても往復は1回のまま
+
+create index if not exists children_family_created_at_idx
+  on public.children (family_id, created_at);
+
+create or replace function public.family_points_summary(
+  p_family_id uuid,
+  p_local_date date
+)
+returns table (
+  child_id uuid,
+  name text,
+  nickname text,
+  today_points bigint,
+  cycle_points integer,
+  total_points integer
+)
+language sql
+stable
+as $$
+  select
+    c.id,
+    c.name,
+    c.nickname,
+    coalesce(t.points, 0),
+    c.cycle_points,
+    c.total_points
+  from public.children c
+  left join lateral (
+    select sum(r.points) as points
+    from public.records r
+    where r.child_id = c.id
+      and r.local_date = p_local_date
+  ) t on true
+  where c.family_id = p_family_id
+  order by c.created_at
+$$;
+
+revoke execute on function public.family_points_summary(uuid, date) from public, anon, authenticated;
@@ -0,0 +1,76 @@
+-- 共有URL（/view/[shareCode]）の表示データ
+-- 共有コードで家庭を引き、子ども（今日のポイント付き）・未達成の目標・最近の記録を
+-- 1回の呼び出しで JSON にまとめて返す。共有コードが見つからなければ null
+
+create index if not exists families_share_code_idx
+  on public.families (share_code);
+
+create or replace function public.share_view(
+  p_share_code text,
+  p_recent_limit integer default 10
+)
+returns jsonb
+language sql
+stable
+as $$
+  select jsonb_build_object(
+    'family_id', f.id,
+    'timezone', f.timezone,
+    'children', coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'id', c.id,
+        'name', c.name,
+        'nickname', c.nickname,
+        'total_points', c.total_points,
+        'cycle_points', c.cycle_points,
+        'today_points', coalesce((
+          select sum(r.points)
+          from public.records r
+          where r.child_id = c.id
+            and r.local_date = (now() at time zone f.timezone)::date
+        ), 0)
+      ) order by c.created_at)
+      from public.children c
+      where c.family_id = f.id
+    ), '[]'::jsonb),
+    'goals', coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'id', g.id,
+        'title', g.title,
+        'description', g.description,
+        'target_points', g.target_points
+      ) order by g.display_order)
+      from public.goals g
+      where g.family_id = f.id
+        and not g.is_achieved
+    ), '[]'::jsonb),
+    'recent_records', coalesce((
+      select jsonb_agg(jsonb_build_object(
+        'recorded_at', recent.recorded_at,
+        'child_id', recent.child_id,
+        'action_name', recent.action_name,
+        'points', recent.points
+      ) order by recent.recorded_at desc)
+      from (
+        -- 子どもごとに (child_id, recorded_at, id) インデックスを新しい順に読み、上位だけをまとめる
+        select r.recorded_at, r.child_id, a.name as action_name, r.points
+        from public.children c
+        cross join lateral (
+          select r2.recorded_at, r2.child_id, r2.action_id, r2.points
+          from public.records r2
+          where r2.child_id = c.id
+          order by r2.recorded_at desc, r2.id desc
+          limit p_recent_limit
+        ) r
+        left join public.actions a on a.id = r.action_id
+        where c.family_id = f.id
+        order by r.recorded_at desc
+        limit p_recent_limit
+      ) recent
+    ), '[]'::jsonb)
+  )
+  from public.families f
+  where f.share_code = p_share_code
+$$;
+
+revoke execute on function public.share_view(text, integer) from public, anon, authenticated;
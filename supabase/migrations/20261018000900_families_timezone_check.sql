@@ -0,0 +1,40 @@
+-- families.timezone を PostgreSQL が知っているタイムゾーン名に限る
+-- 不正な値（空文字・タイプミス）があると、記録の local_date を設定するトリガーや
+-- reminder_recipients / share_view の `at time zone f.timezone` が例外になり、
+-- その家庭の記録の追加（リマインドでは全家庭の配信）がすべて失敗する。
+-- Python 側（timezone_util.get_zone）と同じく、既存の不正な値は 'Asia/Tokyo' に直す
+
+-- タイムゾーン名として使えるか（CHECK 制約で使うため immutable とする）
+create or replace function public.is_valid_timezone(p_timezone text)
+returns boolean
+language plpgsql
+immutable
+as $$
+begin
+  if p_timezone is null or p_timezone = '' then
+    return false;
+  end if;
+  perform now() at time zone p_timezone;
+  return true;
+exception
+  when invalid_parameter_value then
+    return false;
+end;
+$$;
+
+update public.families
+set timezone = 'Asia/Tokyo'
+where not public.is_valid_timezone(timezone);
+
+alter table public.families
+  drop constraint if exists families_timezone_valid;
+alter table public.families
+  add constraint families_timezone_valid check (public.is_valid_timezone(timezone));
+
+-- local_date が空のまま残った記録があれば埋める
+update public.records r
+set local_date = (r.recorded_at at time zone f.timezone)::date
+from public.children c
+join public.families f on f.id = c.family_id
+where c.id = r.child_id
+  and r.local_date is null;
@@ -4,18 +4,38 @@ Google Sheets の代替として使用
 """
 import os
 import logging
-from datetime import datetime
-from supabase import create_client, Client
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+import httpx
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from supabase import create_client, Client, ClientOptions
+
+from config import Config
+from models import Family, LineUserLink, Child, ChildPoints, Action, Goal
+from resilience import get_policy, BackendUnavailableError
+from timezone_util import local_today
 
 logger = logging.getLogger(__name__)
 
 
+def _is_backend_failure(error: Exception) -> bool:
+    """通信エラー・タイムアウト・5xx をバックエンド障害とみなす"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, APIError):
+        # JSON以外の応答（ゲートウェイエラー等）は code にHTTPステータスが入る
+        return isinstance(error.code, int) and error.code >= 500
+    return False
+
+
 class SupabaseService:
     """Supabase操作クラス"""
 
     def __init__(self):
         """初期化: Supabaseクライアントを設定"""
         self.client: Client = None
+        self.policy = get_policy('supabase', _is_backend_failure)
         self._connect()
 
     def _connect(self):
@@ -27,35 +47,90 @@ class SupabaseService:
             if not url or not key:
                 raise ValueError("Supabase認証情報が設定されていません")
 
-            self.client = create_client(url, key)
+            self.client = create_client(
+                url, key,
+                options=ClientOptions(postgrest_client_timeout=Config.BACKEND_TIMEOUT)
+            )
             logger.info("Supabaseに接続しました")
         except Exception as e:
-            logger.error(f"Supabase接続エラー: {e}")
+            logger.error("Supabase接続エラー: %s", e)
             raise
 
-    def get_family_by_line_user(self, line_user_id: str) -> dict:
+    def _execute(self, query, idempotent: bool = True):
         """
-        LINEユーザーIDから家庭情報を取得
+        タイムアウト・リトライ・ブレーカーを適用してクエリを実行
+
+        Args:
+            query: PostgRESTのリクエストビルダー
+            idempotent: 再送しても安全ならTrue
+
+        Returns:
+            実行結果
+        """
+        return self.policy.call(query.execute, idempotent=idempotent)
+
+    def get_line_user_link(self, line_user_id: str) -> LineUserLink:
+        """
+        LINEユーザーIDから紐付け（家庭情報・いつもの子ども）を取得
 
         Args:
             line_user_id: LINEユーザーID
 
         Returns:
-            家庭情報 or None
+            LineUserLink or None
         """
         try:
             # line_user_familiesテーブルから検索
-            result = self.client.table('line_user_families').select(
-                'family_id, families(*)'
-            ).eq('line_user_id', line_user_id).execute()
+            result = self._execute(self.client.table('line_user_families').select(
+                f'family_id, default_child_id, families({Family.COLUMNS})'
+            ).eq('line_user_id', line_user_id))
 
-            if result.data and len(result.data) > 0:
-                return result.data[0].get('families')
+            if result.data and result.data[0].get('families'):
+                row = result.data[0]
+                return LineUserLink(Family.from_row(row['families']), row.get('default_child_id'))
             return None
+        except BackendUnavailableError:
+            # 未紐付けと区別できるよう呼び出し元に伝える
+            raise
         except Exception as e:
-            logger.error(f"家庭取得エラー: {e}")
+            logger.error("家庭取得エラー: %s", e)
             return None
 
+    def get_family_by_line_user(self, line_user_id: str) -> Family:
+        """
+        LINEユーザーIDから家庭情報を取得
+
+        Args:
+            line_user_id: LINEユーザーID
+
+        Returns:
+            家庭情報 or None
+        """
+        link = self.get_line_user_link(line_user_id)
+        return link.family if link else None
+
+    def set_default_child(self, line_user_id: str, child_id: str) -> bool:
+        """
+        LINEユーザーの「いつもの子ども」を設定
+
+        Args:
+            line_user_id: LINEユーザーID
+            child_id: 子どもID
+
+        Returns:
+            成功時True
+        """
+        try:
+            result = self._execute(self.client.table('line_user_families').update({
+                'default_child_id': child_id
+            }).eq('line_user_id', line_user_id))
+
+            logger.info("いつもの子ども設定: %s -> %s", line_user_id, child_id)
+            return bool(result.data)
+        except Exception as e:
+            logger.error("いつもの子ども設定エラー: %s", e)
+            return False
+
     def link_line_user_to_family(self, line_user_id: str, family_share_code: str) -> bool:
         """
         LINEユーザーを家庭に紐付け
@@ -69,48 +144,170 @@ class SupabaseService:
         """
         try:
             # 共有コードから家庭を検索
-            family_result = self.client.table('families').select('id').eq(
+            family_result = self._execute(self.client.table('families').select('id').eq(
                 'share_code', family_share_code
-            ).execute()
+            ))
 
             if not family_result.data or len(family_result.data) == 0:
-                logger.warning(f"共有コードが見つかりません: {family_share_code}")
+                logger.warning("共有コードが見つかりません: %s", family_share_code)
                 return False
 
             family_id = family_result.data[0]['id']
 
             # 紐付けを作成
-            self.client.table('line_user_families').upsert({
+            self._execute(self.client.table('line_user_families').upsert({
                 'line_user_id': line_user_id,
                 'family_id': family_id
-            }).execute()
+            }))
+
+            logger.info("LINEユーザー紐付け完了: %s -> %s", line_user_id, family_id)
+            return True
+        except Exception as e:
+            logger.error("LINEユーザー紐付けエラー: %s", e)
+            return False
+
+    def get_line_user_ids(self, family_id: str) -> list:
+        """
+        家庭に紐付いたLINEユーザーIDを取得
+
+        Args:
+            family_id: 家庭ID
+
+        Returns:
+            LINEユーザーIDのリスト
+        """
+        try:
+            result = self._execute(self.client.table('line_user_families').select(
+                'line_user_id'
+            ).eq('family_id', family_id))
+
+            return [row['line_user_id'] for row in result.data or []]
+        except Exception as e:
+            logger.error("LINEユーザー取得エラー: %s", e)
+            return []
+
+    def get_reminder_recipients(self, after: str = None, limit: int = 5000, timezone: str = None) -> list:
+        """
+        今日まだ記録がない子どもがいる家庭のLINEユーザーIDを取得（reminder_recipients 関数）
+
+        Args:
+            after: このLINEユーザーIDより後から取得（キーセットページング）
+            limit: 1ページの件数
+            timezone: 対象の家庭のタイムゾーン（省略時は全家庭）
+
+        Returns:
+            LINEユーザーIDのリスト or None
+        """
+        try:
+            result = self._execute(self.client.rpc('reminder_recipients', {
+                'p_after': after,
+                'p_limit': limit,
+                'p_timezone': timezone
+            }))
+            return [row['line_user_id'] for row in result.data or []]
+        except Exception as e:
+            logger.error("リマインド対象取得エラー: %s", e)
+            return None
+
+    def get_job_checkpoint(self, job_name: str, run_key: str) -> dict:
+        """
+        定期ジョブの進捗を取得
+
+        Args:
+            job_name: ジョブ名
+            run_key: 実行単位のキー（例: 日付）
+
+        Returns:
+            {'cursor': str, 'processed': int, 'completed': bool} or None（未実行）
+        """
+        try:
+            result = self._execute(self.client.table('job_checkpoints').select(
+                'cursor, processed, completed'
+            ).eq('job_name', job_name).eq('run_key', run_key))
+
+            return result.data[0] if result.data else None
+        except Exception as e:
+            logger.error("ジョブ進捗取得エラー: %s", e)
+            return None
+
+    def save_job_checkpoint(self, job_name: str, run_key: str, cursor: str,
+                            processed: int, completed: bool = False) -> bool:
+        """
+        定期ジョブの進捗を保存
+
+        Args:
+            job_name: ジョブ名
+            run_key: 実行単位のキー
+            cursor: 処理済みの最後のキー
+            processed: 処理済み件数
+            completed: 完了した場合True
 
-            logger.info(f"LINEユーザー紐付け完了: {line_user_id} -> {family_id}")
+        Returns:
+            成功時True
+        """
+        try:
+            self._execute(self.client.table('job_checkpoints').upsert({
+                'job_name': job_name,
+                'run_key': run_key,
+                'cursor': cursor,
+                'processed': processed,
+                'completed': completed,
+                'updated_at': datetime.now(dt_timezone.utc).isoformat()
+            }, returning=ReturnMethod.minimal))
             return True
         except Exception as e:
-            logger.error(f"LINEユーザー紐付けエラー: {e}")
+            logger.error("ジョブ進捗保存エラー: %s", e)
             return False
 
-    def get_actions(self, family_id: str) -> list:
+    def get_actions(self, family_id: str, include_inactive: bool = False) -> list:
         """
         家庭の有効な行動マスタを取得
 
         Args:
             family_id: 家庭ID
+            include_inactive: 無効な行動も含める場合True
 
         Returns:
-            行動リスト [{'name': str, 'points': int}, ...]
+            行動リスト [Action, ...]
         """
         try:
-            result = self.client.table('actions').select('*').eq(
-                'family_id', family_id
-            ).eq('is_active', True).order('display_order').execute()
+            query = self.client.table('actions').select(Action.COLUMNS).eq('family_id', family_id)
+            if not include_inactive:
+                query = query.eq('is_active', True)
+            result = self._execute(query.order('display_order'))
 
-            return result.data or []
+            return [Action.from_row(row) for row in result.data or []]
         except Exception as e:
-            logger.error(f"行動マスタ取得エラー: {e}")
+            logger.error("行動マスタ取得エラー: %s", e)
             return []
 
+    def create_action(self, family_id: str, name: str, points: int, is_active: bool = True) -> Action:
+        """
+        行動マスタを追加
+
+        Args:
+            family_id: 家庭ID
+            name: 行動名
+            points: ポイント
+            is_active: 有効/無効
+
+        Returns:
+            追加した行動 or None
+        """
+        try:
+            result = self._execute(self.client.table('actions').insert({
+                'family_id': family_id,
+                'name': name,
+                'points': points,
+                'is_active': is_active
+            }), idempotent=False)
+
+            logger.info("行動追加: %s (%spt) family=%s", name, points, family_id)
+            return Action.from_row(result.data[0]) if result.data else None
+        except Exception as e:
+            logger.error("行動追加エラー: %s", e)
+            return None
+
     def get_children(self, family_id: str) -> list:
         """
         家庭の子どもリストを取得
@@ -119,19 +316,19 @@ class SupabaseService:
             family_id: 家庭ID
 
         Returns:
-            子どもリスト
+            子どもリスト [Child, ...]
         """
         try:
-            result = self.client.table('children').select('*').eq(
+            result = self._execute(self.client.table('children').select(Child.COLUMNS).eq(
                 'family_id', family_id
-            ).order('created_at').execute()
+            ).order('created_at'))
 
-            return result.data or []
+            return [Child.from_row(row) for row in result.data or []]
         except Exception as e:
-            logger.error(f"子ども取得エラー: {e}")
+            logger.error("子ども取得エラー: %s", e)
             return []
 
-    def get_child(self, child_id: str) -> dict:
+    def get_child(self, child_id: str) -> Child:
         """
         子ども情報を取得
 
@@ -142,13 +339,13 @@ class SupabaseService:
             子ども情報 or None
         """
         try:
-            result = self.client.table('children').select('*').eq(
+            result = self._execute(self.client.table('children').select(Child.COLUMNS).eq(
                 'id', child_id
-            ).single().execute()
+            ).single())
 
-            return result.data
+            return Child.from_row(result.data) if result.data else None
         except Exception as e:
-            logger.error(f"子ども取得エラー: {e}")
+            logger.error("子ども取得エラー: %s", e)
             return None
 
     def add_record(self, child_id: str, action_id: str, points: int) -> bool:
@@ -164,22 +361,240 @@ class SupabaseService:
             成功時True
         """
         try:
-            self.client.table('records').insert({
+            self._execute(self.client.table('records').insert({
                 'child_id': child_id,
                 'action_id': action_id,
                 'points': points,
                 'source': 'line'
-            }).execute()
+            }), idempotent=False)
+
+            logger.info("記録追加: action=%s, points=%s, child=%s", action_id, points, child_id,
+                        extra={'event': 'record_added'})
+            return True
+        except Exception as e:
+            logger.error("記録追加エラー: %s", e)
+            return False
+
+    def add_records_bulk(self, records: list) -> bool:
+        """
+        行動記録をまとめて追加（1回のリクエストで挿入）
+
+        全件に id が指定されている場合は既存の id を無視する upsert になり、
+        同じバッチを再送しても重複しない
+
+        Args:
+            records: [{'child_id': str, 'action_id': str, 'points': int, ...}, ...]
+
+        Returns:
+            成功時True
+        """
+        if not records:
+            return True
+
+        try:
+            if all('id' in record for record in records):
+                query = self.client.table('records').upsert(
+                    records,
+                    on_conflict='id',
+                    ignore_duplicates=True,
+                    returning=ReturnMethod.minimal
+                )
+                self._execute(query)
+            else:
+                query = self.client.table('records').insert(records, returning=ReturnMethod.minimal)
+                self._execute(query, idempotent=False)
+
+            logger.info("記録一括追加: %s件", len(records))
+            return True
+        except Exception as e:
+            logger.error("記録一括追加エラー: %s", e)
+            return False
+
+    def sum_record_points(self, child_id: str, page_size: int = 1000) -> int:
+        """
+        子どもの全記録のポイント合計を取得（id順のキーセットページングで集計）
+
+        Args:
+            child_id: 子どもID
+            page_size: 1ページの件数
+
+        Returns:
+            ポイント合計 or None
+        """
+        try:
+            total = 0
+            last_id = None
+            while True:
+                query = self.client.table('records').select('id, points').eq('child_id', child_id)
+                if last_id is not None:
+                    query = query.gt('id', last_id)
+                result = self._execute(query.order('id').limit(page_size))
+
+                rows = result.data or []
+                total += sum(row['points'] for row in rows)
+                if len(rows) < page_size:
+                    return total
+                last_id = rows[-1]['id']
+        except Exception as e:
+            logger.error("ポイント集計エラー: %s", e)
+            return None
+
+    def set_child_points(self, child_id: str, total_points: int, cycle_points: int) -> bool:
+        """
+        子どものポイントを指定値で上書き
+
+        Args:
+            child_id: 子どもID
+            total_points: 累計ポイント
+            cycle_points: 周回ポイント
 
-            logger.info(f"記録追加: action={action_id}, points={points}, child={child_id}")
+        Returns:
+            成功時True
+        """
+        try:
+            self._execute(self.client.table('children').update({
+                'total_points': total_points,
+                'cycle_points': cycle_points
+            }).eq('id', child_id))
+
+            logger.info("ポイント設定: %s - total=%s, cycle=%s", child_id, total_points, cycle_points)
             return True
         except Exception as e:
-            logger.error(f"記録追加エラー: {e}")
+            logger.error("ポイント設定エラー: %s", e)
+            return False
+
+    def get_child_record_totals(self, after: str = None, limit: int = 500, family_id: str = None) -> list:
+        """
+        子どもごとの records 合計をサーバー側で集計して取得（child_record_totals 関数）
+
+        Args:
+            after: この子どもIDより後から取得（キーセットページング）
+            limit: 1ページの子どもの数
+            family_id: 家庭ID（省略時は全家庭）
+
+        Returns:
+            [{'child_id', 'family_id', 'total_points', 'cycle_points', 'record_points'}, ...] or None
+        """
+        try:
+            result = self._execute(self.client.rpc('child_record_totals', {
+                'p_after': after,
+                'p_limit': limit,
+                'p_family_id': family_id
+            }))
+            return result.data or []
+        except Exception as e:
+            logger.error("ポイント集計エラー: %s", e)
+            return None
+
+    def get_family_records_page(self, family_id: str, after: tuple = None, limit: int = 1000) -> list:
+        """
+        家庭の記録を (recorded_at, id) 順に1ページ取得（family_records_page 関数）
+
+        Args:
+            family_id: 家庭ID
+            after: この (recorded_at, id) より後から取得（キーセットページング）
+            limit: 1ページの件数
+
+        Returns:
+            [{'id', 'recorded_at', 'local_date', 'child_id', 'child_name', 'action_name', 'points', 'source'}, ...]
+            or None
+        """
+        after_recorded_at, after_id = after or (None, None)
+        try:
+            result = self._execute(self.client.rpc('family_records_page', {
+                'p_family_id': family_id,
+                'p_after_recorded_at': after_recorded_at,
+                'p_after_id': after_id,
+                'p_limit': limit
+            }))
+            return result.data or []
+        except Exception as e:
+            logger.error("記録エクスポート取得エラー: %s", e)
+            return None
+
+    def get_children_page(self, after: str = None, limit: int = 500, family_id: str = None) -> list:
+        """
+        子どもを id 順にキーセットページングで取得（ポイント列のみ）
+
+        Args:
+            after: この子どもIDより後から取得
+            limit: 1ページの件数
+            family_id: 家庭ID（省略時は全家庭）
+
+        Returns:
+            [{'id', 'family_id', 'total_points', 'cycle_points'}, ...] or None
+        """
+        try:
+            query = self.client.table('children').select('id, family_id, total_points, cycle_points')
+            if after is not None:
+                query = query.gt('id', after)
+            if family_id is not None:
+                query = query.eq('family_id', family_id)
+            result = self._execute(query.order('id').limit(limit))
+            return result.data or []
+        except Exception as e:
+            logger.error("子ども取得エラー: %s", e)
+            return None
+
+    def get_record_totals(self, child_ids: list, page_size: int = 1000) -> dict:
+        """
+        複数の子どもの records 合計をまとめて集計（id順のキーセットページング）
+
+        Args:
+            child_ids: 子どもIDのリスト
+            page_size: 1ページの件数
+
+        Returns:
+            {child_id: ポイント合計, ...} or None
+        """
+        try:
+            totals = Counter({child_id: 0 for child_id in child_ids})
+            last_id = None
+            while True:
+                query = self.client.table('records').select('id, child_id, points').in_('child_id', child_ids)
+                if last_id is not None:
+                    query = query.gt('id', last_id)
+                result = self._execute(query.order('id').limit(page_size))
+
+                rows = result.data or []
+                for row in rows:
+                    totals[row['child_id']] += row['points']
+                if len(rows) < page_size:
+                    return dict(totals)
+                last_id = rows[-1]['id']
+        except Exception as e:
+            logger.error("ポイント集計エラー: %s", e)
+            return None
+
+    def correct_child_points(self, child_id: str, expected_total: int, expected_cycle: int,
+                             total_points: int, cycle_points: int) -> bool:
+        """
+        子どものポイントを補正（読み取り時から変わっていない場合のみ更新）
+
+        Args:
+            child_id: 子どもID
+            expected_total: 読み取り時の累計ポイント
+            expected_cycle: 読み取り時の周回ポイント
+            total_points: 補正後の累計ポイント
+            cycle_points: 補正後の周回ポイント
+
+        Returns:
+            更新した場合True（同時に更新されていた場合・エラー時はFalse）
+        """
+        try:
+            result = self._execute(self.client.table('children').update({
+                'total_points': total_points,
+                'cycle_points': cycle_points
+            }).eq('id', child_id).eq('total_points', expected_total).eq('cycle_points', expected_cycle))
+
+            return bool(result.data)
+        except Exception as e:
+            logger.error("ポイント補正エラー: %s", e)
             return False
 
     def update_child_points(self, child_id: str, points_to_add: int, reward_threshold: int = 100) -> dict:
         """
-        子どものポイントを更新
+        子どものポイントを更新（add_child_points 関数で行をロックして加算）
 
         Args:
             child_id: 子どもID
@@ -190,77 +605,98 @@ class SupabaseService:
             更新後の情報 {'total_points': int, 'cycle_points': int, 'reward_achieved': bool}
         """
         try:
-            # 現在のポイントを取得
-            child = self.get_child(child_id)
-            if not child:
+            # 読み取りと更新の間に取り消し等が入ってもずれないよう、サーバー側で加算する
+            result = self._execute(self.client.rpc('add_child_points', {
+                'p_child_id': child_id,
+                'p_points': points_to_add,
+                'p_reward_threshold': reward_threshold
+            }), idempotent=False)
+            if not result.data:
                 return None
 
-            new_total = child['total_points'] + points_to_add
-            new_cycle = child['cycle_points'] + points_to_add
-            reward_achieved = False
-
-            # ごほうび達成チェック
-            if new_cycle >= reward_threshold:
-                reward_achieved = True
-                new_cycle -= reward_threshold
-
-            # 更新
-            self.client.table('children').update({
-                'total_points': new_total,
-                'cycle_points': new_cycle
-            }).eq('id', child_id).execute()
-
-            logger.info(f"ポイント更新: {child_id} - total={new_total}, cycle={new_cycle}")
+            updated = result.data[0]
+            logger.info("ポイント更新: %s - total=%s, cycle=%s", child_id,
+                        updated['total_points'], updated['cycle_points'], extra={'event': 'points_updated'})
 
             return {
-                'total_points': new_total,
-                'cycle_points': new_cycle,
-                'reward_achieved': reward_achieved
+                'total_points': updated['total_points'],
+                'cycle_points': updated['cycle_points'],
+                'reward_achieved': updated['reward_achieved']
             }
         except Exception as e:
-            logger.error(f"ポイント更新エラー: {e}")
+            logger.error("ポイント更新エラー: %s", e)
             return None
 
-    def get_today_records(self, child_id: str) -> list:
+    def undo_last_record(self, child_id: str, reward_threshold: int = 100) -> dict:
         """
-        今日の記録を取得
+        子どもの最新のLINEからの記録を取り消してポイントを戻す（undo_last_record 関数）
 
         Args:
             child_id: 子どもID
+            reward_threshold: ごほうび閾値
 
         Returns:
-            今日の記録リスト
+            {'action_name': str, 'points': int, 'total_points': int, 'cycle_points': int,
+             'reward_reverted': bool}
+            取り消す記録がない場合は {}、エラー時は None
         """
         try:
-            today = datetime.now().strftime('%Y-%m-%d')
+            # 再送すると2件目を取り消してしまうためリトライしない
+            result = self._execute(self.client.rpc('undo_last_record', {
+                'p_child_id': child_id,
+                'p_reward_threshold': reward_threshold
+            }), idempotent=False)
+            if not result.data:
+                return {}
+
+            undone = result.data[0]
+            logger.info("記録取り消し: %s (%spt) child=%s", undone['record_id'], undone['points'], child_id)
+            return undone
+        except Exception as e:
+            logger.error("記録取り消しエラー: %s", e)
+            return None
 
-            result = self.client.table('records').select(
-                '*, actions(name, points)'
-            ).eq('child_id', child_id).gte(
-                'recorded_at', f'{today}T00:00:00'
-            ).lte(
-                'recorded_at', f'{today}T23:59:59'
-            ).execute()
+    def get_today_records(self, child_id: str, timezone: str = None) -> list:
+        """
+        今日の記録を取得（家庭のタイムゾーンでの今日）
+
+        Args:
+            child_id: 子どもID
+            timezone: 家庭のタイムゾーン（families.timezone）
+
+        Returns:
+            今日の記録リスト（エラー時は None）
+        """
+        try:
+            # (child_id, local_date) インデックスの完全一致で引く
+            result = self._execute(self.client.table('records').select(
+                'points, actions(name)'
+            ).eq('child_id', child_id).eq('local_date', local_today(timezone)))
 
             return result.data or []
         except Exception as e:
-            logger.error(f"今日の記録取得エラー: {e}")
-            return []
+            logger.error("今日の記録取得エラー: %s", e)
+            return None
 
-    def get_today_summary(self, child_id: str) -> dict:
+    def get_today_summary(self, child_id: str, timezone: str = None) -> dict:
         """
         今日の記録サマリーを取得
 
         Args:
             child_id: 子どもID
+            timezone: 家庭のタイムゾーン（families.timezone）
 
         Returns:
             {
                 'total_points': int,
                 'actions': {'行動名': 回数, ...}
             }
+            エラー時は None（記録なしと区別するため）
         """
-        records = self.get_today_records(child_id)
+        records = self.get_today_records(child_id, timezone)
+        if records is None:
+            return None
+
         total_points = 0
         action_counts = {}
 
@@ -275,6 +711,49 @@ class SupabaseService:
             'actions': action_counts
         }
 
+    def get_family_points(self, family_id: str, timezone: str = None) -> list:
+        """
+        家庭の子ども全員の 今日・周回・累計ポイントを1回で取得（family_points_summary 関数）
+
+        Args:
+            family_id: 家庭ID
+            timezone: 家庭のタイムゾーン（families.timezone）
+
+        Returns:
+            [ChildPoints, ...]（登録順） or None
+        """
+        try:
+            result = self._execute(self.client.rpc('family_points_summary', {
+                'p_family_id': family_id,
+                'p_local_date': local_today(timezone)
+            }))
+            return [ChildPoints.from_row(row) for row in result.data or []]
+        except Exception as e:
+            logger.error("家庭のポイント取得エラー: %s", e)
+            return None
+
+    def get_share_view(self, share_code: str, recent_limit: int = 10) -> dict:
+        """
+        共有URLの表示データを1回で取得（share_view 関数）
+
+        Args:
+            share_code: 家庭の共有コード
+            recent_limit: 最近の記録の件数
+
+        Returns:
+            {'family_id', 'timezone', 'children', 'goals', 'recent_records'}
+            共有コードが見つからない場合は {}、エラー時は None
+        """
+        try:
+            result = self._execute(self.client.rpc('share_view', {
+                'p_share_code': share_code,
+                'p_recent_limit': recent_limit
+            }))
+            return result.data or {}
+        except Exception as e:
+            logger.error("共有ビュー取得エラー: %s", e)
+            return None
+
     def get_goals(self, family_id: str) -> list:
         """
         家庭の目標リストを取得
@@ -283,14 +762,14 @@ class SupabaseService:
             family_id: 家庭ID
 
         Returns:
-            目標リスト
+            目標リスト [Goal, ...]（エラー時は None）
         """
         try:
-            result = self.client.table('goals').select('*').eq(
+            result = self._execute(self.client.table('goals').select(Goal.COLUMNS).eq(
                 'family_id', family_id
-            ).eq('is_achieved', False).order('display_order').execute()
+            ).eq('is_achieved', False).order('display_order'))
 
-            return result.data or []
+            return [Goal.from_row(row) for row in result.data or []]
         except Exception as e:
-            logger.error(f"目標取得エラー: {e}")
-            return []
+            logger.error("目標取得エラー: %s", e)
+            return None
@@ -0,0 +1,51 @@
+"""
+家庭のタイムゾーンでの日付計算を担当するモジュール
+"""
+from datetime import datetime, timedelta, time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import Config
+
+
+def get_zone(timezone: str = None) -> ZoneInfo:
+    """
+    タイムゾーン名から ZoneInfo を取得（未設定・不正な場合はデフォルト）
+
+    Args:
+        timezone: IANAタイムゾーン名（例: 'Asia/Tokyo'）
+
+    Returns:
+        ZoneInfo
+    """
+    try:
+        return ZoneInfo(timezone or Config.DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(Config.DEFAULT_TIMEZONE)
+
+
+def local_today(timezone: str = None) -> str:
+    """
+    家庭のタイムゾーンでの今日の日付
+
+    Args:
+        timezone: IANAタイムゾーン名
+
+    Returns:
+        'YYYY-MM-DD'
+    """
+    return datetime.now(get_zone(timezone)).date().isoformat()
+
+
+def next_local_midnight(timezone: str = None) -> float:
+    """
+    家庭のタイムゾーンで次に日付が変わる時刻
+
+    Args:
+        timezone: IANAタイムゾーン名
+
+    Returns:
+        UNIX時刻（秒）
+    """
+    zone = get_zone(timezone)
+    tomorrow = datetime.now(zone).date() + timedelta(days=1)
+    return datetime.combine(tomorrow, time.min, tzinfo=zone).timestamp()
@@ -13,18 +13,21 @@ export interface Database {
         Row: {
           id: string
           share_code: string
+          timezone: string
           created_at: string
           updated_at: string
         }
         Insert: {
           id?: string
           share_code: string
+          timezone?: string
           created_at?: string
           updated_at?: string
         }
         Update: {
           id?: string
           share_code?: string
+          timezone?: string
           created_at?: string
           updated_at?: string
         }
@@ -103,6 +106,7 @@ export interface Database {
           action_id: string
           points: number
           recorded_at: string
+          local_date: string | null
           source: string
           created_at: string
         }
@@ -112,6 +116,7 @@ export interface Database {
           action_id: string
           points: number
           recorded_at?: string
+          local_date?: string | null
           source?: string
           created_at?: string
         }
@@ -121,6 +126,7 @@ export interface Database {
           action_id?: string
           points?: number
           recorded_at?: string
+          local_date?: string | null
           source?: string
           created_at?: string
         }